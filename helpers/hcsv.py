@@ -5,31 +5,200 @@ import helpers.hcsv as hcsv
 """
 
 import ast
+import collections
+import io
 import logging
 import os
-from typing import Any, Callable, Dict, List, Optional
+import tempfile
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 
 import helpers.hdbg as hdbg
 import helpers.hio as hio
+import helpers.hjoblib as hjoblib
 import helpers.hs3 as hs3
 
 _LOG = logging.getLogger(__name__)
 
 
-def _append_csv(
-    df: pd.DataFrame, path: str, *, index: bool = False, **kwargs: Any
-) -> None:
+# #############################################################################
+# CSV offset index
+# #############################################################################
+
+
+# The sidecar index of `foobar.csv` is stored in `foobar.csv.offsets.npz`.
+_OFFSET_INDEX_SUFFIX = ".offsets.npz"
+
+
+def get_csv_offset_index_path(csv_path: str) -> str:
+    """
+    Return the path of the sidecar offset index of a CSV file.
+    """
+    return csv_path + _OFFSET_INDEX_SUFFIX
+
+
+def build_csv_offset_index(
+    csv_path: str,
+    *,
+    sample_every: int = 1000,
+    block_size_in_bytes: int = 64 * 1024**2,
+) -> Dict[str, Any]:
+    """
+    Build the byte-offset index of the lines of a CSV file and save it.
+
+    The index stores the byte offset of the start of every `sample_every`-th
+    line, where line 0 is the header, so that a range of rows can be read
+    seeking close to its start instead of parsing the file from the
+    beginning. The file is scanned once in blocks.
+
+    The index assumes that each row is on a single line, i.e., there are no
+    quoted fields with newlines.
+
+    :param csv_path: path to an uncompressed local CSV file
+    :param sample_every: store the offset of one line out of this many
+    :param block_size_in_bytes: size of the blocks read at a time
+    :return: the index, i.e., a dict storing:
+        - `offsets`: byte offsets of lines `0, sample_every, 2 * sample_every`
+        - `sample_every`
+        - `num_lines`: number of lines including the header
+        - `file_size`, `mtime`: used to detect that the index is stale
+    """
+    hdbg.dassert_file_exists(csv_path)
+    hdbg.dassert_lte(1, sample_every)
+    # Line 0 starts at the beginning of the file and line `i` starts after the
+    # `i`-th newline.
+    offsets = [np.array([0], dtype=np.int64)]
+    num_newlines = 0
+    file_size = 0
+    last_byte = b""
+    with open(csv_path, "rb") as f:
+        while True:
+            block = f.read(block_size_in_bytes)
+            if not block:
+                break
+            line_starts = (
+                np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10)
+                + file_size
+                + 1
+            )
+            line_idxs = num_newlines + 1 + np.arange(line_starts.size)
+            offsets.append(line_starts[line_idxs % sample_every == 0])
+            num_newlines += line_starts.size
+            file_size += len(block)
+            last_byte = block[-1:]
+    offsets_as_arr = np.concatenate(offsets)
+    # A newline at the end of the file doesn't start a new line.
+    offsets_as_arr = offsets_as_arr[offsets_as_arr < file_size]
+    num_lines = num_newlines
+    if file_size > 0 and last_byte != b"\n":
+        num_lines += 1
+    offset_index = {
+        "offsets": offsets_as_arr,
+        "sample_every": sample_every,
+        "num_lines": num_lines,
+        "file_size": file_size,
+        "mtime": os.path.getmtime(csv_path),
+    }
+    np.savez(get_csv_offset_index_path(csv_path), **offset_index)
+    return offset_index
+
+
+def load_csv_offset_index(csv_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Load the offset index of a CSV file, if it exists and is up to date.
+
+    :return: the index (see `build_csv_offset_index()`) or `None`
+    """
+    offset_index_path = get_csv_offset_index_path(csv_path)
+    if not os.path.exists(offset_index_path):
+        return None
+    with np.load(offset_index_path) as data:
+        offset_index = {
+            "offsets": data["offsets"],
+            "sample_every": int(data["sample_every"]),
+            "num_lines": int(data["num_lines"]),
+            "file_size": int(data["file_size"]),
+            "mtime": float(data["mtime"]),
+        }
+    # Check that the CSV file didn't change after building the index.
+    is_stale = offset_index["file_size"] != os.path.getsize(
+        csv_path
+    ) or offset_index["mtime"] != os.path.getmtime(csv_path)
+    if is_stale:
+        _LOG.warning("Offset index of '%s' is stale", csv_path)
+        return None
+    return offset_index
+
+
+def get_csv_offset_index(
+    csv_path: str, *, sample_every: int = 1000
+) -> Dict[str, Any]:
+    """
+    Load the offset index of a CSV file, building it if needed.
+
+    See `build_csv_offset_index()` for the params.
+    """
+    offset_index = load_csv_offset_index(csv_path)
+    if offset_index is None:
+        offset_index = build_csv_offset_index(
+            csv_path, sample_every=sample_every
+        )
+    return offset_index
+
+
+def _read_csv_range_with_offset_index(
+    csv_path: str,
+    from_: int,
+    to: int,
+    offset_index: Dict[str, Any],
+    **kwargs: Any,
+) -> pd.DataFrame:
     """
-    Append a df to the CSV file `path` without header.
+    Read the rows [from_, to) of a CSV file seeking to their byte offset.
+
+    See `_read_csv_range()` for the params.
     """
-    with open(path, "a") as f:
-        df.to_csv(f, header=False, index=index, **kwargs)
+    offsets = offset_index["offsets"]
+    sample_every = offset_index["sample_every"]
+    # Find the sampled lines around the range.
+    start_idx = from_ // sample_every
+    end_idx = -(-to // sample_every)
+    with open(csv_path, "rb") as f:
+        header = f.readline()
+        if start_idx >= offsets.size:
+            # The range is past the end of the file.
+            data = b""
+        else:
+            f.seek(offsets[start_idx])
+            if end_idx < offsets.size:
+                data = f.read(offsets[end_idx] - offsets[start_idx])
+            else:
+                data = f.read()
+    # Skip the lines between the sampled line and the start of the range.
+    num_lines_to_skip = from_ - start_idx * sample_every
+    skiprows = range(1, num_lines_to_skip + 1)
+    nrows = to - from_
+    df = pd.read_csv(
+        io.BytesIO(header + data), skiprows=skiprows, nrows=nrows, **kwargs
+    )
+    return df
+
+
+# #############################################################################
 
 
 def _read_csv_range(
-    csv_path: str, from_: int, to: int, **kwargs: Any
+    csv_path: str,
+    from_: int,
+    to: int,
+    *,
+    offset_index: Optional[Dict[str, Any]] = None,
+    **kwargs: Any,
 ) -> pd.DataFrame:
     """
     Read a specified row range of a CSV file and convert to a DataFrame.
@@ -41,15 +210,25 @@ def _read_csv_range(
     :param csv_path: location of CSV file
     :param from_: first line to read (header is row 0 and is always read)
     :param to: last line to read, not inclusive
+    :param offset_index: offset index of the file (see
+        `build_csv_offset_index()`) to seek to the range instead of parsing the
+        file from the beginning
     :return: DataFrame with columns from CSV line 0 (header)
     """
     hdbg.dassert_lt(0, from_, msg="Row 0 assumed to be header row")
     hdbg.dassert_lt(from_, to, msg="Empty range requested!")
-    skiprows = range(1, from_)
     nrows = to - from_
-    df = pd.read_csv(csv_path, skiprows=skiprows, nrows=nrows, **kwargs)
-    if df.shape[0] < to:
-        _LOG.warning("Number of df rows = %i vs requested = %i", df.shape[0], to)
+    if offset_index is None:
+        skiprows = range(1, from_)
+        df = pd.read_csv(csv_path, skiprows=skiprows, nrows=nrows, **kwargs)
+    else:
+        df = _read_csv_range_with_offset_index(
+            csv_path, from_, to, offset_index, **kwargs
+        )
+    if df.shape[0] < nrows:
+        _LOG.warning(
+            "Number of df rows = %i vs requested = %i", df.shape[0], nrows
+        )
     return df
 
 
@@ -60,6 +239,7 @@ def build_chunk(
     start: int,
     *,
     nrows_at_a_time: int = 1000,
+    use_offset_index: bool = False,
     **kwargs: Any,
 ) -> pd.DataFrame:
     """
@@ -77,12 +257,17 @@ def build_chunk(
     :param col_name: name of column whose values define chunks
     :param start: first row to process
     :param nrows_at_a_time: size of chunks to process
+    :param use_offset_index: read the chunks seeking through the offset index
+        of the file, building it if needed (see `get_csv_offset_index()`)
     :return: DataFrame with columns from CSV line 0
     """
     hdbg.dassert_lt(0, start)
+    offset_index = get_csv_offset_index(csv_path) if use_offset_index else None
     stop = False
     dfs: List[pd.DataFrame] = []
-    init_df = _read_csv_range(csv_path, start, start + 1, **kwargs)
+    init_df = _read_csv_range(
+        csv_path, start, start + 1, offset_index=offset_index, **kwargs
+    )
     if init_df.shape[0] < 1:
         return init_df
     val = init_df[col_name].iloc[0]
@@ -90,7 +275,13 @@ def build_chunk(
     counter = 0
     while not stop:
         from_ = start + counter * nrows_at_a_time
-        df = _read_csv_range(csv_path, from_, from_ + nrows_at_a_time)
+        df = _read_csv_range(
+            csv_path,
+            from_,
+            from_ + nrows_at_a_time,
+            offset_index=offset_index,
+            **kwargs,
+        )
         # Break if there are no matches.
         if df.shape[0] == 0:
             break
@@ -118,6 +309,7 @@ def find_first_matching_row(
     *,
     start: int = 1,
     nrows_at_a_time: int = 1000000,
+    use_offset_index: bool = False,
     **kwargs: Any,
 ) -> Optional[int]:
     """
@@ -128,12 +320,21 @@ def find_first_matching_row(
     :param val: value to match on
     :param start: first row (inclusive) to start search on
     :param nrows_at_a_time: size of chunks to process
+    :param use_offset_index: read the chunks seeking through the offset index
+        of the file, building it if needed (see `get_csv_offset_index()`)
     :return: line in CSV of first matching row at or past start
     """
+    offset_index = get_csv_offset_index(csv_path) if use_offset_index else None
     curr = start
     while True:
         _LOG.debug("Start of current chunk = line %i", curr)
-        df = _read_csv_range(csv_path, curr, curr + nrows_at_a_time, **kwargs)
+        df = _read_csv_range(
+            csv_path,
+            curr,
+            curr + nrows_at_a_time,
+            offset_index=offset_index,
+            **kwargs,
+        )
         if df.shape[0] < 1:
             _LOG.info("Value %s not found", val)
             break
@@ -145,11 +346,279 @@ def find_first_matching_row(
     return None
 
 
+def find_first_matching_row_in_sorted_csv(
+    csv_path: str,
+    col_name: str,
+    val: Any,
+    *,
+    sample_every: int = 1000,
+    **kwargs: Any,
+) -> Optional[int]:
+    """
+    Find the first row in a CSV sorted by `col_name` where the value is `val`.
+
+    The search is a binary search over the lines sampled by the offset index
+    of the file (which is built if needed), followed by a read of the rows
+    between two consecutive sampled lines.
+
+    :param csv_path: location of CSV file
+    :param col_name: name of the column the CSV is sorted by, in ascending
+        order
+    :param val: value to match on
+    :param sample_every: sampling of the offset index, if it needs to be built
+    :return: line in CSV of first matching row
+    """
+    offset_index = get_csv_offset_index(csv_path, sample_every=sample_every)
+    sample_every = offset_index["sample_every"]
+    num_lines = offset_index["num_lines"]
+
+    def _get_value(line: int) -> Any:
+        df = _read_csv_range_with_offset_index(
+            csv_path, line, line + 1, offset_index, **kwargs
+        )
+        return df[col_name].iloc[0]
+
+    # Find the last sampled data line with a value smaller than `val`, using
+    # sampled lines `sample_every * i` with `i` in [1, num_samples).
+    num_samples = offset_index["offsets"].size
+    lo, hi = 1, num_samples
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _get_value(mid * sample_every) < val:
+            lo = mid + 1
+        else:
+            hi = mid
+    # The first match is between the sampled line `lo - 1` and the sampled
+    # line `lo` (included).
+    from_ = max(1, (lo - 1) * sample_every)
+    to = min(lo * sample_every + 1, num_lines)
+    if from_ >= to:
+        return None
+    df = _read_csv_range_with_offset_index(
+        csv_path, from_, to, offset_index, **kwargs
+    )
+    matches = (df[col_name] == val).to_numpy()
+    if not matches.any():
+        _LOG.info("Value %s not found", val)
+        return None
+    return int(from_ + matches.argmax())
+
+
 # #############################################################################
 # CSV to PQ conversion
 # #############################################################################
 
 
+class _KeyedWriterPool:
+    """
+    Append DataFrames to one output file per key, buffering the writes.
+
+    The rows of each key are buffered in memory and written when the buffer of
+    the key grows past `buffer_size_in_bytes`, or when all the buffers together
+    grow past `max_buffered_size_in_bytes`. At most `max_open_files` files are
+    kept open at the same time, closing the least recently used one. The order
+    of the rows of each key is preserved.
+
+    The output is:
+    - for CSV, the file `{out_dir}/{key}.csv` without header, appending to the
+      file if it already exists
+    - for Parquet, the dir `{out_dir}/{key}` with files `part-00000.parquet`,
+      `part-00001.parquet`, ..., since a Parquet file can't be appended to
+      after it's closed. Reading the dir returns the rows in order
+    """
+
+    def __init__(
+        self,
+        out_dir: str,
+        *,
+        file_format: str = "csv",
+        max_open_files: int = 256,
+        buffer_size_in_bytes: int = 4 * 1024**2,
+        max_buffered_size_in_bytes: int = 512 * 1024**2,
+    ) -> None:
+        """
+        Constructor.
+
+        :param out_dir: dir to write the files to
+        :param file_format: "csv" or "parquet"
+        :param max_open_files: maximum number of open files
+        :param buffer_size_in_bytes: size of the buffer of each key
+        :param max_buffered_size_in_bytes: size of all the buffers
+        """
+        hdbg.dassert_in(file_format, ("csv", "parquet"))
+        hdbg.dassert_lte(1, max_open_files)
+        hdbg.dassert_lte(buffer_size_in_bytes, max_buffered_size_in_bytes)
+        self._out_dir = out_dir
+        self._file_format = file_format
+        self._max_open_files = max_open_files
+        self._buffer_size_in_bytes = buffer_size_in_bytes
+        self._max_buffered_size_in_bytes = max_buffered_size_in_bytes
+        # Map keys to the buffered dfs and their size.
+        self._buffers: Dict[str, List[pd.DataFrame]] = {}
+        self._buffer_sizes: Dict[str, int] = {}
+        self._buffered_size = 0
+        # Open files (or Parquet writers) from least to most recently used.
+        self._open_files: "collections.OrderedDict[str, Any]" = (
+            collections.OrderedDict()
+        )
+        # Number of Parquet files written for each key.
+        self._num_parts: Dict[str, int] = {}
+
+    def __enter__(self) -> "_KeyedWriterPool":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def write(self, key: str, df: pd.DataFrame) -> None:
+        """
+        Append `df` to the output of `key`.
+        """
+        if df.empty:
+            return
+        # Estimate the size as `DataFrame.memory_usage()` does for numeric and
+        # object columns, without its overhead.
+        size = df.shape[0] * df.shape[1] * 8
+        self._buffers.setdefault(key, []).append(df)
+        self._buffer_sizes[key] = self._buffer_sizes.get(key, 0) + size
+        self._buffered_size += size
+        if self._buffer_sizes[key] >= self._buffer_size_in_bytes:
+            self._flush([key])
+        if self._buffered_size >= self._max_buffered_size_in_bytes:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write all the buffered rows.
+        """
+        # Flush the keys with an open file first to reduce the evictions.
+        keys = sorted(self._buffers, key=lambda key: key not in self._open_files)
+        self._flush(keys)
+
+    def close(self) -> None:
+        """
+        Write all the buffered rows and close all the files.
+        """
+        self.flush()
+        while self._open_files:
+            _, file = self._open_files.popitem(last=False)
+            file.close()
+
+    def _flush(self, keys: List[str]) -> None:
+        """
+        Write the buffered rows of `keys`.
+        """
+        dfs = [df for key in keys for df in self._buffers[key]]
+        # Convert all the dfs at once, since a conversion for each df is more
+        # expensive than writing the data.
+        if self._file_format == "csv":
+            chunks = self._to_csv_texts(dfs)
+        else:
+            chunks = self._to_tables(dfs)
+        start = 0
+        for key in keys:
+            num_dfs = len(self._buffers.pop(key))
+            self._buffered_size -= self._buffer_sizes.pop(key)
+            key_chunks = chunks[start : start + num_dfs]
+            file = self._get_file(key, dfs[start])
+            start += num_dfs
+            if self._file_format == "csv":
+                file.write("".join(key_chunks))
+            else:
+                table = pa.concat_tables(
+                    key_chunks, promote_options="permissive"
+                )
+                if not table.schema.equals(file.schema):
+                    # E.g., a column with only NaNs in a chunk is inferred as
+                    # float.
+                    table = table.cast(file.schema)
+                file.write_table(table)
+
+    @staticmethod
+    def _group_by_schema(dfs: List[pd.DataFrame]) -> List[List[int]]:
+        """
+        Group the indices of `dfs` with the same columns and types.
+        """
+        groups: Dict[Any, List[int]] = {}
+        for idx, df in enumerate(dfs):
+            schema = (tuple(df.columns), tuple(df.dtypes))
+            groups.setdefault(schema, []).append(idx)
+        return list(groups.values())
+
+    def _to_csv_texts(self, dfs: List[pd.DataFrame]) -> List[str]:
+        """
+        Convert each df to CSV text without header.
+
+        The dfs with the same schema are converted with a single `to_csv()`
+        and the text is then split by rows, so the result is the same as
+        converting each df separately.
+        """
+        texts: List[str] = [""] * len(dfs)
+        for idxs in self._group_by_schema(dfs):
+            group_dfs = [dfs[idx] for idx in idxs]
+            text = pd.concat(group_dfs, axis=0).to_csv(
+                header=False, index=False, lineterminator="\n"
+            )
+            lines = text.split("\n")
+            num_rows = sum(df.shape[0] for df in group_dfs)
+            if len(lines) != num_rows + 1:
+                # Some values contain newlines, so we can't split the rows.
+                for idx, df in zip(idxs, group_dfs):
+                    texts[idx] = df.to_csv(
+                        header=False, index=False, lineterminator="\n"
+                    )
+                continue
+            start = 0
+            for idx, df in zip(idxs, group_dfs):
+                end = start + df.shape[0]
+                texts[idx] = "\n".join(lines[start:end]) + "\n"
+                start = end
+        return texts
+
+    def _to_tables(self, dfs: List[pd.DataFrame]) -> List[pa.Table]:
+        """
+        Convert each df to a Parquet table.
+
+        The dfs with the same schema are converted together and then sliced
+        without copying.
+        """
+        tables: List[Any] = [None] * len(dfs)
+        for idxs in self._group_by_schema(dfs):
+            group_dfs = [dfs[idx] for idx in idxs]
+            table = pa.Table.from_pandas(
+                pd.concat(group_dfs, axis=0), preserve_index=False
+            )
+            start = 0
+            for idx, df in zip(idxs, group_dfs):
+                tables[idx] = table.slice(start, df.shape[0])
+                start += df.shape[0]
+        return tables
+
+    def _get_file(self, key: str, df: pd.DataFrame) -> Any:
+        """
+        Return the open file for `key`, opening it if needed.
+        """
+        if key in self._open_files:
+            self._open_files.move_to_end(key)
+            return self._open_files[key]
+        if len(self._open_files) >= self._max_open_files:
+            _, file = self._open_files.popitem(last=False)
+            file.close()
+        if self._file_format == "csv":
+            file_name = os.path.join(self._out_dir, key + ".csv")
+            file = open(file_name, "a")
+        else:
+            part = self._num_parts.get(key, 0)
+            self._num_parts[key] = part + 1
+            dir_name = os.path.join(self._out_dir, key)
+            hio.create_dir(dir_name, incremental=True)
+            file_name = os.path.join(dir_name, f"part-{part:05d}.parquet")
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            file = pq.ParquetWriter(file_name, schema)
+        self._open_files[key] = file
+        return file
+
+
 def _csv_mapreduce(
     csv_path: str,
     out_dir: str,
@@ -157,6 +626,9 @@ def _csv_mapreduce(
     chunk_preprocessor: Optional[Callable],
     *,
     chunk_size: int = 1000000,
+    file_format: str = "csv",
+    max_open_files: int = 256,
+    buffer_size_in_bytes: int = 4 * 1024**2,
 ) -> None:
     """
     Map-reduce-type processing of CSV.
@@ -164,7 +636,8 @@ def _csv_mapreduce(
     The phases are:
       - Read the CSV in chunks as DataFrame
       - Key each row of the DataFrame using a `groupby`
-      - "Reduce" keyed groups by writing and appending to a CSV
+      - "Reduce" keyed groups by writing and appending to a CSV (or Parquet)
+        file per key, through a `_KeyedWriterPool`
 
     :param csv_path: input CSV path
     :param out_dir: output dir for CSV with filenames corresponding to keys
@@ -173,6 +646,10 @@ def _csv_mapreduce(
     :param chunk_preprocessor: function to apply to each chunk DataFrame before
         applying key_func
     :param chunk_size: chunk_size of input to process
+    :param file_format: format of the output files, "csv" or "parquet" (see
+        `_KeyedWriterPool`)
+    :param max_open_files: maximum number of output files open at once
+    :param buffer_size_in_bytes: size of the rows buffered for each key
     """
     # Read CSV data in chunks.
     chunks = pd.read_csv(csv_path, chunksize=chunk_size)
@@ -182,10 +659,114 @@ def _csv_mapreduce(
     # Apply key_func to each chunk.
     keyed_group_blocks = map(key_func, chunks)
     # Append results.
-    for block in keyed_group_blocks:
-        for idx, df in block:
-            file_name = os.path.join(out_dir, idx + ".csv")
-            _append_csv(df, file_name)
+    with _KeyedWriterPool(
+        out_dir,
+        file_format=file_format,
+        max_open_files=max_open_files,
+        buffer_size_in_bytes=buffer_size_in_bytes,
+    ) as writer_pool:
+        for block in keyed_group_blocks:
+            for idx, df in block:
+                writer_pool.write(idx, df)
+
+
+# Key of the Parquet schema metadata storing the fingerprint of the source
+# CSV file (see `_get_file_fingerprint()`).
+_SOURCE_FINGERPRINT_KEY = b"hcsv.source_fingerprint"
+
+
+def _get_file_fingerprint(
+    file_name: str, aws_profile: hs3.AwsProfile
+) -> str:
+    """
+    Return a string that changes when the content of a file changes.
+
+    The fingerprint is the ETag for S3 files and the size and modification
+    time for local files.
+    """
+    if hs3.is_s3_path(file_name):
+        s3fs_ = hs3.get_s3fs(aws_profile)
+        fingerprint = f"etag={s3fs_.info(file_name)['ETag']}"
+    else:
+        stat = os.stat(file_name)
+        fingerprint = f"size={stat.st_size},mtime_ns={stat.st_mtime_ns}"
+    return fingerprint
+
+
+def _is_pq_file_up_to_date(pq_path: str, fingerprint: str) -> bool:
+    """
+    Check whether a Parquet file was converted from a source with
+    `fingerprint`.
+    """
+    if not os.path.exists(pq_path):
+        return False
+    try:
+        metadata = pq.read_schema(pq_path).metadata or {}
+    except pa.ArrowInvalid:
+        # E.g., the file was truncated.
+        return False
+    return bool(metadata.get(_SOURCE_FINGERPRINT_KEY) == fingerprint.encode())
+
+
+def _open_csv_file(csv_path: str, aws_profile: hs3.AwsProfile) -> Any:
+    """
+    Open a local or S3 CSV file for reading, decompressing it if needed.
+    """
+    if hs3.is_s3_path(csv_path):
+        s3fs_ = hs3.get_s3fs(aws_profile)
+        f = s3fs_.open(csv_path, "rb")
+    else:
+        f = open(csv_path, "rb")
+    if csv_path.endswith(".gz"):
+        f = pa.CompressedInputStream(f, "gzip")
+    return f
+
+
+def _df_to_table(df: pd.DataFrame) -> pa.Table:
+    # A `RangeIndex` is different in each block, so we don't store it, like
+    # `DataFrame.to_parquet()` does for the whole df.
+    preserve_index = not isinstance(df.index, pd.RangeIndex)
+    table = pa.Table.from_pandas(df, preserve_index=preserve_index)
+    return table
+
+
+def _read_csv_blocks(
+    csv_path: str,
+    header: Optional[int],
+    block_size_in_bytes: int,
+    aws_profile: hs3.AwsProfile,
+) -> Iterator[pd.DataFrame]:
+    """
+    Read a CSV file in blocks of about `block_size_in_bytes` bytes.
+
+    The blocks are parsed like `pd.read_csv(csv_path, header=header)` would.
+    """
+    read_options = pacsv.ReadOptions(
+        block_size=block_size_in_bytes,
+        skip_rows=0 if header is None else header,
+        autogenerate_column_names=header is None,
+    )
+    # `pyarrow` infers the column types from the first block. Unlike `pandas`
+    # it parses timestamps, so we keep them as strings.
+    with _open_csv_file(csv_path, aws_profile) as f:
+        with pacsv.open_csv(f, read_options=read_options) as reader:
+            schema = reader.schema
+    column_types = {
+        field.name: pa.string()
+        for field in schema
+        if pa.types.is_timestamp(field.type) or pa.types.is_date(field.type)
+    }
+    convert_options = pacsv.ConvertOptions(column_types=column_types)
+    with _open_csv_file(csv_path, aws_profile) as f:
+        with pacsv.open_csv(
+            f, read_options=read_options, convert_options=convert_options
+        ) as reader:
+            for batch in reader:
+                df = batch.to_pandas()
+                if header is None:
+                    # Use the same column names as `pandas`.
+                    df.columns = range(df.shape[1])
+                yield df
 
 
 def convert_csv_to_pq(
@@ -195,6 +776,8 @@ def convert_csv_to_pq(
     normalizer: Optional[Callable] = None,
     header: Optional[int] = 0,
     compression: Optional[str] = "gzip",
+    block_size_in_bytes: Optional[int] = None,
+    aws_profile: hs3.AwsProfile = None,
 ) -> None:
     """
     Convert CSV file to Parquet file.
@@ -204,16 +787,111 @@ def convert_csv_to_pq(
     requires string column names, whereas Pandas by default uses integer column
     names.
 
-    :param csv_path: full path of CSV
-    :param pq_path: full path of parquet
+    The fingerprint of the CSV file (see `_get_file_fingerprint()`) is saved in
+    the metadata of the Parquet file, so that the conversion can be skipped
+    when the CSV file doesn't change.
+
+    :param csv_path: full path of CSV, local or on S3
+    :param pq_path: full path of parquet, local or on S3
     :param header: header specification of CSV
     :param normalizer: function to apply to df before writing to PQ
+    :param block_size_in_bytes: if not `None`, read the CSV with `pyarrow` in
+        blocks of this size, applying `normalizer` to each block, so that the
+        memory used doesn't depend on the size of the file. Otherwise read the
+        whole file with `pandas`
+    :param aws_profile: AWS profile to use if and only if `csv_path` or
+        `pq_path` is on S3
     """
-    df = pd.read_csv(csv_path, header=header)
-    # TODO(Paul): Ensure that one of header, normalizer is not None.
-    if normalizer is not None:
-        df = normalizer(df)
-    df.to_parquet(pq_path, compression=compression)
+    if hs3.is_s3_path(csv_path) or hs3.is_s3_path(pq_path):
+        hdbg.dassert_is_not(aws_profile, None)
+    else:
+        hdbg.dassert_is(aws_profile, None)
+    fingerprint = _get_file_fingerprint(csv_path, aws_profile)
+    metadata = {_SOURCE_FINGERPRINT_KEY: fingerprint.encode()}
+    if hs3.is_s3_path(pq_path):
+        # An S3 object is visible only once it is completely uploaded.
+        filesystem = hs3.get_s3fs(aws_profile)
+        tmp_pq_path = pq_path
+    else:
+        # Write to a temporary file so that an interrupted conversion doesn't
+        # leave a partial Parquet file.
+        filesystem = None
+        tmp_pq_path = pq_path + ".tmp"
+    try:
+        if block_size_in_bytes is not None:
+            writer = None
+            try:
+                for df in _read_csv_blocks(
+                    csv_path, header, block_size_in_bytes, aws_profile
+                ):
+                    if normalizer is not None:
+                        df = normalizer(df)
+                    table = _df_to_table(df)
+                    if writer is None:
+                        schema = table.schema.with_metadata(
+                            {**(table.schema.metadata or {}), **metadata}
+                        )
+                        writer = pq.ParquetWriter(
+                            tmp_pq_path,
+                            schema,
+                            filesystem=filesystem,
+                            compression=compression,
+                        )
+                    writer.write_table(table.cast(writer.schema))
+            except pa.ArrowInvalid as e:
+                # E.g., a value in a block doesn't fit the type inferred from the
+                # first block.
+                _LOG.warning(
+                    "Can't convert '%s' in blocks (%s): reading the whole file",
+                    csv_path,
+                    e,
+                )
+                block_size_in_bytes = None
+            finally:
+                if writer is not None:
+                    writer.close()
+            if block_size_in_bytes is not None and writer is None:
+                # The file has no rows.
+                block_size_in_bytes = None
+        if block_size_in_bytes is None:
+            with _open_csv_file(csv_path, aws_profile) as f:
+                df = pd.read_csv(f, header=header)
+            # TODO(Paul): Ensure that one of header, normalizer is not None.
+            if normalizer is not None:
+                df = normalizer(df)
+            table = pa.Table.from_pandas(df)
+            table = table.replace_schema_metadata(
+                {**(table.schema.metadata or {}), **metadata}
+            )
+            pq.write_table(
+                table,
+                tmp_pq_path,
+                filesystem=filesystem,
+                compression=compression,
+            )
+    except BaseException:
+        # Don't leave a partial file that a later run could see.
+        if tmp_pq_path != pq_path and os.path.exists(tmp_pq_path):
+            os.remove(tmp_pq_path)
+        raise
+    if tmp_pq_path != pq_path:
+        os.replace(tmp_pq_path, pq_path)
+
+
+def _convert_csv_to_pq_task(*args: Any, **kwargs: Any) -> str:
+    """
+    Workload function for `convert_csv_dir_to_pq_dir()`.
+
+    :return: the path of the Parquet file
+    """
+    _ = args
+    incremental = kwargs.pop("incremental")
+    num_attempts = kwargs.pop("num_attempts")
+    _ = incremental, num_attempts
+    csv_path = kwargs.pop("csv_path")
+    pq_path = kwargs.pop("pq_path")
+    convert_csv_to_pq(csv_path, pq_path, **kwargs)
+    return pq_path
 
 
 # TODO(gp): Promote to hio.
@@ -227,7 +905,6 @@ def _maybe_remove_extension(filename: str, extension: str) -> Optional[str]:
     """
     hdbg.dassert_isinstance(filename, str)
     hdbg.dassert(filename)
-    hdbg.dassert_file_exists(filename)
     #
     hdbg.dassert_isinstance(extension, str)
     hdbg.dassert(
@@ -248,6 +925,12 @@ def convert_csv_dir_to_pq_dir(
     *,
     normalizer: Optional[Callable] = None,
     header: Optional[int] = None,
+    aws_profile: hs3.AwsProfile = None,
+    incremental: bool = False,
+    num_threads: Union[str, int] = "serial",
+    backend: str = "loky",
+    block_size_in_bytes: Optional[int] = None,
+    log_file: Optional[str] = None,
 ) -> None:
     """
     Apply `convert_csv_to_pq()` to all files in `csv_dir`.
@@ -257,38 +940,84 @@ def convert_csv_dir_to_pq_dir(
         filesystem)
     :param header: header specification of CSV
     :param normalizer: function to apply to df before writing to PQ
+    :param aws_profile: AWS profile to use if and only if `csv_dir` is on S3
+    :param incremental: skip the CSV files that didn't change since they were
+        converted, based on the modification time and size of local files or
+        the ETag of S3 files
+    :param num_threads: number of files to convert in parallel or "serial"
+        (see `hjoblib.parallel_execute()`)
+    :param backend: backend to convert the files in parallel
+    :param block_size_in_bytes: size of the blocks of CSV data to convert at a
+        time (see `convert_csv_to_pq()`). `None` converts each file at once
+    :param log_file: file to log information about the execution to (see
+        `hjoblib.parallel_execute()`). `None` doesn't keep any log file
     """
+    hs3.dassert_is_valid_aws_profile(csv_dir, aws_profile)
+    hdbg.dassert(not hs3.is_s3_path(pq_dir), "pq_dir='%s' must be local", pq_dir)
     # Get the filenames in `csv_dir`.
     if hs3.is_s3_path(csv_dir):
-        # TODO(gp): Pass aws_profile.
-        s3fs = hs3.get_s3fs("am")
-        filenames = s3fs.ls(csv_dir)
+        s3fs_ = hs3.get_s3fs(aws_profile)
+        filenames = [os.path.basename(path) for path in s3fs_.ls(csv_dir)]
     else:
         # Local filesystem.
         hdbg.dassert_dir_exists(csv_dir)
         # TODO(Paul): check .endswith(".csv") or do glob(csv_dir + "/*.csv")
         filenames = os.listdir(csv_dir)
     hdbg.dassert(filenames, "No files in the directory '%s'", csv_dir)
-    # Process all the filenames.
-    # TODO(gp): Add tqdm.
-    # TODO(gp): Consider parallelizing.
-    for filename in filenames:
+    hio.create_dir(pq_dir, incremental=True)
+    # Prepare the workload.
+    tasks = []
+    for filename in sorted(filenames):
         # Remove .csv/.csv.gz.
         csv_stem = _maybe_remove_extension(filename, ".csv")
         if csv_stem is None:
             csv_stem = _maybe_remove_extension(filename, ".csv.gz")
         if csv_stem is None:
             _LOG.warning(
-                "Skipping filename=%s since it has invalid extension", csv_stem
+                "Skipping filename=%s since it has invalid extension", filename
             )
             continue
-        # Convert file to PQ.
-        pq_filename = csv_stem + ".pq"
-        convert_csv_to_pq(
-            os.path.join(csv_dir, filename),
-            os.path.join(pq_dir, pq_filename),
-            normalizer=normalizer,
-            header=header,
+        csv_path = os.path.join(csv_dir, filename)
+        pq_path = os.path.join(pq_dir, csv_stem + ".pq")
+        if incremental and _is_pq_file_up_to_date(
+            pq_path, _get_file_fingerprint(csv_path, aws_profile)
+        ):
+            _LOG.debug("Skipping up to date '%s'", pq_path)
+            continue
+        task: hjoblib.Task = (
+            (),
+            {
+                "csv_path": csv_path,
+                "pq_path": pq_path,
+                "normalizer": normalizer,
+                "header": header,
+                "block_size_in_bytes": block_size_in_bytes,
+                "aws_profile": aws_profile,
+            },
+        )
+        tasks.append(task)
+    _LOG.info("Converting %s / %s files", len(tasks), len(filenames))
+    if not tasks:
+        return
+    # Convert the files.
+    workload = (_convert_csv_to_pq_task, "convert_csv_to_pq", tasks)
+    hjoblib.validate_workload(workload)
+    dry_run = False
+    abort_on_error = True
+    num_attempts = 1
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if log_file is None:
+            # `parallel_execute()` needs a log file, so use a throwaway one.
+            log_file = os.path.join(tmp_dir, "convert_csv_dir_to_pq_dir.log")
+        hjoblib.parallel_execute(
+            workload,
+            dry_run,
+            num_threads,
+            incremental,
+            abort_on_error,
+            num_attempts,
+            log_file,
+            backend=backend,
         )
 
 
@@ -347,36 +1076,181 @@ def save_csv_as_json(
 # #############################################################################
 
 
+# Values parsed as missing by `pd.read_csv()`.
+_NA_VALUES = [
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+]
+
+
+def _get_dtype_spec(dtype: Any) -> Any:
+    """
+    Return the description of a column type stored in the `.types` file.
+
+    The description is the name of the dtype, e.g., "int64" or
+    "datetime64[ns, UTC]", or a dict also storing the categories of a
+    categorical column, when they can be represented as a literal.
+    """
+    if isinstance(dtype, pd.CategoricalDtype):
+        categories = dtype.categories.tolist()
+        if all(isinstance(val, (str, int, float)) for val in categories):
+            return {
+                "dtype": "category",
+                "categories": categories,
+                "ordered": bool(dtype.ordered),
+            }
+    return dtype.name
+
+
+def _get_pandas_dtype(dtype_spec: Any) -> Any:
+    """
+    Return the pandas dtype described by `dtype_spec`.
+    """
+    if isinstance(dtype_spec, dict):
+        hdbg.dassert_eq(dtype_spec["dtype"], "category")
+        dtype = pd.CategoricalDtype(
+            dtype_spec["categories"], ordered=dtype_spec["ordered"]
+        )
+    else:
+        dtype = pd.api.types.pandas_dtype(dtype_spec)
+    return dtype
+
+
+def _get_arrow_type(dtype: Any) -> Any:
+    """
+    Return the type used by `pyarrow` to parse a column with pandas `dtype`.
+
+    :return: the `pyarrow` type or `None` to parse the column as strings and
+        convert it with `pandas`
+    """
+    if isinstance(dtype, pd.CategoricalDtype):
+        if dtype.categories.dtype == object:
+            return pa.dictionary(pa.int32(), pa.string())
+        return _get_arrow_type(dtype.categories.dtype)
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        return pa.timestamp(dtype.unit, tz=str(dtype.tz))
+    if isinstance(dtype, np.dtype):
+        if dtype.kind in "biufM":
+            return pa.from_numpy_dtype(dtype)
+        if dtype.kind == "O":
+            return pa.string()
+    return None
+
+
+def _series_to_arrow(srs: pd.Series) -> pa.Array:
+    """
+    Convert a column to an array that `pyarrow.csv` can write.
+    """
+    try:
+        array = pa.array(srs, from_pandas=True)
+        if pa.types.is_duration(array.type):
+            # Formatting timedeltas as strings is slow, so we save them as
+            # integer counts of their unit.
+            array = array.cast(pa.int64())
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # E.g., an object column with values of different types.
+        array = pa.array(srs.where(srs.isna(), srs.astype(str)), from_pandas=True)
+    return array
+
+
 def to_typed_csv(df: pd.DataFrame, file_name: str) -> str:
     """
     Convert df into CSV and creates a file with the dtypes of columns.
 
     This function creates a file containing the types with the same name
-    and suffix e.g., `foobar.csv.types`.
+    and suffix e.g., `foobar.csv.types`. The data is written with
+    `pyarrow.csv`, which is much faster than `DataFrame.to_csv()`, and the
+    file can still be read with `pd.read_csv()`. Timedeltas are saved as
+    integer counts of their unit, e.g., nanoseconds.
     """
     # Save the types.
     dtypes_filename = file_name + ".types"
     hio.create_enclosing_dir(dtypes_filename, incremental=True)
-    dtypes_dict = str(df.dtypes.apply(lambda x: x.name).to_dict())
+    dtypes_dict = str(
+        {col_name: _get_dtype_spec(dtype) for col_name, dtype in df.dtypes.items()}
+    )
     # Save the data.
-    df.to_csv(file_name, index=False)
+    table = pa.Table.from_arrays(
+        [_series_to_arrow(srs) for _, srs in df.items()],
+        names=[str(col_name) for col_name in df.columns],
+    )
+    pacsv.write_csv(table, file_name)
     with open(dtypes_filename, "w") as dtypes_file:
         dtypes_file.write(dtypes_dict)
     return dtypes_filename
 
 
-def from_typed_csv(file_name: str) -> pd.DataFrame:
+def from_typed_csv(file_name: str, *, use_threads: bool = True) -> pd.DataFrame:
     """
     Load CSV file as df applying the original types of columns.
 
     This function uses a file with name `file_name.types` to load
-    information about the column types.
+    information about the column types. The file is parsed by `pyarrow.csv`
+    with a schema built from the types, so that no type inference is needed.
+
+    :param use_threads: parse the file with multiple threads
     """
     # Load the types.
     dtypes_filename = file_name + ".types"
     hdbg.dassert_path_exists(dtypes_filename)
     with open(dtypes_filename) as dtypes_file:
         dtypes_dict = ast.literal_eval(list(dtypes_file)[0])
+    col_names = list(dtypes_dict.keys())
+    dtypes = [_get_pandas_dtype(spec) for spec in dtypes_dict.values()]
     # Load the data, applying the types.
-    df = pd.read_csv(file_name, dtype=dtypes_dict)
+    column_types = {}
+    for col_name, dtype in zip(col_names, dtypes):
+        arrow_type = _get_arrow_type(dtype)
+        column_types[str(col_name)] = (
+            pa.string() if arrow_type is None else arrow_type
+        )
+    read_options = pacsv.ReadOptions(use_threads=use_threads)
+    convert_options = pacsv.ConvertOptions(
+        column_types=column_types,
+        null_values=_NA_VALUES,
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=False,
+    )
+    table = pacsv.read_csv(
+        file_name, read_options=read_options, convert_options=convert_options
+    )
+    for idx, dtype in enumerate(dtypes):
+        if dtype.kind == "m":
+            # Timedeltas are saved as integer counts of their unit, unless
+            # the file was written by `pandas`.
+            try:
+                column = table.column(idx).cast(pa.int64())
+            except pa.ArrowInvalid:
+                continue
+            column = column.cast(pa.duration(np.datetime_data(dtype)[0]))
+            table = table.set_column(idx, table.field(idx).name, column)
+    df = table.to_pandas()
+    hdbg.dassert_eq(df.shape[1], len(col_names))
+    df.columns = col_names
+    # Convert the columns that `pyarrow` can't represent exactly, e.g.,
+    # timedeltas, ints with NaNs or the categories of categorical columns.
+    for col_name, dtype in zip(col_names, dtypes):
+        if df[col_name].dtype == dtype:
+            continue
+        if dtype.kind == "m":
+            df[col_name] = pd.to_timedelta(df[col_name])
+        else:
+            df[col_name] = df[col_name].astype(dtype)
     return df
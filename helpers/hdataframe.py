@@ -12,12 +12,13 @@ import collections
 import functools
 import logging
 import operator
-from typing import Any, Dict, List, Optional, Tuple, Union, cast
+from typing import Any, Collection, Dict, Optional, Tuple, Union, cast
 
 import numpy as np
 import pandas as pd
 
 import helpers.hdbg as hdbg
+import helpers.hpandas as hpandas
 import helpers.hprint as hprint
 
 _LOG = logging.getLogger(__name__)
@@ -163,10 +164,73 @@ def filter_data_by_method(
 # #############################################################################
 
 
+_NAN_MODES = (
+    "leave_unchanged",
+    "drop",
+    "ffill",
+    "ffill_and_drop_leading",
+    "fill_with_zero",
+    "strict",
+)
+
+
+def _apply_nan_mode(
+    data: Union[pd.Series, pd.DataFrame], mode: str, copy: bool
+) -> Tuple[Union[pd.Series, pd.DataFrame], np.ndarray, np.ndarray]:
+    """
+    Process NaN values according to `mode`.
+
+    The NaNs are detected once and the data is processed only if it has NaNs.
+    Rows are dropped when they have a NaN in any column.
+
+    :param data: series or dataframe to process
+    :param mode: see `apply_nan_mode()`
+    :param copy: see `apply_nan_mode()`
+    :return:
+        - transformed data
+        - number of NaNs in each column of the input data
+        - number of NaNs filled in each column
+    """
+    if mode not in _NAN_MODES:
+        raise ValueError(f"Unrecognized mode `{mode}`")
+    is_nan = data.isna().to_numpy()
+    if is_nan.ndim == 1:
+        is_nan = is_nan[:, np.newaxis]
+    num_nans = is_nan.sum(axis=0)
+    num_nans_imputed = np.zeros_like(num_nans)
+    has_nans = num_nans.any()
+    if mode == "strict" and has_nans:
+        raise ValueError(f"NaNs detected in mode `{mode}`")
+    if mode in ("leave_unchanged", "strict") or not has_nans:
+        res = data.copy() if copy else data
+    elif mode == "drop":
+        res = data[~is_nan.any(axis=1)]
+    elif mode in ("ffill", "ffill_and_drop_leading"):
+        # Leading NaNs are not filled.
+        num_leading_nans = np.where(
+            is_nan.all(axis=0), len(data), is_nan.argmin(axis=0)
+        )
+        if mode == "ffill":
+            res = data.ffill()
+            num_nans_imputed = num_nans - num_leading_nans
+        else:
+            # Drop the leading rows until all the columns have a value.
+            num_rows_to_drop = num_leading_nans.max()
+            res = data.ffill().iloc[num_rows_to_drop:]
+            num_nans_imputed = is_nan[num_rows_to_drop:].sum(axis=0)
+    else:
+        hdbg.dassert_eq(mode, "fill_with_zero")
+        res = data.fillna(0)
+        num_nans_imputed = num_nans
+    return res, num_nans, num_nans_imputed
+
+
 def apply_nan_mode(
     srs: pd.Series,
     mode: str = "leave_unchanged",
     info: Optional[dict] = None,
+    *,
+    copy: bool = True,
 ) -> pd.Series:
     """
     Process NaN values in a series according to the parameters.
@@ -180,27 +244,15 @@ def apply_nan_mode(
         - "fill_with_zero" - fill NaNs with 0
         - "strict" - raise ValueError that NaNs are detected
     :param info: information storage
-    :return: transformed copy of input series
+    :param copy: return a copy of the input series even when there is
+        nothing to transform; if False the input series is returned as is
+        in that case
+    :return: transformed series
     """
     hdbg.dassert_isinstance(srs, pd.Series)
     if srs.empty:
         _LOG.warning("Empty input series `%s`", srs.name)
-    if mode == "leave_unchanged":
-        res = srs.copy()
-    elif mode == "drop":
-        res = srs.dropna().copy()
-    elif mode == "ffill":
-        res = srs.ffill().copy()
-    elif mode == "ffill_and_drop_leading":
-        res = srs.ffill().dropna().copy()
-    elif mode == "fill_with_zero":
-        res = srs.fillna(0).copy()
-    elif mode == "strict":
-        res = srs.copy()
-        if srs.isna().any():
-            raise ValueError(f"NaNs detected in mode `{mode}`")
-    else:
-        raise ValueError(f"Unrecognized mode `{mode}`")
+    res, num_nans, _ = _apply_nan_mode(srs, mode, copy)
     #
     if info is not None:
         hdbg.dassert_isinstance(info, dict)
@@ -208,7 +260,7 @@ def apply_nan_mode(
         hdbg.dassert(not info)
         info["series_name"] = srs.name
         info["num_elems_before"] = len(srs)
-        info["num_nans_before"] = np.isnan(srs).sum()
+        info["num_nans_before"] = num_nans[0]
         info["num_elems_removed"] = len(srs) - len(res)
         info["num_nans_imputed"] = (
             info["num_nans_before"] - info["num_elems_removed"]
@@ -222,6 +274,53 @@ def apply_nan_mode(
     return res
 
 
+def apply_nan_mode_to_df(
+    df: pd.DataFrame,
+    mode: str = "leave_unchanged",
+    info: Optional[dict] = None,
+    *,
+    copy: bool = True,
+) -> pd.DataFrame:
+    """
+    Process NaN values in all the columns of a dataframe at once.
+
+    This is equivalent to calling `apply_nan_mode()` on each column, except
+    that rows are dropped for all the columns, i.e.:
+    - "drop" drops the rows with a NaN in any column
+    - "ffill_and_drop_leading" drops the leading rows until all the columns
+      have a value
+
+    :param df: dataframe to process
+    :param mode: see `apply_nan_mode()`
+    :param info: information storage, where the NaN stats are series indexed
+        by column and count only the NaNs actually filled
+    :param copy: see `apply_nan_mode()`
+    :return: transformed dataframe
+    """
+    hdbg.dassert_isinstance(df, pd.DataFrame)
+    if df.empty:
+        _LOG.warning("Empty input dataframe")
+    res, num_nans, num_nans_imputed = _apply_nan_mode(df, mode, copy)
+    #
+    if info is not None:
+        hdbg.dassert_isinstance(info, dict)
+        # Dictionary should be empty.
+        hdbg.dassert(not info)
+        info["num_elems_before"] = len(df)
+        info["num_nans_before"] = pd.Series(num_nans, index=df.columns)
+        info["num_elems_removed"] = len(df) - len(res)
+        info["num_nans_imputed"] = pd.Series(
+            num_nans_imputed, index=df.columns
+        )
+        info["percentage_elems_removed"] = (
+            100.0 * info["num_elems_removed"] / info["num_elems_before"]
+        )
+        info["percentage_elems_imputed"] = (
+            100.0 * info["num_nans_imputed"] / info["num_elems_before"]
+        )
+    return res
+
+
 # #############################################################################
 
 
@@ -283,23 +382,25 @@ def compute_count_per_year(df: Union[pd.Series, pd.DataFrame]) -> float:
 
 def remove_duplicates(
     df: pd.DataFrame,
-    duplicate_columns: Optional[List[str]],
+    duplicate_columns: Optional[Collection[str]],
     control_column: Optional[str],
 ) -> pd.DataFrame:
     """
     Remove duplicates from DataFrame.
 
+    The rows are kept in their original order and the input is not modified.
+
     :param df: DataFrame to process
-    :param duplicate_columns: subset of column names, None for all
+    :param duplicate_columns: subset of column names (any list-like), None
+        or empty for all
     :param control_column: column max value of which determines the kept
         row
     :return: DataFrame with removed duplicates
     """
-    # Fix maximum value of control column at the bottom.
-    if control_column:
-        df = df.sort_values(by=control_column)
-    duplicate_columns = duplicate_columns or df.columns
-    df = df.drop_duplicates(subset=duplicate_columns)
-    # Sort by index to return to original view.
-    df = df.sort_index()
+    if duplicate_columns is None or len(duplicate_columns) == 0:
+        duplicate_columns = df.columns
+    is_duplicated = hpandas.get_duplicated_mask(
+        df, subset=list(duplicate_columns), control_column=control_column
+    )
+    df = df[~is_duplicated]
     return df
@@ -7,15 +7,17 @@ import helpers.hdatetime as hdateti
 import asyncio
 import calendar
 import datetime
+import functools
 import logging
 import re
-from typing import Callable, Iterable, Optional, Tuple, Union, cast
+from typing import Callable, Iterable, Optional, Union, cast
 
 # TODO(gp): Use hdbg.WARNING
 _WARNING = "\033[33mWARNING\033[0m"
 
 # Avoid dependency from other `helpers` modules to prevent import cycles.
 
+import numpy as np  # noqa: E402 # pylint: disable=wrong-import-position
 import pandas as pd  # noqa: E402 # pylint: disable=wrong-import-position
 
 # TODO(gp): Check if dateutils is equivalent to `pytz` or better so we can simplify
@@ -583,6 +585,52 @@ def str_to_timestamp(
     return timestamp
 
 
+# Month names and abbreviations (e.g., "january" and "jan") to month numbers.
+_MONTH_NAME_TO_NUMBER = {
+    name.lower(): month_number
+    for month_names in (calendar.month_name, calendar.month_abbr)
+    for month_number, name in enumerate(month_names)
+    if name
+}
+_MONTH_NAME_REGEX = "|".join(
+    sorted(_MONTH_NAME_TO_NUMBER, key=len, reverse=True)
+)
+
+# Formats that `pd.to_datetime()` can't parse or parses as the start of the
+# period, described by regexes with named groups for the date fields.
+# The dates in these formats are shifted to the end of the period, except for
+# bi-monthly dates that are indexed by the start of the month.
+_GENERALIZED_DATE_FORMATS = {
+    # "2021".
+    "annual": r"^(?P<year>\d{4})$",
+    # "2021-S1", "2021/S2".
+    "semiannual": r"^(?P<year>\d{4})[-./ ]S(?P<half>[12])$",
+    # "2021-Q1", "2021Q1".
+    "quarterly": r"^(?P<year>\d{4})[-./ ]?Q(?P<quarter>[1-4])$",
+    # "Q1 2021".
+    "quarterly_year_last": r"^Q(?P<quarter>[1-4]) (?P<year>\d{4})$",
+    # "2021-B1".
+    "bimonthly": r"^(?P<year>\d{4})[-./ ]B(?P<bimonth>[1-6])$",
+    # "2020-12", "2020/12".
+    "monthly": r"^(?P<year>\d{4})[-./](?P<month>\d{2})$",
+    # "2020-M1", "1959M01".
+    "monthly_m": r"^(?P<year>\d{4})[-./]?M(?P<month>\d{1,2})$",
+    # "Jan 2020", "January 2020".
+    "monthly_name_first": (
+        rf"^(?i:(?P<month_name>{_MONTH_NAME_REGEX}))\s+(?P<year>\d{{4}})$"
+    ),
+    # "2020 Jan", "2020 January".
+    "monthly_name_last": (
+        rf"^(?P<year>\d{{4}})\s+(?i:(?P<month_name>{_MONTH_NAME_REGEX}))$"
+    ),
+    # "2021-W14", "2021W14".
+    "weekly": r"^(?P<year>\d{4})[-./ ]?W(?P<week>\d{1,2})$",
+}
+# Strings longer than this, e.g., "September 2020", can't be in any of the
+# formats above.
+_MAX_GENERALIZED_DATE_LENGTH = 14
+
+
 def to_generalized_datetime(
     dates: Union[pd.Series, pd.Index], date_standard: Optional[str] = None
 ) -> Union[pd.Series, pd.Index]:
@@ -592,236 +640,226 @@ def to_generalized_datetime(
     This works like `pd.to_datetime`, but supports more date formats and shifts
     the dates to the end of period instead of the start.
 
+    Each distinct value is converted once, and values are grouped by the
+    detected format so that mixed formats are supported, e.g.,
+    `["2021-Q3", "2020W12", "2020-01-15"]`.
+
     :param dates: series or index of dates to convert
     :param date_standard: "standard" or "ISO_8601", `None` defaults to
         "standard"
-    :return: datetime dates
-    """
-    # This function doesn't deal with mixed formats.
-    hdbg.dassert_isinstance(dates, Iterable)
-    hdbg.dassert(not isinstance(dates, str))
-    # Try converting to datetime using `pd.to_datetime`.
-    format_example_index = -1
-    date_example = dates.tolist()[format_example_index]
-    format_fix = _handle_incorrect_conversions(date_example)
-    if format_fix is not None:
-        format_, date_modification_func = format_fix
-        dates = dates.map(date_modification_func)
-        date_example = dates.tolist()[format_example_index]
-    else:
-        format_ = None
-    datetime_dates = pd.to_datetime(dates, format=format_, errors="coerce")
-    # Shift to end of period if conversion has been successful.
-    if not pd.isna(datetime_dates).all():
-        datetime_example = datetime_dates.tolist()[format_example_index]
-        if (
-            not pd.isna(datetime_example)
-            and datetime_example.strftime("%Y-%m-%d") == date_example
-        ):
-            return datetime_dates
-        shift_func = _shift_to_period_end(date_example)
-        if shift_func is not None:
-            datetime_dates = datetime_dates.map(shift_func)
-        return datetime_dates
-    # If standard conversion fails, attempt our own conversion.
-    date_standard = date_standard or "standard"
-    format_determination_output = _determine_date_format(
-        date_example, date_standard
-    )
-    if format_determination_output is None:
-        return datetime_dates
-    format_, date_modification_func = format_determination_output
-    dates = dates.map(date_modification_func)
-    return pd.to_datetime(dates, format=format_)
-
-
-def _handle_incorrect_conversions(
-    date: str,
-) -> Optional[Tuple[Optional[str], Callable[[str], str]]]:
-    """
-    Change data pre-processing for cases when `pd.to_datetime` is mistaken.
-
-    :param date: string date
-    :return: date format and a function to apply to string dates before
-        passing them into `pd.to_datetime()`
-    """
-    if len(date) in [7, 8]:
-        # "2021-M2" is transformed to '2020-01-01 00:00:01' by
-        # `pd.to_datetime`.
-        if date[:4].isdigit() and date[4] in ["-", ".", "/"] and date[5] == "M":
-
-            def modify_monthly_date(x: str) -> str:
-                year_number = int(x[:4])
-                month_number = x[6:]
-                num_days_in_month = calendar.monthrange(
-                    year_number, int(month_number)
-                )[1]
-                modified_x = f"{x[:4]}-{month_number}-{num_days_in_month}"
-                return modified_x
-
-            return "%Y-%m-%d", modify_monthly_date
-    return None
-
-
-def _shift_to_period_end(  # pylint: disable=too-many-return-statements
-    date: str,
-) -> Optional[Callable[[StrictDatetime], StrictDatetime]]:
-    """
-    Get function to shift the dates to the end of period.
-
-    :param date: string date
-    :return: a function to shift the dates to the end of period. If `None`, no
-        shift is needed
-    """
-
-    def shift_to_month_end(x: StrictDatetime) -> StrictDatetime:
-        return x + pd.offsets.MonthEnd(0)
-
-    def shift_to_quarter_end(x: StrictDatetime) -> StrictDatetime:
-        return x + pd.offsets.QuarterEnd(0)
-
-    def shift_to_year_end(x: StrictDatetime) -> StrictDatetime:
-        return x + pd.offsets.YearEnd(0)
-
-    if date[:4].isdigit():
-        if len(date) == 7:
-            if date[5:].isdigit():
-                # "2020-12" format.
-                return shift_to_month_end
-            if date[5] == "Q":
-                # "2021-Q1" format.
-                return shift_to_quarter_end
-        elif len(date) == 6:
-            # "2021Q1" format.
-            if date[4] == "Q":
-                return shift_to_quarter_end
-        elif len(date) == 4:
-            # "2021" format.
-            return shift_to_year_end
-    # "September 2020" or "Sep 2020" format.
-    # Get a flat list of month aliases. The full month name comes first.
-    # Since the `calendar` is using the natural month order, we need to
-    # shift the month aliases by one to get the correct order.
-    # E.g., `calendar.month_name[1:]` is `['January', 'February', ...]` and
-    # `calendar.month_abbr[1:]` is `['Jan', 'Feb', ...]`.
-    month_aliases = calendar.month_name[1:] + calendar.month_abbr[1:]
-    pattern = re.compile("|".join(month_aliases), re.IGNORECASE)
-    match = pattern.search(date)
-    if match is None:
-        return None
-    span = match.span()
-    date_without_month = f"{date[:span[0]]}{date[span[1]:]}".strip()
-    if len(date_without_month) == 4 and date_without_month.isdigit():
-        return shift_to_month_end
-    return None
-
-
-def _determine_date_format(
-    date: str, date_standard: Optional[str] = None
-) -> Optional[Tuple[str, Callable[[str], str]]]:
-    """
-    Determine date format for cases when `pd.to_datetime` fails.
-
-    :param date: date string
-    :param date_standard: "standard" or "ISO_8601", `None` defaults to
-        "standard"
-    :return: date format and a function to transform date strings before
-        converting them to datetime using `pd.to_datetime`
+    :return: datetime dates, `NaT` for the values that can't be converted
     """
+    hdbg.dassert_isinstance(dates, (pd.Series, pd.Index))
     date_standard = date_standard or "standard"
-    if date_standard == "standard":
-        year_format = "%Y"
-        week_format = "%W"
-        day_of_week_format = "%w"
-    elif date_standard == "ISO_8601":
-        year_format = "%G"
-        week_format = "%V"
-        day_of_week_format = "%u"
-    else:
+    if date_standard not in ("standard", "ISO_8601"):
         raise ValueError(f"Invalid `date_standard`='{date_standard}'")
-    # Determine format and original `date` modification function.
-    format_ = ""
-    if date[:4].isdigit():
-        format_ += year_format
-    elif date[0] == "Q" and len(date) == 7 and date[-4:].isdigit():
-        # "Q1 2020" format.
-
-        def modify_quarterly_data(x: str) -> str:
-            year_number = x[-4:]
-            quarter = int(x[1:2])
-            last_month_of_quarter = 3 * quarter
-            last_day_of_quarter = calendar.monthrange(
-                int(year_number), last_month_of_quarter
-            )[1]
-            modified_x = (
-                f"{year_number}-{last_month_of_quarter}-{last_day_of_quarter}"
+    # Convert each distinct value only once.
+    codes, unique_values = pd.factorize(dates)
+    unique_values = pd.Series(np.asarray(unique_values, dtype=object))
+    unique_dates = np.full(len(unique_values), np.datetime64("NaT", "ns"))
+    # Parse the values in the formats not supported by `pd.to_datetime()`.
+    is_parsed = np.zeros(len(unique_values), dtype=bool)
+    is_candidate = unique_values.map(type).eq(str).to_numpy()
+    is_candidate &= (
+        unique_values.str.len() <= _MAX_GENERALIZED_DATE_LENGTH
+    ).to_numpy()
+    is_candidate[is_candidate] = (
+        unique_values[is_candidate]
+        .str.match(_get_generalized_date_formats_regex())
+        .to_numpy(dtype=bool)
+    )
+    for format_name in _GENERALIZED_DATE_FORMATS:
+        if not is_candidate.any():
+            break
+        regex = _get_generalized_date_format_regex(format_name)
+        fields = unique_values[is_candidate].str.extract(regex)
+        is_match = fields["year"].notna().to_numpy()
+        if not is_match.any():
+            continue
+        _LOG.debug(
+            "Found %s values in format '%s'", is_match.sum(), format_name
+        )
+        idxs = np.flatnonzero(is_candidate)[is_match]
+        unique_dates[idxs] = _convert_generalized_date_fields(
+            fields[is_match], date_standard
+        )
+        is_parsed[idxs] = True
+        is_candidate[idxs] = False
+    # Parse the rest of the values with `pd.to_datetime()`.
+    datetime_dates = pd.DatetimeIndex(unique_dates)
+    if not is_parsed.all():
+        other_dates = _convert_with_inferred_formats(unique_values[~is_parsed])
+        if other_dates.tz is None:
+            unique_dates[~is_parsed] = other_dates.to_numpy(
+                dtype="datetime64[ns]"
+            )
+            datetime_dates = pd.DatetimeIndex(unique_dates)
+        else:
+            hdbg.dassert(
+                not is_parsed.any(),
+                "Timezone-aware dates can't be mixed with other formats",
             )
-            return modified_x
+            datetime_dates = other_dates
+    datetime_dates = datetime_dates.take(
+        codes, allow_fill=True, fill_value=pd.NaT
+    )
+    if isinstance(dates, pd.Series):
+        return pd.Series(datetime_dates, index=dates.index, name=dates.name)
+    return pd.DatetimeIndex(datetime_dates, name=dates.name)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_generalized_date_format_regex(format_name: str) -> "re.Pattern[str]":
+    """
+    Get the compiled regex for one of `_GENERALIZED_DATE_FORMATS`.
+    """
+    return re.compile(_GENERALIZED_DATE_FORMATS[format_name])
+
+
+@functools.lru_cache(maxsize=None)
+def _get_generalized_date_formats_regex() -> "re.Pattern[str]":
+    """
+    Get the compiled regex matching any of `_GENERALIZED_DATE_FORMATS`.
+
+    This is used to skip the values that are not in any of the formats with a
+    single pass.
+    """
+    # Named groups can't be repeated in a regex, so make them unnamed.
+    regexes = [
+        re.sub(r"\(\?P<\w+>", "(?:", regex)
+        for regex in _GENERALIZED_DATE_FORMATS.values()
+    ]
+    return re.compile("|".join(f"(?:{regex})" for regex in regexes))
+
+
+def _convert_generalized_date_fields(
+    fields: pd.DataFrame, date_standard: str
+) -> np.ndarray:
+    """
+    Convert date fields extracted with a `_GENERALIZED_DATE_FORMATS` regex.
 
-        format_ = f"{year_format}-%m-%d"
-        return format_, modify_quarterly_data
+    :param fields: df with the non-null named groups of one of the regexes
+        as columns, e.g., `year` and `quarter`
+    :param date_standard: "standard" or "ISO_8601"
+    :return: "datetime64[ns]" dates, `NaT` for invalid fields (e.g., month 13)
+    """
+    years = fields["year"].to_numpy(dtype=np.int64)
+    if "week" in fields:
+        weeks = fields["week"].to_numpy(dtype=np.int64)
+        return _get_week_end(years, weeks, date_standard)
+    if "bimonth" in fields:
+        # Bi-monthly dates are indexed by the start of the month starting
+        # with January, e.g., "2020-B2" -> "2020-03-01".
+        months = fields["bimonth"].to_numpy(dtype=np.int64) * 2 - 1
+        return _get_month_start(years, months)
+    if "month" in fields:
+        months = fields["month"].to_numpy(dtype=np.int64)
+    elif "month_name" in fields:
+        months = (
+            fields["month_name"].str.lower().map(_MONTH_NAME_TO_NUMBER)
+        ).to_numpy(dtype=np.int64)
+    elif "quarter" in fields:
+        months = fields["quarter"].to_numpy(dtype=np.int64) * 3
+    elif "half" in fields:
+        months = fields["half"].to_numpy(dtype=np.int64) * 6
     else:
-        _LOG.error("This format is not supported: '%s'", date)
-        return None
-    next_char = date[4]
-    if next_char in ["-", ".", "/", " "]:
-        if len(date) not in [7, 8]:
-            _LOG.error("This format is not supported: '%s'", date)
-            return None
-        format_ += "-"
-        next_char = date[5]
-        if next_char == "W":
-            # "2020-W14" format.
-
-            def modify_weekly_date(x: str) -> str:
-                x = re.sub(r"[//.\s]", "-", x)
-                return x + "-6"
-
-            date_modification_func = modify_weekly_date
-            format_ += f"W{week_format}-{day_of_week_format}"
-        elif next_char == "S":
-            # "2020-S1" - semi-annual format.
-            def modify_semiannual_date(x: str) -> str:
-                x = re.sub(r"[//.\s]", "-", x)
-                return x.replace("S1", "06-30").replace("S2", "12-31")
-
-            date_modification_func = modify_semiannual_date
-            format_ += "%m-%d"
-        elif next_char == "B":
-            # "2020-B1" - bi-monthly format (every other month).
-            # We'll index by the start of the month starting with January
-            # based on PiT.
-
-            def modify_bimonthly_date(x: str) -> str:
-                x = re.sub(r"[//.\s]", "-", x)
-                bimonth_number = x[6]
-                month_number = int(bimonth_number) * 2 - 1
-                modified_x = f"{x[:5]}{month_number}-01"
-                return modified_x
-
-            date_modification_func = modify_bimonthly_date
-            format_ += "%m-%d"
-        else:
-            _LOG.error("This format is not supported: '%s'", date)
-            return None
-    elif next_char == "M" and len(date) == 7:
-        # "1959M01" format.
-
-        def modify_monthly_date(x: str) -> str:
-            year_number = int(x[:4])
-            month_number = x[5:]
-            num_days_in_month = calendar.monthrange(
-                year_number, int(month_number)
-            )[1]
-            modified_x = f"{x[:4]}-{month_number}-{num_days_in_month}"
-            return modified_x
-
-        date_modification_func = modify_monthly_date
-        format_ += "-%m-%d"
+        months = np.full(len(years), 12)
+    month_starts = _get_month_start(years, months)
+    # Shift to the last day of the month.
+    month_ends = (
+        month_starts.astype("datetime64[M]") + 1
+    ).astype("datetime64[D]") - 1
+    return month_ends.astype("datetime64[ns]")
+
+
+def _get_month_start(years: np.ndarray, months: np.ndarray) -> np.ndarray:
+    """
+    Get the first days of the months as "datetime64[ns]".
+
+    :param years: year numbers
+    :param months: month numbers, the invalid ones are converted to `NaT`
+    """
+    is_valid = (months >= 1) & (months <= 12)
+    month_starts = ((years - 1970) * 12 + months - 1).astype("datetime64[M]")
+    month_starts = month_starts.astype("datetime64[ns]")
+    month_starts[~is_valid] = np.datetime64("NaT")
+    return month_starts
+
+
+def _get_week_end(
+    years: np.ndarray, weeks: np.ndarray, date_standard: str
+) -> np.ndarray:
+    """
+    Get the Saturdays of the weeks as "datetime64[ns]".
+
+    This is equivalent to parsing "2020-W14-6" with "%Y-W%W-%w" for the
+    "standard" date standard and with "%G-W%V-%u" for "ISO_8601".
+
+    :param years: year numbers
+    :param weeks: week numbers, the invalid ones are converted to `NaT`
+    :param date_standard: "standard" or "ISO_8601"
+    """
+    year_starts = (years - 1970).astype("datetime64[Y]").astype("datetime64[D]")
+    if date_standard == "standard":
+        # Week 1 starts on the first Monday of the year. Like `strptime()`,
+        # week 0 is counted from January 1st, also when it is a Monday.
+        weekdays = _get_weekday(year_starts)
+        first_mondays = np.where(
+            weeks == 0,
+            year_starts - weekdays + 7,
+            year_starts + (7 - weekdays) % 7,
+        )
+        is_valid = weeks <= 53
     else:
-        _LOG.error("This format is not supported: '%s'", date)
-        return None
-    return format_, date_modification_func
+        # Week 1 is the week that contains January 4th.
+        jan_4ths = year_starts + 3
+        first_mondays = jan_4ths - _get_weekday(jan_4ths)
+        is_valid = (weeks >= 1) & (weeks <= 53)
+    week_ends = first_mondays + (weeks - 1) * 7 + 5
+    week_ends = week_ends.astype("datetime64[ns]")
+    week_ends[~is_valid] = np.datetime64("NaT")
+    return week_ends
+
+
+def _get_weekday(dates: np.ndarray) -> np.ndarray:
+    """
+    Get the day of the week of "datetime64[D]" dates with Monday=0.
+    """
+    # 1970-01-01 is a Thursday.
+    return (dates.astype(np.int64) + 3) % 7
+
+
+def _convert_with_inferred_formats(values: pd.Series) -> pd.DatetimeIndex:
+    """
+    Convert values with `pd.to_datetime()`, one inferred format at a time.
+
+    `pd.to_datetime()` infers the format from the first value and coerces the
+    values in other formats to `NaT`, so the conversion is repeated on them
+    until no more values can be converted.
+
+    :param values: values to convert
+    :return: converted values, `NaT` for the ones that can't be converted
+    """
+    datetime_dates = pd.DatetimeIndex(
+        pd.to_datetime(values, errors="coerce")
+    )
+    is_nat = np.asarray(datetime_dates.isna())
+    while datetime_dates.tz is None and 0 < is_nat.sum() < len(values):
+        retry_dates = pd.DatetimeIndex(
+            pd.to_datetime(values[is_nat], errors="coerce")
+        )
+        is_retry_nat = np.asarray(retry_dates.isna())
+        if retry_dates.tz is not None or is_retry_nat.all():
+            break
+        datetime_dates = datetime_dates.to_numpy(dtype="datetime64[ns]")
+        datetime_dates[is_nat] = retry_dates.to_numpy(dtype="datetime64[ns]")
+        datetime_dates = pd.DatetimeIndex(datetime_dates)
+        is_nat[is_nat] = is_retry_nat
+    if is_nat.any():
+        _LOG.error(
+            "This format is not supported: '%s'", values[is_nat].iloc[0]
+        )
+    return datetime_dates
 
 
 # #############################################################################
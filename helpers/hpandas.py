@@ -564,12 +564,200 @@ def apply_columns_mode(
     return df1_copy, df2_copy
 
 
+def _has_fixed_step(offset: pd.DateOffset, timestamp: pd.Timestamp) -> bool:
+    """
+    Return whether the grid starting at `timestamp` has a fixed step in ns.
+
+    A day is not a fixed duration across a DST change and neither is any
+    other step in local time, so only the grids with a sub-daily frequency
+    and without a timezone or in UTC have a fixed step.
+    """
+    is_fixed_step = (
+        isinstance(offset, pd.offsets.Tick)
+        and not isinstance(offset, pd.offsets.Day)
+        and (timestamp.tz is None or timestamp.tzname() == "UTC")
+    )
+    return is_fixed_step
+
+
+def _get_grid_positions(
+    time_series: pd.Series,
+    start_timestamp: pd.Timestamp,
+    end_timestamp: pd.Timestamp,
+    freq: str,
+) -> Tuple[np.ndarray, int]:
+    """
+    Get the positions of the time series values in the grid of timestamps.
+
+    The grid is the one of `pd.date_range(start_timestamp, end_timestamp,
+    freq)`, which is built only when the grid has no fixed step (see
+    `_has_fixed_step()`), e.g., for "M", "D" or a timezone with DST.
+
+    :param time_series: timestamps or unix epochs in ms
+    :return:
+        - position of each value in the grid, or -1 for the values that are
+          not in the grid
+        - number of points in the grid
+    """
+    if pd.api.types.is_integer_dtype(time_series.dtype):
+        # Convert unix epochs in ms to nanoseconds, like
+        # `hdateti.convert_unix_epoch_to_timestamp()`.
+        values = pd.DatetimeIndex(
+            np.asarray(time_series, dtype=np.int64) * 1_000_000, tz="UTC"
+        )
+    else:
+        values = pd.DatetimeIndex(time_series)
+    hdbg.dassert_eq(
+        values.tz is None,
+        start_timestamp.tz is None,
+        "The time series and the interval should be both tz-aware or both "
+        "tz-naive",
+    )
+    offset = pd.tseries.frequencies.to_offset(freq)
+    if _has_fixed_step(offset, start_timestamp):
+        # Compute the positions from the distance to the start in
+        # nanoseconds, without building the grid.
+        step = offset.nanos
+        start_ns = start_timestamp.value
+        grid_size = max((end_timestamp.value - start_ns) // step + 1, 0)
+        offsets = values.as_unit("ns").asi8 - start_ns
+        positions, remainders = np.divmod(offsets, step)
+        is_in_grid = (offsets >= 0) & (remainders == 0) & (positions < grid_size)
+        if values.hasnans:
+            is_in_grid &= ~values.isna()
+        positions[~is_in_grid] = -1
+    else:
+        grid = pd.date_range(start=start_timestamp, end=end_timestamp, freq=freq)
+        positions = grid.get_indexer(values)
+        grid_size = len(grid)
+    return positions, grid_size
+
+
+def _find_gap_intervals(
+    positions: np.ndarray,
+    group_codes: np.ndarray,
+    num_groups: int,
+    grid_size: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find the intervals of grid positions without values for each group.
+
+    :param positions: grid position of each value, -1 for the values that
+        are not in the grid
+    :param group_codes: group of each value, in `[0, num_groups)`
+    :param num_groups: number of groups
+    :param grid_size: number of points in the grid
+    :return: group, first and last position of each gap, sorted by group and
+        position
+    """
+    if grid_size == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty
+    # Sort the values by group and position with a single key, removing the
+    # duplicates. The sort is skipped when the values are already in order,
+    # e.g., for a df sorted by asset and timestamp.
+    is_in_grid = positions >= 0
+    groups = group_codes[is_in_grid].astype(np.int64)
+    positions = positions[is_in_grid]
+    keys = positions
+    if num_groups > 1:
+        keys = groups * grid_size + positions
+    if (keys[1:] < keys[:-1]).any():
+        keys = np.sort(keys)
+        groups, positions = np.divmod(keys, grid_size)
+    is_first = np.ones(len(keys), dtype=bool)
+    is_first[1:] = keys[1:] != keys[:-1]
+    if not is_first.all():
+        groups = groups[is_first]
+        positions = positions[is_first]
+    del keys
+    # Find the gaps between consecutive values of the same group.
+    is_same_group = groups[1:] == groups[:-1]
+    is_gap = is_same_group & (positions[1:] - positions[:-1] > 1)
+    gap_groups = [groups[:-1][is_gap]]
+    gap_firsts = [positions[:-1][is_gap] + 1]
+    gap_lasts = [positions[1:][is_gap] - 1]
+    # Find the gaps before the first value and after the last value of each
+    # group.
+    is_group_start = np.ones(len(positions), dtype=bool)
+    is_group_start[1:] = ~is_same_group
+    is_group_end = np.ones(len(positions), dtype=bool)
+    is_group_end[:-1] = ~is_same_group
+    is_leading_gap = is_group_start & (positions > 0)
+    gap_groups.append(groups[is_leading_gap])
+    gap_firsts.append(np.zeros(is_leading_gap.sum(), dtype=np.int64))
+    gap_lasts.append(positions[is_leading_gap] - 1)
+    is_trailing_gap = is_group_end & (positions < grid_size - 1)
+    gap_groups.append(groups[is_trailing_gap])
+    gap_firsts.append(positions[is_trailing_gap] + 1)
+    gap_lasts.append(np.full(is_trailing_gap.sum(), grid_size - 1))
+    # The groups without values in the grid are a single gap.
+    is_empty_group = np.ones(num_groups, dtype=bool)
+    is_empty_group[groups] = False
+    empty_groups = np.flatnonzero(is_empty_group)
+    gap_groups.append(empty_groups)
+    gap_firsts.append(np.zeros(len(empty_groups), dtype=np.int64))
+    gap_lasts.append(np.full(len(empty_groups), grid_size - 1))
+    #
+    gap_groups = np.concatenate(gap_groups)
+    gap_firsts = np.concatenate(gap_firsts)
+    gap_lasts = np.concatenate(gap_lasts)
+    order = np.lexsort((gap_firsts, gap_groups))
+    return gap_groups[order], gap_firsts[order], gap_lasts[order]
+
+
+def _get_grid_timestamps(
+    positions: np.ndarray,
+    start_timestamp: pd.Timestamp,
+    end_timestamp: pd.Timestamp,
+    freq: str,
+) -> pd.DatetimeIndex:
+    """
+    Get the timestamps of the grid positions.
+
+    See `_get_grid_positions()` for the description of the grid.
+    """
+    offset = pd.tseries.frequencies.to_offset(freq)
+    if _has_fixed_step(offset, start_timestamp):
+        values = start_timestamp.value + positions * offset.nanos
+        timestamps = pd.DatetimeIndex(values, tz="UTC")
+        if start_timestamp.tz is None:
+            timestamps = timestamps.tz_localize(None)
+        else:
+            timestamps = timestamps.tz_convert(start_timestamp.tz)
+    else:
+        grid = pd.date_range(start=start_timestamp, end=end_timestamp, freq=freq)
+        timestamps = grid[positions]
+    return timestamps
+
+
+def _get_gap_intervals_df(
+    gap_firsts: np.ndarray,
+    gap_lasts: np.ndarray,
+    start_timestamp: pd.Timestamp,
+    end_timestamp: pd.Timestamp,
+    freq: str,
+) -> pd.DataFrame:
+    """
+    Build a df with the first and last timestamps and the size of each gap.
+    """
+    args = (start_timestamp, end_timestamp, freq)
+    gaps = pd.DataFrame(
+        {
+            "start_timestamp": _get_grid_timestamps(gap_firsts, *args),
+            "end_timestamp": _get_grid_timestamps(gap_lasts, *args),
+            "num_missing_points": gap_lasts - gap_firsts + 1,
+        }
+    )
+    return gaps
+
+
 def find_gaps_in_time_series(
     time_series: pd.Series,
     start_timestamp: pd.Timestamp,
     end_timestamp: pd.Timestamp,
     freq: str,
-) -> pd.Series:
+) -> pd.DatetimeIndex:
     """
     Find missing points on a time interval specified by [start_timestamp,
     end_timestamp], where point distribution is determined by <step>.
@@ -577,22 +765,114 @@ def find_gaps_in_time_series(
     If the passed time series is of a unix epoch format. It is
     automatically tranformed to pd.Timestamp.
 
+    To get the intervals of missing points, instead of every point, use
+    `find_gap_intervals_in_time_series()`.
+
     :param time_series: time series to find gaps in
     :param start_timestamp: start of the time interval to check
     :param end_timestamp: end of the time interval to check
     :param freq: distance between two data points on the interval.
         Aliases correspond to pandas.date_range's freq parameter, i.e.
         "S" -> second, "T" -> minute.
-    :return: pd.Series representing missing points in the source time
-        series.
-    """
-    _time_series = time_series
-    if str(time_series.dtype) in ["int32", "int64"]:
-        _time_series = _time_series.map(hdateti.convert_unix_epoch_to_timestamp)
-    correct_time_series = pd.date_range(
-        start=start_timestamp, end=end_timestamp, freq=freq
+    :return: missing points in the source time series
+    """
+    positions, grid_size = _get_grid_positions(
+        time_series, start_timestamp, end_timestamp, freq
+    )
+    group_codes = np.zeros(len(positions), dtype=np.int64)
+    _, gap_firsts, gap_lasts = _find_gap_intervals(
+        positions, group_codes, 1, grid_size
+    )
+    # Expand the gaps into the missing positions.
+    lengths = gap_lasts - gap_firsts + 1
+    offsets = np.cumsum(lengths) - lengths
+    missing_positions = np.repeat(gap_firsts - offsets, lengths) + np.arange(
+        lengths.sum()
+    )
+    return _get_grid_timestamps(
+        missing_positions, start_timestamp, end_timestamp, freq
+    )
+
+
+def find_gap_intervals_in_time_series(
+    time_series: pd.Series,
+    start_timestamp: pd.Timestamp,
+    end_timestamp: pd.Timestamp,
+    freq: str,
+) -> pd.DataFrame:
+    """
+    Find the intervals of missing points of a time series.
+
+    The points are the same as in `find_gaps_in_time_series()`, but the
+    missing points are not materialized, e.g.,
+    ```
+                 start_timestamp             end_timestamp  num_missing_points
+    0  2022-01-01 00:00:10+00:00 2022-01-01 00:00:12+00:00                   3
+    1  2022-01-01 00:01:00+00:00 2022-01-01 00:01:00+00:00                   1
+    ```
+
+    :param time_series: time series to find gaps in, see
+        `find_gaps_in_time_series()`
+    :param start_timestamp: start of the time interval to check
+    :param end_timestamp: end of the time interval to check
+    :param freq: distance between two data points on the interval
+    :return: first and last missing point and number of missing points of
+        each gap, sorted by time
+    """
+    positions, grid_size = _get_grid_positions(
+        time_series, start_timestamp, end_timestamp, freq
+    )
+    group_codes = np.zeros(len(positions), dtype=np.int64)
+    _, gap_firsts, gap_lasts = _find_gap_intervals(
+        positions, group_codes, 1, grid_size
+    )
+    gaps = _get_gap_intervals_df(
+        gap_firsts, gap_lasts, start_timestamp, end_timestamp, freq
+    )
+    return gaps
+
+
+def find_gap_intervals_by_asset(
+    df: pd.DataFrame,
+    ts_col_name: str,
+    asset_id_col_name: str,
+    start_timestamp: pd.Timestamp,
+    end_timestamp: pd.Timestamp,
+    freq: str,
+) -> pd.DataFrame:
+    """
+    Find the intervals of missing points of each asset in a long-format df.
+
+    The gaps of all the assets are found at once, without splitting the df.
+    Only the assets in the df are checked.
+
+    :param df: df with a row for each asset and timestamp
+    :param ts_col_name: name of the column with the timestamps or the unix
+        epochs
+    :param asset_id_col_name: name of the column with the asset ids
+    :param start_timestamp: start of the time interval to check
+    :param end_timestamp: end of the time interval to check
+    :param freq: distance between two data points on the interval
+    :return: asset id, first and last missing point and number of missing
+        points of each gap, sorted by asset id and time
+    """
+    hdbg.dassert_in(ts_col_name, df.columns)
+    hdbg.dassert_in(asset_id_col_name, df.columns)
+    hdbg.dassert(
+        not df[asset_id_col_name].isna().any(), "Asset ids can't be NaN"
     )
-    return correct_time_series.difference(_time_series)
+    group_codes, asset_ids = pd.factorize(df[asset_id_col_name], sort=True)
+    positions, grid_size = _get_grid_positions(
+        df[ts_col_name], start_timestamp, end_timestamp, freq
+    )
+    gap_groups, gap_firsts, gap_lasts = _find_gap_intervals(
+        positions, group_codes, len(asset_ids), grid_size
+    )
+    gaps = _get_gap_intervals_df(
+        gap_firsts, gap_lasts, start_timestamp, end_timestamp, freq
+    )
+    gaps.insert(0, asset_id_col_name, asset_ids.take(gap_groups))
+    return gaps
 
 
 def check_and_filter_matching_columns(
@@ -868,6 +1148,251 @@ def get_df_signature(df: pd.DataFrame, num_rows: int = 6) -> str:
 
 
 # #############################################################################
+# TrimIndex
+# #############################################################################
+
+
+# Max number of sorted runs of values (e.g., one per asset) to trim with a
+# binary search in each run, instead of sorting all the values.
+_MAX_NUM_SORTED_RUNS = 1000
+
+
+class TrimIndex:
+    """
+    Trim a dataframe using values in a column or in an index level.
+
+    The values are inspected once when building the object, so that it can be
+    reused to trim the same dataframe to many intervals, e.g., for rolling
+    windows:
+    ```
+    trim_index = hpandas.TrimIndex(df, "start_time")
+    for start_ts, end_ts in windows:
+        df_window = trim_index.trim(start_ts, end_ts, True, False)
+    ```
+
+    The trimming approach depends on the values:
+    - sorted values are trimmed with a binary search
+    - values made of few sorted runs (e.g., timestamps repeated for each
+      asset in a df sorted by asset and timestamp) are trimmed with a binary
+      search in each run
+    - other values are sorted once and trimmed with a binary search on the
+      sorted values, or compared with the interval boundaries at each
+      trimming if `sort_values=False`
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        ts_col_name: Optional[str],
+        *,
+        sort_values: bool = True,
+    ) -> None:
+        """
+        Constructor.
+
+        :param df: the dataframe to trim
+        :param ts_col_name: the name of the column or of the index level to
+            filter by; `None` means index
+        :param sort_values: whether to sort the values that are not sorted
+            (which is faster when trimming more than once) or to compare
+            them with the interval boundaries at each trimming
+        """
+        self._df = df
+        values = self._get_values(df, ts_col_name)
+        self._values = values
+        # Values as a numpy array to search in, without NaNs, for the modes
+        # other than "sorted".
+        self._keys: Optional[np.ndarray] = None
+        # Positions of the rows corresponding to `self._keys`; `None` means
+        # all the rows in order.
+        self._positions: Optional[np.ndarray] = None
+        # Bounds of the sorted runs of `self._keys`, i.e. the start of each
+        # run and the end of the last run.
+        self._run_bounds: Optional[np.ndarray] = None
+        if values.is_monotonic_increasing:
+            self._mode = "sorted"
+        else:
+            is_nan = np.asarray(values.isna())
+            if is_nan.any():
+                # Rows with NaNs are never in the interval.
+                self._positions = np.flatnonzero(~is_nan)
+                values = values[self._positions]
+            if isinstance(values, pd.DatetimeIndex) and values.tz is not None:
+                values = values.tz_convert(None)
+            keys = values.to_numpy()
+            is_run_start = keys[1:] < keys[:-1]
+            if np.count_nonzero(is_run_start) < _MAX_NUM_SORTED_RUNS:
+                self._mode = "sorted_runs"
+                self._run_bounds = np.concatenate(
+                    [[0], np.flatnonzero(is_run_start) + 1, [len(keys)]]
+                )
+            elif sort_values:
+                self._mode = "sorted_positions"
+                # The rows are put back in order after trimming, so the sort
+                # doesn't need to be stable.
+                order = np.argsort(keys)
+                keys = keys[order]
+                self._positions = (
+                    order if self._positions is None else self._positions[order]
+                )
+            else:
+                self._mode = "mask"
+            self._keys = keys
+        _LOG.debug("mode=%s", self._mode)
+
+    def trim(
+        self,
+        start_ts: Optional[pd.Timestamp],
+        end_ts: Optional[pd.Timestamp],
+        left_close: bool,
+        right_close: bool,
+    ) -> pd.DataFrame:
+        """
+        Trim the dataframe in the interval bounded by `start_ts` and `end_ts`.
+
+        See param description in `trim_df()`.
+        """
+        df = self._df
+        if df.empty:
+            # If the df is empty, there is nothing to trim.
+            return df
+        if start_ts is None and end_ts is None:
+            # If no boundaries are specified, there are no points of reference
+            # to trim to.
+            return df
+        if start_ts is not None and end_ts is not None:
+            # Confirm that the interval boundaries are valid.
+            hdateti.dassert_tz_compatible(start_ts, end_ts)
+            hdbg.dassert_lte(start_ts, end_ts)
+        # Compare with one value to raise the same error as comparing all the
+        # values, e.g., for a tz-naive boundary and tz-aware values.
+        for ts in (start_ts, end_ts):
+            if ts is not None:
+                _ = self._values[:1] <= ts
+        if self._mode == "sorted":
+            left_idx, right_idx = self._searchsorted(
+                self._values, start_ts, end_ts, left_close, right_close
+            )
+            return df.iloc[left_idx:right_idx]
+        hdbg.dassert_is_not(self._keys, None)
+        start_key = self._to_key(start_ts)
+        end_key = self._to_key(end_ts)
+        if self._mode == "sorted_runs":
+            hdbg.dassert_is_not(self._run_bounds, None)
+            num_runs = len(self._run_bounds) - 1
+            left_idxs = np.empty(num_runs, dtype=np.int64)
+            right_idxs = np.empty(num_runs, dtype=np.int64)
+            for run, (run_start, run_end) in enumerate(
+                zip(self._run_bounds[:-1], self._run_bounds[1:])
+            ):
+                left_idx, right_idx = self._searchsorted(
+                    self._keys[run_start:run_end],
+                    start_key,
+                    end_key,
+                    left_close,
+                    right_close,
+                )
+                left_idxs[run] = run_start + left_idx
+                right_idxs[run] = run_start + right_idx
+            # Concatenate the ranges of positions of all the runs.
+            lengths = right_idxs - left_idxs
+            offsets = np.cumsum(lengths) - lengths
+            positions = np.repeat(left_idxs - offsets, lengths) + np.arange(
+                lengths.sum()
+            )
+            if self._positions is not None:
+                positions = self._positions[positions]
+        elif self._mode == "mask":
+            mask = np.ones(len(self._keys), dtype=bool)
+            if start_key is not None:
+                mask &= (
+                    self._keys >= start_key
+                    if left_close
+                    else self._keys > start_key
+                )
+            if end_key is not None:
+                mask &= (
+                    self._keys <= end_key
+                    if right_close
+                    else self._keys < end_key
+                )
+            positions = np.flatnonzero(mask)
+            if self._positions is not None:
+                positions = self._positions[positions]
+        else:
+            hdbg.dassert_eq(self._mode, "sorted_positions")
+            left_idx, right_idx = self._searchsorted(
+                self._keys, start_key, end_key, left_close, right_close
+            )
+            # Keep the original order of the rows.
+            positions = np.sort(self._positions[left_idx:right_idx])
+        return df.iloc[positions]
+
+    def _to_key(self, ts: Optional[pd.Timestamp]) -> Any:
+        """
+        Convert an interval boundary to a value comparable with `self._keys`.
+        """
+        if ts is None or self._keys.dtype.kind != "M":
+            return ts
+        ts = pd.Timestamp(ts)
+        if ts.tz is not None:
+            ts = ts.tz_convert(None)
+        return ts.to_datetime64()
+
+    @staticmethod
+    def _get_values(df: pd.DataFrame, ts_col_name: Optional[str]) -> pd.Index:
+        """
+        Get the values to filter by.
+        """
+        if ts_col_name is None:
+            hdbg.dassert_eq(
+                df.index.nlevels,
+                1,
+                "Specify the index level to filter by with `ts_col_name`",
+            )
+            values = df.index
+        elif ts_col_name in df.columns:
+            values = pd.Index(df[ts_col_name])
+        else:
+            hdbg.dassert_in(
+                ts_col_name,
+                df.index.names,
+                "The name is neither a column nor an index level",
+            )
+            values = df.index.get_level_values(ts_col_name)
+        return values
+
+    @staticmethod
+    def _searchsorted(
+        values: Union[pd.Index, np.ndarray],
+        start_ts: Optional[pd.Timestamp],
+        end_ts: Optional[pd.Timestamp],
+        left_close: bool,
+        right_close: bool,
+    ) -> Tuple[int, int]:
+        """
+        Find the bounds of the interval in sorted values.
+
+        :return: the positions of the first value in the interval and of the
+            value after the last one
+        """
+        # Find the index corresponding to the left boundary of the interval.
+        if start_ts is not None:
+            side = "left" if left_close else "right"
+            left_idx = int(values.searchsorted(start_ts, side))
+        else:
+            # There is nothing to filter, so the left index is the first one.
+            left_idx = 0
+        # Find the index corresponding to the right boundary of the interval.
+        if end_ts is not None:
+            side = "right" if right_close else "left"
+            right_idx = int(values.searchsorted(end_ts, side))
+        else:
+            # There is nothing to filter, so the right index is the last one.
+            right_idx = len(values)
+        # The right index is before the left one when the interval is empty.
+        right_idx = max(left_idx, right_idx)
+        return left_idx, right_idx
 
 
 def trim_df(
@@ -883,8 +1408,11 @@ def trim_df(
 
     The dataframe is trimmed in the interval bounded by `start_ts` and `end_ts`.
 
+    To trim the same dataframe to many intervals, use `TrimIndex`.
+
     :param df: the dataframe to trim
-    :param ts_col_name: the name of the column; `None` means index
+    :param ts_col_name: the name of the column or of the index level; `None`
+        means index
     :param start_ts: the start boundary for trimming
     :param end_ts: the end boundary for trimming
     :param left_close: whether to include the start boundary of the interval
@@ -899,11 +1427,10 @@ def trim_df(
         _LOG.trace(
             df_to_str(df, print_dtypes=True, print_shape_info=True, tag="df")
         )
-    _LOG.debug(
-        hprint.to_str("ts_col_name start_ts end_ts left_close right_close")
-    )
-    if _TRACE:
-        _LOG.trace("df=\n%s", df_to_str(df))
+    if _LOG.isEnabledFor(logging.DEBUG):
+        _LOG.debug(
+            hprint.to_str("ts_col_name start_ts end_ts left_close right_close")
+        )
     if df.empty:
         # If the df is empty, there is nothing to trim.
         return df
@@ -912,62 +1439,10 @@ def trim_df(
         # to.
         return df
     num_rows_before = df.shape[0]
-    if start_ts is not None and end_ts is not None:
-        # Confirm that the interval boundaries are valid.
-        hdateti.dassert_tz_compatible(start_ts, end_ts)
-        hdbg.dassert_lte(start_ts, end_ts)
-    # Get the values to filter by.
-    if ts_col_name is None:
-        values_to_filter_by = pd.Series(df.index, index=df.index)
-    else:
-        hdbg.dassert_in(ts_col_name, df.columns)
-        values_to_filter_by = df[ts_col_name]
-    if values_to_filter_by.is_monotonic_increasing:
-        _LOG.trace("df is monotonic")
-        # The values are sorted; using the `pd.Series.searchsorted()` method.
-        # Find the index corresponding to the left boundary of the interval.
-        if start_ts is not None:
-            side = "left" if left_close else "right"
-            left_idx = values_to_filter_by.searchsorted(start_ts, side)
-        else:
-            # There is nothing to filter, so the left index is the first one.
-            left_idx = 0
-        _LOG.debug(hprint.to_str("start_ts left_idx"))
-        # Find the index corresponding to the right boundary of the interval.
-        if end_ts is not None:
-            side = "right" if right_close else "left"
-            right_idx = values_to_filter_by.searchsorted(end_ts, side)
-        else:
-            # There is nothing to filter, so the right index is None.
-            right_idx = df.shape[0]
-        _LOG.debug(hprint.to_str("end_ts right_idx"))
-        #
-        hdbg.dassert_lte(0, left_idx)
-        hdbg.dassert_lte(left_idx, right_idx)
-        hdbg.dassert_lte(right_idx, df.shape[0])
-        _LOG.debug(hprint.to_str("start_ts left_idx"))
-        if right_idx < df.shape[0]:
-            _LOG.debug(hprint.to_str("end_ts right_idx"))
-        df = df.iloc[left_idx:right_idx]
-    else:
-        _LOG.trace("df is not monotonic")
-        # The values are not sorted; using the `pd.Series.between` method.
-        if left_close and right_close:
-            inclusive = "both"
-        elif left_close:
-            inclusive = "left"
-        elif right_close:
-            inclusive = "right"
-        else:
-            inclusive = "neither"
-        epsilon = pd.DateOffset(minutes=1)
-        if start_ts is None:
-            start_ts = values_to_filter_by.min() - epsilon
-        if end_ts is None:
-            end_ts = values_to_filter_by.max() + epsilon
-        df = df[
-            values_to_filter_by.between(start_ts, end_ts, inclusive=inclusive)
-        ]
+    # Sorting the values to trim only once is slower than comparing them with
+    # the boundaries.
+    trim_index = TrimIndex(df, ts_col_name, sort_values=False)
+    df = trim_index.trim(start_ts, end_ts, left_close, right_close)
     # Report the changes.
     num_rows_after = df.shape[0]
     if num_rows_before != num_rows_after:
@@ -1004,24 +1479,31 @@ def merge_dfs(
             "threshold_col_name threshold intersecting_columns pd_merge_kwargs"
         )
     )
-    # Sanity check column types.
-    threshold_col1 = df1[threshold_col_name]
-    threshold_col2 = df2[threshold_col_name]
-    only_first_elem = False
+    # Compute the unique values with a hash table, so that the checks below
+    # don't iterate over all the elements.
+    threshold_unique_values1 = pd.Series(df1[threshold_col_name].unique())
+    threshold_unique_values2 = pd.Series(df2[threshold_col_name].unique())
+    hdbg.dassert_lte(1, len(threshold_unique_values1))
+    hdbg.dassert_lte(1, len(threshold_unique_values2))
+    # Sanity check column types. The elements of a column with a non-object
+    # dtype have all the same type, so it's enough to check the first one.
+    only_first_elem = not any(
+        pd.api.types.is_object_dtype(unique_values)
+        or isinstance(unique_values.dtype, pd.CategoricalDtype)
+        for unique_values in [threshold_unique_values1, threshold_unique_values2]
+    )
     hdbg.dassert_array_has_same_type_element(
-        threshold_col1, threshold_col2, only_first_elem
+        threshold_unique_values1, threshold_unique_values2, only_first_elem
     )
     # TODO(Grisha): @Dan Implement asserts for each asset id.
     # Check that an overlap of unique values is above the specified threshold.
-    threshold_unique_values1 = set(threshold_col1)
-    threshold_unique_values2 = set(threshold_col2)
-    threshold_common_values = set(threshold_unique_values1) & set(
+    num_threshold_common_values = threshold_unique_values1.isin(
         threshold_unique_values2
-    )
-    threshold_common_values_share1 = len(threshold_common_values) / len(
+    ).sum()
+    threshold_common_values_share1 = num_threshold_common_values / len(
         threshold_unique_values1
     )
-    threshold_common_values_share2 = len(threshold_common_values) / len(
+    threshold_common_values_share2 = num_threshold_common_values / len(
         threshold_unique_values2
     )
     hdbg.dassert_lte(threshold, threshold_common_values_share1)
@@ -1046,40 +1528,187 @@ def merge_dfs(
     return res_df
 
 
+def _get_group_ids(values: List[Union[pd.Series, pd.Index]]) -> np.ndarray:
+    """
+    Get an id for each row identifying the combination of its values.
+
+    NaNs are equal to each other, without filling them in a copy.
+
+    :param values: the values of the key columns, all with the same length
+    :return: group ids, equal for rows with equal values
+    """
+    hdbg.dassert_lte(1, len(values))
+    group_ids = np.zeros(len(values[0]), dtype=np.int64)
+    num_groups = 1
+    for col_values in values:
+        codes, uniques = pd.factorize(col_values)
+        # NaNs get the code -1, so shift the codes to make NaNs a value.
+        num_codes = len(uniques) + 1
+        if num_groups * num_codes > np.iinfo(np.int64).max:
+            # Renumber the groups densely to avoid overflowing.
+            group_ids, group_uniques = pd.factorize(group_ids)
+            num_groups = len(group_uniques)
+        group_ids = group_ids * num_codes + (codes + 1)
+        num_groups *= num_codes
+    return group_ids
+
+
+def _get_row_hashes(values: List[Union[pd.Series, pd.Index]]) -> np.ndarray:
+    """
+    Hash the values of each row.
+
+    Equal values, including NaNs, have equal hashes, but different values can
+    also have equal hashes.
+
+    :param values: the values of the key columns, all with the same length
+    :return: a hash for each row
+    """
+    row_hashes = np.zeros(len(values[0]), dtype=np.uint64)
+    for col_values in values:
+        col_values = pd.Series(col_values, copy=False)
+        if col_values.dtype == object:
+            # Numbering Python objects is faster than hashing them.
+            col_values = pd.Series(pd.factorize(col_values)[0])
+        elif col_values.dtype.kind == "f":
+            # Hash all the NaNs with the same bits, since e.g. `inf - inf` has
+            # the sign bit set, and -0.0 as 0.0.
+            float_values = col_values.to_numpy(dtype=np.float64, na_value=np.nan)
+            col_values = pd.Series(
+                np.where(np.isnan(float_values), np.nan, float_values + 0.0)
+            )
+        col_hashes = pd.util.hash_pandas_object(
+            col_values, index=False, categorize=False
+        ).to_numpy()
+        # Combine the hashes in a way that depends on the column order.
+        row_hashes = row_hashes * np.uint64(1_000_003) ^ col_hashes
+    return row_hashes
+
+
+def _get_group_codes(values: List[Union[pd.Series, pd.Index]]) -> np.ndarray:
+    """
+    Number the distinct combinations of values of the rows.
+
+    The rows are hashed in one pass and the rows with the same hash are
+    checked to have equal values, falling back to comparing the values column
+    by column in case of hash collisions.
+
+    :param values: the values of the key columns, all with the same length
+    :return: codes in the order of first appearance, equal for rows with
+        equal values (including NaNs)
+    """
+    group_codes, _ = pd.factorize(_get_row_hashes(values))
+    # Compare the values of each row with the first row of its group.
+    is_first = _is_first_occurrence(group_codes)
+    idxs = np.flatnonzero(~is_first)
+    first_idxs = np.flatnonzero(is_first)[group_codes[idxs]]
+    for col_values in values:
+        col_values = np.asarray(col_values)
+        vals = col_values[idxs]
+        first_vals = col_values[first_idxs]
+        is_equal = (vals == first_vals) | (pd.isna(vals) & pd.isna(first_vals))
+        if not is_equal.all():
+            _LOG.debug("Found hash collisions: comparing the values")
+            group_codes, _ = pd.factorize(_get_group_ids(values))
+            break
+    return group_codes
+
+
+def _is_first_occurrence(group_codes: np.ndarray) -> np.ndarray:
+    """
+    Find the first row of each group numbered in order of first appearance.
+
+    Since the codes are in order of first appearance, the first row of each
+    group is where the running max of the codes increases.
+    """
+    running_max = np.maximum.accumulate(group_codes)
+    is_first = np.empty(len(group_codes), dtype=bool)
+    is_first[:1] = True
+    is_first[1:] = running_max[1:] > running_max[:-1]
+    return is_first
+
+
+def get_duplicated_mask(
+    df: pd.DataFrame,
+    *,
+    subset: Optional[List[str]] = None,
+    use_index: bool = False,
+    control_column: Optional[str] = None,
+) -> np.ndarray:
+    """
+    Find the duplicated rows of a df.
+
+    NaNs are considered equal to each other.
+
+    :param df: df to process
+    :param subset: columns identifying duplicates, `None` for all
+    :param use_index: whether to use also the index values to identify
+        duplicates
+    :param control_column: column the max value of which determines the
+        kept row among duplicates; `None` keeps the first row
+    :return: boolean mask of the rows to drop, with one kept row for each set
+        of duplicates
+    """
+    if subset is None:
+        subset = df.columns.tolist()
+    hdbg.dassert_isinstance(subset, list)
+    hdbg.dassert_is_subset(subset, df.columns)
+    values = [df[col_name] for col_name in subset]
+    if use_index:
+        values = [
+            df.index.get_level_values(level) for level in range(df.index.nlevels)
+        ] + values
+    if not values:
+        # There are no values to compare, so all the rows are equal.
+        is_duplicated = np.ones(len(df), dtype=bool)
+        is_duplicated[:1] = False
+        return is_duplicated
+    group_codes = _get_group_codes(values)
+    if control_column is None:
+        return ~_is_first_occurrence(group_codes)
+    # Find the rows with the max value of the control column in each group,
+    # using NaNs only for the groups without other values. Only the groups
+    # with duplicates need to be processed.
+    hdbg.dassert_in(control_column, df.columns)
+    is_duplicated = np.zeros(len(df), dtype=bool)
+    group_sizes = np.bincount(group_codes)
+    idxs = np.flatnonzero(group_sizes[group_codes] > 1)
+    if idxs.size == 0:
+        return is_duplicated
+    group_codes = group_codes[idxs]
+    control_values = df[control_column].iloc[idxs].reset_index(drop=True)
+    group_max = control_values.groupby(group_codes, sort=False).transform("max")
+    is_max = (control_values == group_max) | group_max.isna()
+    # Keep the first row with the max value of each group.
+    max_idxs = np.flatnonzero(is_max.to_numpy())
+    is_first_max = ~pd.Series(group_codes[max_idxs]).duplicated(keep="first")
+    is_duplicated[idxs] = True
+    is_duplicated[idxs[max_idxs[is_first_max.to_numpy()]]] = False
+    return is_duplicated
+
+
 # TODO(gp): Is this (ironically) a duplicate of drop_duplicates?
 def drop_duplicated(
     df: pd.DataFrame, *, subset: Optional[List[str]] = None
 ) -> pd.DataFrame:
     """
     Implement `df.duplicated` but considering also the index and ignoring nans.
+
+    NaNs are considered equal to each other. The input df is not modified.
     """
-    _LOG.debug("before df=\n%s", df_to_str(df))
-    # Move the index to the df.
-    old_index_name = df.index.name
-    new_index_name = "_index.tmp"
-    hdbg.dassert_not_in(new_index_name, df.columns)
-    df.index.name = new_index_name
-    df.reset_index(drop=False, inplace=True)
-    # Remove duplicates by ignoring nans.
-    if subset is not None:
-        hdbg.dassert_isinstance(subset, list)
-        subset = [new_index_name] + subset
-    duplicated = df.fillna(0.0).duplicated(subset=subset, keep="first")
+    is_duplicated = get_duplicated_mask(df, subset=subset, use_index=True)
     # Report the result of the operation.
-    if duplicated.sum() > 0:
+    num_duplicated = int(is_duplicated.sum())
+    if num_duplicated > 0:
+        if _LOG.isEnabledFor(logging.DEBUG):
+            _LOG.debug(
+                "Removing duplicates df=\n%s", df_to_str(df[is_duplicated])
+            )
         num_rows_before = df.shape[0]
-        _LOG.debug("Removing duplicates df=\n%s", df_to_str(df.loc[duplicated]))
-        df = df.loc[~duplicated]
-        num_rows_after = df.shape[0]
+        df = df[~is_duplicated]
         _LOG.warning(
             "Removed repeated rows num_rows=%s",
-            hprint.perc(num_rows_before - num_rows_after, num_rows_before),
+            hprint.perc(num_duplicated, num_rows_before),
         )
-    _LOG.debug("after removing duplicates df=\n%s", df_to_str(df))
-    # Set the index back.
-    df.set_index(new_index_name, inplace=True)
-    df.index.name = old_index_name
-    _LOG.debug("after df=\n%s", df_to_str(df))
     return df
 
 
@@ -1150,6 +1779,22 @@ def _display(log_level: int, df: pd.DataFrame) -> None:
         display(df)
 
 
+def _handle_signed_zeros(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return `df` with `-0.0` converted to `0.0` in the float columns.
+    """
+    float_col_names = df.select_dtypes(include=[np.float64, float]).columns
+    if float_col_names.empty:
+        return df
+    # Replace the columns without writing into the data of the input df.
+    df = df.copy(deep=False)
+    for col_name in float_col_names:
+        # Adding `0.0` turns `-0.0` into `0.0` and leaves the other values
+        # unchanged.
+        df[col_name] = df[col_name] + 0.0
+    return df
+
+
 def _df_to_str(
     df: pd.DataFrame,
     num_rows: Optional[int],
@@ -1160,9 +1805,23 @@ def _df_to_str(
     display_width: int,
     use_tabulate: bool,
     log_level: int,
+    *,
+    handle_signed_zeros: bool = False,
 ) -> str:
     is_in_ipynb = hsystem.is_running_in_ipynb()
     out = []
+    # Select the rows to display before formatting, so that the cost doesn't
+    # depend on the number of rows of the df.
+    is_sliced = num_rows is not None and df.shape[0] > num_rows
+    if is_sliced:
+        nr = num_rows // 2
+        head_df = df.head(nr)
+        tail_df = df.tail(nr)
+        if handle_signed_zeros:
+            head_df = _handle_signed_zeros(head_df)
+            tail_df = _handle_signed_zeros(tail_df)
+    elif handle_signed_zeros:
+        df = _handle_signed_zeros(df)
     # Set dataframe print options.
     with pd.option_context(
         "display.max_colwidth",
@@ -1180,11 +1839,14 @@ def _df_to_str(
         if use_tabulate:
             import tabulate
 
-            out.append(tabulate.tabulate(df, headers="keys", tablefmt="psql"))
+            tabulate_df = pd.concat([head_df, tail_df]) if is_sliced else df
+            out.append(
+                tabulate.tabulate(tabulate_df, headers="keys", tablefmt="psql")
+            )
         # TODO(Grisha): Add an option to display all rows since if `num_rows`
         # is `None`, only first and last 5 rows are displayed. Consider using
         # `df.to_string()` instead of `str(df)`.
-        if num_rows is None or df.shape[0] <= num_rows:
+        if not is_sliced:
             # Print the entire data frame.
             if not is_in_ipynb:
                 out.append(str(df))
@@ -1192,12 +1854,11 @@ def _df_to_str(
                 # Display dataframe.
                 _display(log_level, df)
         else:
-            nr = num_rows // 2
             if not is_in_ipynb:
                 # Print top and bottom of df.
-                out.append(str(df.head(nr)))
+                out.append(str(head_df))
                 out.append("...")
-                tail_str = str(df.tail(nr))
+                tail_str = str(tail_df)
                 # Remove index and columns from tail_df.
                 skipped_rows = 1
                 if df.index.name:
@@ -1208,11 +1869,11 @@ def _df_to_str(
                 # TODO(gp): @all use this approach also above and update all the
                 #  unit tests.
                 df = [
-                    df.head(nr),
+                    head_df,
                     pd.DataFrame(
                         [["..."] * df.shape[1]], index=[" "], columns=df.columns
                     ),
-                    df.tail(nr),
+                    tail_df,
                 ]
                 df = pd.concat(df)
                 # Display dataframe.
@@ -1281,11 +1942,8 @@ def df_to_str(
         df = df.to_frame(index=False)
     hdbg.dassert_isinstance(df, pd.DataFrame)
     # For some reason there are so-called "negative zeros", but we consider
-    # them equal to `0.0`.
-    df = df.copy()
-    if handle_signed_zeros:
-        for col_name in df.select_dtypes(include=[np.float64, float]).columns:
-            df[col_name] = df[col_name].where(df[col_name] != -0.0, 0.0)
+    # them equal to `0.0`. They are converted only in the displayed values, to
+    # avoid copying the entire df.
     out = []
     # Print the tag.
     if tag is not None:
@@ -1315,6 +1973,12 @@ def df_to_str(
                 """
                 row: List[Any] = []
                 first_elem = srs.values[0]
+                if (
+                    handle_signed_zeros
+                    and isinstance(srs, pd.Series)
+                    and srs.dtype == np.float64
+                ):
+                    first_elem += 0.0
                 num_unique = srs.nunique()
                 num_nans = srs.isna().sum()
                 row.extend(
@@ -1401,11 +2065,13 @@ def df_to_str(
         # Print info about nans.
         if print_nan_info:
             num_elems = df.shape[0] * df.shape[1]
-            num_nans = df.isna().sum().sum()
+            # Compute the NaN mask once.
+            is_nan = df.isna().to_numpy()
+            num_nans = is_nan.sum()
             txt = f"num_nans={hprint.perc(num_nans, num_elems)}"
             out.append(txt)
             #
-            num_zeros = df.isnull().sum().sum()
+            num_zeros = num_nans
             txt = f"num_zeros={hprint.perc(num_zeros, num_elems)}"
             out.append(txt)
             # TODO(gp): np can't do isinf on objects like strings.
@@ -1413,11 +2079,12 @@ def df_to_str(
             # txt = "num_infinite=%s" % hprint.perc(num_infinite, num_elems)
             # out.append(txt)
             #
-            num_nan_rows = df.dropna().shape[0]
+            # Count the rows and the columns without NaNs, like `dropna()`.
+            num_nan_rows = int((~is_nan.any(axis=1)).sum())
             txt = f"num_nan_rows={hprint.perc(num_nan_rows, num_elems)}"
             out.append(txt)
             #
-            num_nan_cols = df.dropna(axis=1).shape[1]
+            num_nan_cols = int((~is_nan.any(axis=0)).sum())
             txt = f"num_nan_cols={hprint.perc(num_nan_cols, num_elems)}"
             out.append(txt)
     if hsystem.is_running_in_ipynb():
@@ -1435,6 +2102,7 @@ def df_to_str(
         display_width,
         use_tabulate,
         log_level,
+        handle_signed_zeros=handle_signed_zeros,
     )
     if not hsystem.is_running_in_ipynb():
         out.append(df_as_str)
@@ -1869,15 +2537,65 @@ def get_df_from_iterator(
     """
     Concat all the dataframes in the iterator in one dataframe.
 
+    The columns of each dataframe are copied as it is consumed, so that the
+    dataframe can be freed, and then combined one column at a time. In this
+    way the peak memory is close to the size of the output.
+
+    The index is sorted with a stable sort that merges the sorted runs, e.g.,
+    one for each dataframe, and is skipped when the dataframes are already in
+    order, e.g., tiles of consecutive periods.
+
     :param iter_: dataframe iterator
     :param sort_index: whether to sort output index or not
     :return: combined iterator data
     """
     # TODO(gp): @all make a copy of `iter_` so we don't consume it.
-    dfs = list(iter_)
-    df_res = pd.concat(dfs)
-    if sort_index:
-        df_res = df_res.sort_index()
+    indices = []
+    columns = []
+    dfs_values: List[List[Optional[pd.Series]]] = []
+    for df in iter_:
+        indices.append(df.index)
+        columns.append(df.columns)
+        dfs_values.append([col.copy() for _, col in df.items()])
+    if not dfs_values:
+        # Raise the same error as `pd.concat()`.
+        return pd.concat([])
+    if not all(columns_.equals(columns[0]) for columns_ in columns):
+        # The columns need to be aligned, so use `pd.concat()`.
+        _LOG.debug("The dfs have different columns")
+        dfs = []
+        for index, columns_ in zip(indices, columns):
+            df = pd.DataFrame(dict(enumerate(dfs_values.pop(0))), copy=False)
+            df.index = index
+            df.columns = columns_
+            dfs.append(df)
+        df_res = pd.concat(dfs)
+        if sort_index:
+            df_res = df_res.sort_index(kind="stable")
+        return df_res
+    index = indices[0].append(indices[1:])
+    del indices
+    order = None
+    if sort_index and not index.is_monotonic_increasing:
+        if isinstance(index, pd.MultiIndex):
+            order = index.argsort()
+        else:
+            # Timsort merges the sorted runs.
+            order = index.argsort(kind="stable")
+        index = index.take(order)
+    # Combine the pieces of each column, freeing them.
+    values = {}
+    for col_idx in range(len(columns[0])):
+        pieces = [df_values[col_idx] for df_values in dfs_values]
+        for df_values in dfs_values:
+            df_values[col_idx] = None
+        col_values = pd.concat(pieces, ignore_index=True, copy=False).array
+        del pieces
+        if order is not None:
+            col_values = col_values.take(order)
+        values[col_idx] = col_values
+    df_res = pd.DataFrame(values, index=index, copy=False)
+    df_res.columns = columns[0]
     return df_res
 
 
@@ -1925,6 +2643,189 @@ def compare_nans_in_dataframes(
     return nan_diff_df
 
 
+def _get_common_rows(
+    df1: pd.DataFrame, df2: pd.DataFrame
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Keep the rows with an index present in both dataframes, in `df1` order.
+
+    The rows can be reordered only if the index of the common rows is unique.
+    """
+    index1 = df1.index
+    index2 = df2.index
+    if (
+        index1.is_monotonic_increasing
+        and index2.is_monotonic_increasing
+        and index1.is_unique
+        and index2.is_unique
+    ):
+        # Merge the sorted indices.
+        _, indexer1, indexer2 = index1.join(
+            index2, how="inner", return_indexers=True
+        )
+        # An indexer is `None` when all the rows are kept.
+        if indexer1 is not None:
+            df1 = df1.iloc[indexer1]
+        if indexer2 is not None:
+            df2 = df2.iloc[indexer2]
+    else:
+        df1 = df1[index1.isin(index2)]
+        df2 = df2[index2.isin(index1)]
+        if not df2.index.equals(df1.index):
+            # The rows can't be aligned on duplicated labels.
+            dassert_unique_index(df1, "Can't align the rows of df1")
+            dassert_unique_index(df2, "Can't align the rows of df2")
+            df2 = df2.reindex(df1.index)
+    return df1, df2
+
+
+def _round_close_to_zero(df: pd.DataFrame, threshold: float) -> pd.DataFrame:
+    """
+    Round the float values with an absolute value below `threshold` to 0.
+    """
+    is_float = [pd.api.types.is_float_dtype(dtype) for dtype in df.dtypes]
+    float_cols = df.columns[is_float]
+    if float_cols.empty:
+        return df
+    values = df[float_cols].to_numpy()
+    mask = np.abs(values) < threshold
+    if mask.any():
+        # Keep the sign of the zeros as `round()` does.
+        df = df.copy()
+        df[float_cols] = np.where(mask, np.round(values), values)
+    return df
+
+
+def _get_is_close_mask(
+    values1: np.ndarray,
+    values2: np.ndarray,
+    diff: np.ndarray,
+    *,
+    rtol: float = 1e-5,
+    atol: float = 1e-8,
+) -> np.ndarray:
+    """
+    Return where the values are equal with the tolerance of
+    `pd.testing.assert_frame_equal()`.
+
+    The values are equal when both are NaN, they are the same infinity or
+    `|values1 - values2| <= max(rtol * max(|values1|, |values2|), atol)`.
+
+    :param diff: `values1 - values2`
+    """
+    is_close = values1 == values2
+    is_close |= np.isnan(values1) & np.isnan(values2)
+    # Apply the tolerance only to the values that are not exactly equal.
+    is_diff = ~is_close
+    if is_diff.any():
+        values1 = values1[is_diff]
+        values2 = values2[is_diff]
+        with np.errstate(invalid="ignore", over="ignore"):
+            tolerance = np.maximum(
+                rtol * np.maximum(np.abs(values1), np.abs(values2)), atol
+            )
+            is_close[is_diff] = np.abs(diff[is_diff]) <= tolerance
+    return is_close
+
+
+def _get_top_diffs_str(
+    df1: pd.DataFrame,
+    values1: np.ndarray,
+    values2: np.ndarray,
+    is_diff: np.ndarray,
+    diff: np.ndarray,
+    diff_name: str,
+    num_diffs: int,
+    log_level: int,
+) -> str:
+    """
+    Report the different cells with the largest absolute difference.
+
+    Only `num_diffs` cells per column are ranked, so that reporting doesn't
+    depend on the number of different cells.
+
+    :param df1: dataframe with the index and the columns of the values
+    :param values1, values2: values to compare
+    :param is_diff: mask of the different cells
+    :param diff: difference between the cells, NaN when only one value is
+        NaN
+    :param diff_name: name of the difference, e.g., "diff"
+    :param num_diffs: number of cells to report
+    """
+    # Report first the cells where only one value is NaN.
+    score = np.abs(diff)
+    score[np.isnan(score)] = np.inf
+    candidates = []
+    for col_idx in range(is_diff.shape[1]):
+        row_idxs = np.flatnonzero(is_diff[:, col_idx])
+        if row_idxs.size > num_diffs:
+            top_idxs = np.argpartition(
+                -score[row_idxs, col_idx], num_diffs - 1
+            )[:num_diffs]
+            row_idxs = np.sort(row_idxs[top_idxs])
+        candidates.extend(
+            (-score[row_idx, col_idx], col_idx, row_idx) for row_idx in row_idxs
+        )
+    # Sort by decreasing score and then by position.
+    candidates = sorted(candidates)[:num_diffs]
+    col_idxs = np.array([col_idx for _, col_idx, _ in candidates], dtype=int)
+    row_idxs = np.array([row_idx for _, _, row_idx in candidates], dtype=int)
+    top_diffs = pd.DataFrame(
+        {
+            "column": df1.columns[col_idxs],
+            "df1": values1[row_idxs, col_idxs],
+            "df2": values2[row_idxs, col_idxs],
+            diff_name: diff[row_idxs, col_idxs],
+        },
+        index=df1.index[row_idxs],
+    )
+    num_diff_cells = int(is_diff.sum())
+    txt = (
+        f"{num_diff_cells} / {is_diff.size} cells are different, top"
+        f" {len(top_diffs)} by absolute {diff_name}:\n"
+        + df_to_str(top_diffs, num_rows=None, log_level=log_level)
+    )
+    return txt
+
+
+def are_dfs_equal(
+    df1: pd.DataFrame,
+    df2: pd.DataFrame,
+    *,
+    rtol: float = 1e-5,
+    atol: float = 1e-8,
+    chunk_size_in_rows: int = 100_000,
+) -> bool:
+    """
+    Return whether two numeric dataframes with the same rows and columns are
+    equal, within a tolerance.
+
+    The values are compared as in `compare_dfs()`, but the comparison stops at
+    the first chunk of rows with a difference.
+
+    :param rtol, atol: relative and absolute tolerance, as in
+        `pd.testing.assert_frame_equal()`
+    :param chunk_size_in_rows: number of rows compared at once
+    """
+    dassert_indices_equal(df1, df2)
+    hdbg.dassert_eq(sorted(df1.columns), sorted(df2.columns))
+    hdbg.dassert_lte(1, chunk_size_in_rows)
+    if not df2.columns.equals(df1.columns):
+        df2 = df2[df1.columns]
+    for start in range(0, df1.shape[0], chunk_size_in_rows):
+        end = start + chunk_size_in_rows
+        values1 = df1.iloc[start:end].to_numpy(dtype=float, na_value=np.nan)
+        values2 = df2.iloc[start:end].to_numpy(dtype=float, na_value=np.nan)
+        with np.errstate(invalid="ignore", over="ignore"):
+            diff = values1 - values2
+        is_close = _get_is_close_mask(
+            values1, values2, diff, rtol=rtol, atol=atol
+        )
+        if not is_close.all():
+            return False
+    return True
+
+
 # TODO(Grisha): -> `compare_dataframes()`?
 def compare_dfs(
     df1: pd.DataFrame,
@@ -1941,15 +2842,19 @@ def compare_dfs(
     remove_inf: bool = True,
     log_level: int = logging.DEBUG,
     only_warning: bool = True,
+    num_diffs_to_report: int = 10,
 ) -> pd.DataFrame:
     """
     Compare two dataframes.
 
     This works for dataframes with and without multi-index.
 
+    Use `are_dfs_equal()` when only a yes / no answer is needed.
+
     :param row_mode: control how the rows are handled
         - "equal": rows need to be the same for the two dataframes
-        - "inner": compute the common rows for the two dataframes
+        - "inner": compute the common rows for the two dataframes, in the
+          order of `df1`
     :param column_mode: same as `row_mode`
     :param compare_nans: include NaN comparison if True otherwise just
         compare non-NaN values
@@ -1966,10 +2871,13 @@ def compare_dfs(
     :param remove_inf: replace +-inf with `np.nan`
     :param log_level: logging level
     :param only_warning: when `True` the function issues a warning instead of aborting
+    :param num_diffs_to_report: number of different cells to report when the
+        dataframes are not equal
     :return: a singe dataframe with differences as values
     """
     hdbg.dassert_isinstance(df1, pd.DataFrame)
     hdbg.dassert_isinstance(df2, pd.DataFrame)
+    hdbg.dassert_lte(1, num_diffs_to_report)
     # Check value of `assert_diff_threshold`, if it was passed.
     if assert_diff_threshold:
         hdbg.dassert_lte(assert_diff_threshold, 1.0)
@@ -1979,10 +2887,7 @@ def compare_dfs(
     if row_mode == "equal":
         dassert_indices_equal(df1, df2)
     elif row_mode == "inner":
-        # TODO(gp): Add sorting on demand, otherwise keep the columns in order.
-        same_rows = list((set(df1.index)).intersection(set(df2.index)))
-        df1 = df1[df1.index.isin(same_rows)]
-        df2 = df2[df2.index.isin(same_rows)]
+        df1, df2 = _get_common_rows(df1, df2)
     else:
         raise ValueError(f"Invalid row_mode='{row_mode}'")
     #
@@ -1996,78 +2901,101 @@ def compare_dfs(
     else:
         raise ValueError(f"Invalid column_mode='{column_mode}'")
     # Round small numbers to 0 to exclude them from the diff computation.
-    close_to_zero_threshold_mask = lambda x: abs(x) < close_to_zero_threshold
-    df1[close_to_zero_threshold_mask] = df1[close_to_zero_threshold_mask].round(0)
-    df2[close_to_zero_threshold_mask] = df2[close_to_zero_threshold_mask].round(0)
-    # Compute the difference df.
+    df1 = _round_close_to_zero(df1, close_to_zero_threshold)
+    df2 = _round_close_to_zero(df2, close_to_zero_threshold)
+    # Compute the difference once on the aligned values.
+    is_aligned = df2.columns.equals(df1.columns)
+    df2_aligned = df2 if is_aligned else df2[df1.columns]
+    values1 = df1.to_numpy(dtype=float, na_value=np.nan)
+    values2 = df2_aligned.to_numpy(dtype=float, na_value=np.nan)
+    with np.errstate(invalid="ignore", over="ignore"):
+        diff = values1 - values2
     if diff_mode == "diff":
-        # Test and convert the assertion into a boolean.
-        is_ok = True
-        try:
-            pd.testing.assert_frame_equal(
-                df1, df2, check_like=True, check_dtype=False
-            )
-        except AssertionError as e:
-            is_ok = False
-            _ = e
+        is_close = _get_is_close_mask(values1, values2, diff)
         # Check `is_ok` and raise an assertion depending on `only_warning`.
-        if not is_ok:
+        if not is_close.all():
             hdbg._dfatal(
-                _,
-                "df1=\n%s\n and df2=\n%s\n are not equal.",
-                df_to_str(df1, log_level=log_level),
-                df_to_str(df2, log_level=log_level),
+                "df1 and df2 are not equal.",
+                "%s",
+                _get_top_diffs_str(
+                    df1,
+                    values1,
+                    values2,
+                    ~is_close,
+                    diff,
+                    diff_mode,
+                    num_diffs_to_report,
+                    log_level,
+                ),
                 only_warning=only_warning,
             )
         # Calculate the difference.
-        df_diff = df1 - df2
-        if remove_inf:
-            df_diff = df_diff.replace([np.inf, -np.inf], np.nan)
+        are_floats = all(
+            dtype == np.float64 for dtype in list(df1.dtypes) + list(df2.dtypes)
+        )
+        if is_aligned and are_floats:
+            if remove_inf:
+                diff[np.isinf(diff)] = np.nan
+            df_diff = pd.DataFrame(diff, index=df1.index, columns=df1.columns)
+        else:
+            # Use pandas to keep the dtypes.
+            df_diff = df1 - df2
+            if remove_inf:
+                df_diff = df_diff.replace([np.inf, -np.inf], np.nan)
     elif diff_mode == "pct_change":
         # Compare NaN values in dataframes.
-        nan_diff_df = compare_nans_in_dataframes(df1, df2)
-        _LOG.debug("Dataframe with NaN differences=\n%s", df_to_str(nan_diff_df))
+        is_nan_diff = np.isnan(values1) != np.isnan(values2)
+        is_row_with_nan_diff = is_nan_diff.any(axis=1)
+        if _LOG.isEnabledFor(logging.DEBUG) and is_row_with_nan_diff.any():
+            nan_diff_df = compare_nans_in_dataframes(
+                df1[is_row_with_nan_diff], df2_aligned[is_row_with_nan_diff]
+            )
+            _LOG.debug(
+                "Dataframe with NaN differences=\n%s", df_to_str(nan_diff_df)
+            )
         msg = "There are NaN values in one of the dataframes that are not in the other one."
         hdbg.dassert_eq(
-            0, nan_diff_df.shape[0], msg=msg, only_warning=only_warning
+            0,
+            int(is_row_with_nan_diff.sum()),
+            msg=msg,
+            only_warning=only_warning,
         )
         # Compute pct_change.
-        df_diff = 100 * (df1 - df2) / df2.abs()
+        with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+            pct_change = 100 * diff / np.abs(values2)
         if zero_vs_zero_is_zero:
             # When comparing 0 to 0 set the diff (which is NaN by default) to 0.
-            df1_mask = df1 == 0
-            df2_mask = df2 == 0
-            zero_vs_zero_mask = df1_mask & df2_mask
-            df_diff[zero_vs_zero_mask] = 0
+            pct_change[(values1 == 0) & (values2 == 0)] = 0
         if remove_inf:
-            df_diff = df_diff.replace([np.inf, -np.inf], np.nan)
+            pct_change[np.isinf(pct_change)] = np.nan
         # Check if `df_diff` values are less than `assert_diff_threshold`.
         if assert_diff_threshold is not None:
-            nan_mask = df_diff.isna()
-            within_threshold = (df_diff.abs() <= assert_diff_threshold) | nan_mask
-            expected = pd.DataFrame(
-                True,
-                index=within_threshold.index,
-                columns=within_threshold.columns,
-            )
-            # Test and convert the assertion into boolean.
-            is_ok = True
-            try:
-                pd.testing.assert_frame_equal(
-                    within_threshold, expected, check_exact=True
-                )
-            except AssertionError as e:
-                is_ok = False
-                _ = e
+            with np.errstate(invalid="ignore"):
+                is_within_threshold = (
+                    np.abs(pct_change) <= assert_diff_threshold
+                ) | np.isnan(pct_change)
             # Check `is_ok` and raise assertion depending on `only_warning`.
-            if not is_ok:
+            if not is_within_threshold.all():
                 hdbg._dfatal(
-                    _,
-                    "df1=\n%s\n and df2=\n%s\n have pct_change more than `assert_diff_threshold`.",
-                    df_to_str(df1, log_level=log_level),
-                    df_to_str(df2, log_level=log_level),
+                    "df1 and df2 have pct_change more than"
+                    " `assert_diff_threshold`.",
+                    "%s",
+                    _get_top_diffs_str(
+                        df1,
+                        values1,
+                        values2,
+                        ~is_within_threshold,
+                        pct_change,
+                        diff_mode,
+                        num_diffs_to_report,
+                        log_level,
+                    ),
                     only_warning=only_warning,
                 )
+        df_diff = pd.DataFrame(pct_change, index=df1.index, columns=df1.columns)
+        if not is_aligned:
+            # Use the column order of the pandas arithmetic.
+            df_diff = df_diff[df1.columns.union(df2.columns)]
         # Report max diff.
         max_diff = df_diff.abs().max().max()
         _LOG.log(
@@ -2274,6 +3202,37 @@ def compare_multiindex_dfs(
 # #############################################################################
 
 
+def _get_index_stats(
+    df: pd.DataFrame,
+) -> Tuple[pd.Timestamp, pd.Timestamp, pd.Timestamp, pd.Timestamp]:
+    """
+    Compute the min and max index of all the rows and of the valid rows.
+
+    A row is valid if it doesn't contain NaNs, like for `df.dropna()`.
+
+    :param df: df with a datetime index
+    :return: min index, max index, min valid index, max valid index
+    """
+    index = df.index
+    is_valid = df.notna().to_numpy().all(axis=1)
+    if index.is_monotonic_increasing:
+        # Scan for the first and the last valid rows, instead of copying them.
+        min_index = index[0]
+        max_index = index[-1]
+        if is_valid.any():
+            min_valid_index = index[is_valid.argmax()]
+            max_valid_index = index[len(index) - 1 - is_valid[::-1].argmax()]
+        else:
+            min_valid_index = max_valid_index = pd.NaT
+    else:
+        min_index = index.min()
+        max_index = index.max()
+        valid_index = index[is_valid]
+        min_valid_index = valid_index.min()
+        max_valid_index = valid_index.max()
+    return min_index, max_index, min_valid_index, max_valid_index
+
+
 def compute_duration_df(
     tag_to_df: Dict[str, pd.DataFrame],
     *,
@@ -2297,26 +3256,23 @@ def compute_duration_df(
     :return: timestamp stats and updated dict of dfs, see `intersect_dfs` param
     """
     hdbg.dassert_isinstance(tag_to_df, Dict)
-    # Create df and assign columns.
-    data_stats = pd.DataFrame()
     min_col = "min_index"
     max_col = "max_index"
     min_valid_index_col = "min_valid_index"
     max_valid_index_col = "max_valid_index"
     # Collect timestamp info from all dfs.
-    for tag in tag_to_df.keys():
+    stats = []
+    for df in tag_to_df.values():
         # Check that the passed timestamp has timezone info.
-        hdateti.dassert_has_tz(tag_to_df[tag].index[0])
-        dassert_index_is_datetime(tag_to_df[tag])
+        hdateti.dassert_has_tz(df.index[0])
+        dassert_index_is_datetime(df)
         # Compute timestamp stats.
-        data_stats.loc[tag, min_col] = tag_to_df[tag].index.min()
-        data_stats.loc[tag, max_col] = tag_to_df[tag].index.max()
-        data_stats.loc[tag, min_valid_index_col] = (
-            tag_to_df[tag].dropna().index.min()
-        )
-        data_stats.loc[tag, max_valid_index_col] = (
-            tag_to_df[tag].dropna().index.max()
-        )
+        stats.append(_get_index_stats(df))
+    # Build the df at once, instead of growing it one cell at a time.
+    columns = [min_col, max_col, min_valid_index_col, max_valid_index_col]
+    data_stats = pd.DataFrame(
+        stats, index=list(tag_to_df.keys()), columns=columns
+    )
     # Make a copy so we do not modify the original data.
     tag_to_df_updated = tag_to_df.copy()
     # Change the initial dfs with intersection.
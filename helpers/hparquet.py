@@ -5,11 +5,14 @@ import helpers.hparquet as hparque
 """
 
 import collections
+import concurrent.futures
 import datetime
 import glob
+import json
 import logging
 import os
-from typing import Any, Callable, Iterator, List, Optional, Tuple, Union
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
@@ -335,6 +338,7 @@ def from_parquet(
     log_level: int = logging.DEBUG,
     report_stats: bool = False,
     aws_profile: hs3.AwsProfile = None,
+    use_manifest: bool = False,
 ) -> pd.DataFrame:
     """
     Load a dataframe from a Parquet file.
@@ -353,6 +357,11 @@ def from_parquet(
     :param report_stats: whether to report Parquet file size or not
     :param aws_profile: AWS profile to use if and only if using an S3 path,
         otherwise `None` for local path
+    :param use_manifest: use the dataset manifest, if present and not stale,
+        to select the files to read instead of listing the dataset (see
+        `plan_files_from_manifest()`); this pays off only when the filters
+        select few files, since each selected file is checked with one
+        request, and it doesn't see files written outside this module
     :return: data from Parquet dataset
     """
     _LOG.debug(hprint.to_str("file_name columns filters schema"))
@@ -401,9 +410,16 @@ def from_parquet(
                 # Pass partition columns types explicitly.
                 schema = pa.schema(schema)
             partitioning = ds.partitioning(schema, flavor="hive")
+            # Replace URI with path.
+            path_or_paths = file_name
+            if use_manifest:
+                file_paths = plan_files_from_manifest(
+                    file_name, filters=filters, aws_profile=aws_profile
+                )
+                if file_paths is not None:
+                    path_or_paths = file_paths
             dataset = pq.ParquetDataset(
-                # Replace URI with path.
-                file_name,
+                path_or_paths,
                 filesystem=filesystem,
                 filters=filters,
                 partitioning=partitioning,
@@ -770,6 +786,8 @@ def build_filter_with_only_equalities(
 
 def collate_parquet_tile_metadata(
     path: str,
+    *,
+    use_manifest: bool = False,
 ) -> pd.DataFrame:
     """
     Report stats in a dataframe on Parquet file partitions.
@@ -778,6 +796,9 @@ def collate_parquet_tile_metadata(
     representation of an `int`.
 
     :param path: path to top-level Parquet directory
+    :param use_manifest: use the dataset manifest, if present and not stale,
+        instead of walking the directory tree; files written outside this
+        module are not seen
     :return: dataframe with two file size columns and a multiindex reflecting
         the Parquet path structure.
     """
@@ -786,6 +807,70 @@ def collate_parquet_tile_metadata(
     if path.endswith("/"):
         path = path[:-1]
     hdbg.dassert(not path.endswith("/"))
+    dict_: Optional[Dict[Tuple[int, ...], int]] = None
+    if use_manifest:
+        dict_, headers_set = _collate_parquet_tile_metadata_from_manifest(path)
+    if dict_ is None:
+        dict_, headers_set = _collate_parquet_tile_metadata_from_walk(path)
+    # Ensure that headers are unambiguous.
+    hdbg.dassert_eq(len(headers_set), 1)
+    # Convert to a multiindexed dataframe.
+    df = pd.DataFrame(dict_.values(), index=dict_.keys())
+    df.rename(columns={0: "file_size_in_bytes"}, inplace=True)
+    headers = headers_set.pop()
+    df.index.names = headers
+    df.sort_index(inplace=True)
+    # Add a more human-readable file size column. Keep the original numerical
+    # one for downstream aggregations.
+    file_size = df["file_size_in_bytes"].apply(hintros.format_size)
+    df["file_size"] = file_size
+    return df
+
+
+def _collate_parquet_tile_metadata_from_manifest(
+    path: str,
+) -> Tuple[Optional[Dict[Tuple[int, ...], int]], set]:
+    """
+    Collect the size of each leaf dir of a dataset from its manifest.
+
+    Differently from walking the tree, the size of a leaf dir with multiple
+    files is the sum of the sizes of its files.
+
+    :return: size in bytes indexed by partition values and set of
+        partition headers, or `None` if the manifest is missing or stale
+    """
+    headers_set = set()
+    manifest = load_manifest(path)
+    if manifest is None:
+        return None, headers_set
+    dict_: Dict[Tuple[int, ...], int] = collections.OrderedDict()
+    for rel_path, entry in manifest["files"].items():
+        file_path = os.path.join(path, rel_path)
+        if not _is_manifest_entry_fresh(file_path, entry, None):
+            _LOG.warning(
+                "Manifest for '%s' is stale because of '%s': falling back to "
+                "walking the dir",
+                path,
+                rel_path,
+            )
+            return None, set()
+        partition = entry["partition"]
+        lhs = tuple(partition.keys())
+        rhs = tuple(int(value) for value in partition.values())
+        headers_set.add(lhs)
+        dict_[rhs] = dict_.get(rhs, 0) + entry["size_in_bytes"]
+    return dict_, headers_set
+
+
+def _collate_parquet_tile_metadata_from_walk(
+    path: str,
+) -> Tuple[Dict[Tuple[int, ...], int], set]:
+    """
+    Collect the size of each leaf dir of a dataset walking the tree.
+
+    :return: size in bytes indexed by partition values and set of
+        partition headers
+    """
     # Walk the path.
     # os.walk() yields a 3-tuple of the form
     #  (dirpath: str, dirnames: List[str], filenames: List[str])
@@ -812,19 +897,7 @@ def collate_parquet_tile_metadata(
         # join aggregations.
         size_in_bytes = os.path.getsize(file_path)
         dict_[rhs] = size_in_bytes
-    # Ensure that headers are unambiguous.
-    hdbg.dassert_eq(len(headers_set), 1)
-    # Convert to a multiindexed dataframe.
-    df = pd.DataFrame(dict_.values(), index=dict_.keys())
-    df.rename(columns={0: "file_size_in_bytes"}, inplace=True)
-    headers = headers_set.pop()
-    df.index.names = headers
-    df.sort_index(inplace=True)
-    # Add a more human-readable file size column. Keep the original numerical
-    # one for downstream aggregations.
-    file_size = df["file_size_in_bytes"].apply(hintros.format_size)
-    df["file_size"] = file_size
-    return df
+    return dict_, headers_set
 
 
 # TODO(Paul): The `int` assumption is baked in. We can generalize to strings
@@ -1071,6 +1144,7 @@ def to_partitioned_parquet(
     dst_dir: str,
     *,
     aws_profile: hs3.AwsProfile = None,
+    update_manifest: bool = False,
 ) -> None:
     """
     Save the given dataframe as Parquet file partitioned along the given
@@ -1080,6 +1154,9 @@ def to_partitioned_parquet(
     :param partition_columns: partitioning columns
     :param dst_dir: location of partitioned dataset
     :param aws_profile: the name of an AWS profile or a s3fs filesystem
+    :param update_manifest: create or update the dataset manifest with the
+        written files (see `plan_files_from_manifest()`). If a manifest
+        already exists, it is always updated
 
     E.g., in case of partition using `date`, the file layout looks like:
     ```
@@ -1131,12 +1208,808 @@ def to_partitioned_parquet(
         #  how to do it. Either setting permissions to read-only before writing.
         #  Or having a list of files that will be written and ensure that none of
         #  those files already existing.
+        written_files: List[ds.WrittenFile] = []
         pq.write_to_dataset(
             table,
             dst_dir,
             partition_cols=partition_columns,
             filesystem=filesystem,
+            file_visitor=written_files.append,
+        )
+    # Keep the manifest in sync with the written files. An existing manifest is
+    # always updated, since otherwise it would silently miss the new files.
+    if update_manifest or manifest_exists(dst_dir, aws_profile=aws_profile):
+        entries = [
+            _get_manifest_entry(dst_dir, written_file)
+            for written_file in written_files
+        ]
+        update_manifest_entries(dst_dir, entries, aws_profile=aws_profile)
+
+
+# #############################################################################
+# Dataset manifest.
+# #############################################################################
+
+# A manifest is a JSON file stored in the root dir of a partitioned Parquet
+# dataset that records, for each file of the dataset (with path relative to the
+# root dir):
+# - the partition values (e.g., `{"asset_id": 1467591036, "year": 2022}`)
+# - the number of rows
+# - the size of the file in bytes
+# - the min / max values of each column, merged across the row groups
+#
+# E.g.,
+# ```
+# {
+#     "version": 1,
+#     "files": {
+#         "asset_id=1467591036/year=2022/month=1/1f5f...-0.parquet": {
+#             "partition": {"asset_id": 1467591036, "year": 2022, "month": 1},
+#             "num_rows": 744,
+#             "size_in_bytes": 23021,
+#             "stats": {"close": [100.1, 104.3], ...}
+#         },
+#         ...
+#     }
+# }
+# ```
+#
+# The manifest allows readers to plan which files to open without listing the
+# dataset, which on S3 requires a series of paginated requests.
+# - The name starts with `_` so that `pyarrow` ignores it when discovering the
+#   files of a dataset
+# - `to_partitioned_parquet()` maintains the manifest incrementally
+# - A manifest is considered stale when any of the files it plans to read is
+#   missing or has a different size; in this case readers fall back to listing
+# - Files added to the dataset without going through `hparquet` are not
+#   detected, so writers outside `hparquet` should call `build_manifest()` or
+#   `remove_manifest()`
+# - Concurrent writers updating the same manifest are not supported
+
+_MANIFEST_FILE_NAME = "_manifest.json"
+_MANIFEST_VERSION = 1
+
+
+def get_manifest_path(root_dir: str) -> str:
+    """
+    Return the path of the manifest of a partitioned Parquet dataset.
+
+    :param root_dir: root dir of the dataset (local or S3)
+    """
+    return os.path.join(root_dir.rstrip("/"), _MANIFEST_FILE_NAME)
+
+
+def manifest_exists(root_dir: str, *, aws_profile: hs3.AwsProfile = None) -> bool:
+    """
+    Return whether a dataset has a manifest.
+
+    :param root_dir: root dir of the dataset
+    :param aws_profile: AWS profile to use if and only if using an S3 path
+    """
+    manifest_path = get_manifest_path(root_dir)
+    if aws_profile is not None:
+        s3fs_ = hs3.get_s3fs(aws_profile)
+        ret: bool = s3fs_.exists(manifest_path)
+    else:
+        ret = os.path.exists(manifest_path)
+    return ret
+
+
+def load_manifest(
+    root_dir: str, *, aws_profile: hs3.AwsProfile = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Load the manifest of a dataset.
+
+    :param root_dir: root dir of the dataset
+    :param aws_profile: AWS profile to use if and only if using an S3 path
+    :return: manifest or `None` if the manifest doesn't exist or can't be
+        parsed
+    """
+    manifest_path = get_manifest_path(root_dir)
+    try:
+        if aws_profile is not None:
+            s3fs_ = hs3.get_s3fs(aws_profile)
+            with s3fs_.open(manifest_path, "rb") as f:
+                manifest = json.load(f)
+        else:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+    except (FileNotFoundError, NotADirectoryError):
+        _LOG.debug("No manifest found at '%s'", manifest_path)
+        return None
+    except ValueError as e:
+        _LOG.warning("Can't parse manifest '%s': %s", manifest_path, str(e))
+        return None
+    if manifest.get("version") != _MANIFEST_VERSION:
+        _LOG.warning(
+            "Ignoring manifest '%s' with version=%s",
+            manifest_path,
+            manifest.get("version"),
+        )
+        return None
+    return manifest
+
+
+def _save_manifest(
+    root_dir: str,
+    manifest: Dict[str, Any],
+    *,
+    aws_profile: hs3.AwsProfile = None,
+) -> None:
+    manifest_path = get_manifest_path(root_dir)
+    # Sort the keys so that the file is stable across updates.
+    txt = json.dumps(manifest, indent=2, sort_keys=True)
+    if aws_profile is not None:
+        s3fs_ = hs3.get_s3fs(aws_profile)
+        with s3fs_.open(manifest_path, "wb") as f:
+            f.write(txt.encode())
+    else:
+        # Write to a tmp file and rename it, so that a reader never sees a
+        # partially written manifest.
+        _create_enclosing_dir(manifest_path)
+        tmp_manifest_path = manifest_path + ".tmp"
+        with open(tmp_manifest_path, "w") as f:
+            f.write(txt)
+        os.replace(tmp_manifest_path, manifest_path)
+    _LOG.debug(
+        "Saved manifest '%s' with %s files",
+        manifest_path,
+        len(manifest["files"]),
+    )
+
+
+def remove_manifest(root_dir: str, *, aws_profile: hs3.AwsProfile = None) -> None:
+    """
+    Remove the manifest of a dataset, if it exists.
+
+    :param root_dir: root dir of the dataset
+    :param aws_profile: AWS profile to use if and only if using an S3 path
+    """
+    if not manifest_exists(root_dir, aws_profile=aws_profile):
+        return
+    manifest_path = get_manifest_path(root_dir)
+    _LOG.debug("Removing manifest '%s'", manifest_path)
+    if aws_profile is not None:
+        s3fs_ = hs3.get_s3fs(aws_profile)
+        s3fs_.rm(manifest_path)
+    else:
+        os.remove(manifest_path)
+
+
+def _to_manifest_value(value: Any) -> Any:
+    """
+    Convert a Parquet statistics value into a JSON-serializable value.
+
+    :return: converted value or `None` if the value can't be represented
+    """
+    if isinstance(value, (bool, int, float, str)):
+        ret = value
+    elif isinstance(value, (datetime.datetime, datetime.date)):
+        ret = value.isoformat()
+    elif isinstance(value, bytes):
+        try:
+            ret = value.decode("utf-8")
+        except UnicodeDecodeError:
+            ret = None
+    else:
+        ret = None
+    return ret
+
+
+def _get_column_stats_from_metadata(
+    metadata: pq.FileMetaData,
+) -> Dict[str, List[Any]]:
+    """
+    Merge the min / max statistics of each column across the row groups.
+
+    Columns without statistics in any row group are skipped, since they
+    can't be used to prune files.
+    """
+    stats: Dict[str, List[Any]] = {}
+    skipped_columns = set()
+    for rg_idx in range(metadata.num_row_groups):
+        row_group = metadata.row_group(rg_idx)
+        for col_idx in range(row_group.num_columns):
+            column = row_group.column(col_idx)
+            col_name = column.path_in_schema
+            if col_name in skipped_columns:
+                continue
+            col_stats = column.statistics
+            if col_stats is None or not col_stats.has_min_max:
+                skipped_columns.add(col_name)
+                stats.pop(col_name, None)
+                continue
+            min_ = _to_manifest_value(col_stats.min)
+            max_ = _to_manifest_value(col_stats.max)
+            if min_ is None or max_ is None:
+                skipped_columns.add(col_name)
+                stats.pop(col_name, None)
+                continue
+            if col_name in stats:
+                stats[col_name][0] = min(stats[col_name][0], min_)
+                stats[col_name][1] = max(stats[col_name][1], max_)
+            else:
+                stats[col_name] = [min_, max_]
+    return stats
+
+
+def _get_manifest_rel_path(root_dir: str, file_path: str) -> str:
+    """
+    Return the path of a dataset file relative to the dataset root dir.
+    """
+    root_dir = root_dir.replace("s3://", "", 1).rstrip("/")
+    file_path = file_path.replace("s3://", "", 1)
+    rel_path = os.path.relpath(file_path, start=root_dir)
+    hdbg.dassert(
+        not rel_path.startswith(".."),
+        "File '%s' is not under '%s'",
+        file_path,
+        root_dir,
+    )
+    return rel_path
+
+
+def _get_manifest_entry(
+    root_dir: str,
+    written_file: ds.WrittenFile,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build the manifest entry for a file written by `pq.write_to_dataset()`.
+
+    :return: relative path of the file and corresponding entry
+    """
+    rel_path = _get_manifest_rel_path(root_dir, written_file.path)
+    entry = _build_manifest_entry(
+        rel_path, written_file.metadata, written_file.size
+    )
+    return rel_path, entry
+
+
+def _build_manifest_entry(
+    rel_path: str, metadata: pq.FileMetaData, size_in_bytes: int
+) -> Dict[str, Any]:
+    """
+    Build the manifest entry of a file from its Parquet metadata.
+
+    :param rel_path: path of the file relative to the dataset root dir
+    """
+    entry = {
+        "partition": dict(_get_parquet_tiles_from_file_path(rel_path)),
+        "num_rows": metadata.num_rows,
+        "size_in_bytes": size_in_bytes,
+        "stats": _get_column_stats_from_metadata(metadata),
+    }
+    return entry
+
+
+def update_manifest_entries(
+    root_dir: str,
+    entries: List[Tuple[str, Dict[str, Any]]],
+    *,
+    removed_dirs: Optional[List[str]] = None,
+    aws_profile: hs3.AwsProfile = None,
+) -> None:
+    """
+    Add or replace entries in the manifest of a dataset.
+
+    The manifest is created if it doesn't exist.
+
+    :param root_dir: root dir of the dataset
+    :param entries: relative paths of the files and corresponding entries
+    :param removed_dirs: relative paths of dirs whose files were removed, so
+        that the corresponding entries are dropped before adding `entries`
+    :param aws_profile: AWS profile to use if and only if using an S3 path
+    """
+    manifest = load_manifest(root_dir, aws_profile=aws_profile)
+    if manifest is None:
+        manifest = {"version": _MANIFEST_VERSION, "files": {}}
+    if removed_dirs:
+        prefixes = tuple(dir_.rstrip("/") + "/" for dir_ in removed_dirs)
+        manifest["files"] = {
+            rel_path: entry
+            for rel_path, entry in manifest["files"].items()
+            if not rel_path.startswith(prefixes)
+        }
+    for rel_path, entry in entries:
+        manifest["files"][rel_path] = entry
+    _save_manifest(root_dir, manifest, aws_profile=aws_profile)
+
+
+def build_manifest(root_dir: str, *, aws_profile: hs3.AwsProfile = None) -> None:
+    """
+    Build the manifest of an existing dataset from scratch.
+
+    This lists the dataset and reads the footer of each file, so it is
+    meant to be run once, e.g., for datasets written before the manifest
+    was introduced or modified outside `hparquet`.
+
+    :param root_dir: root dir of the dataset
+    :param aws_profile: AWS profile to use if and only if using an S3 path
+    """
+    root_dir = root_dir.rstrip("/")
+    if aws_profile is not None:
+        filesystem = hs3.get_s3fs(aws_profile)
+        file_paths = filesystem.glob(f"{root_dir}/**/*.parquet")
+    else:
+        filesystem = None
+        file_paths = glob.glob(f"{root_dir}/**/*.parquet", recursive=True)
+    manifest: Dict[str, Any] = {"version": _MANIFEST_VERSION, "files": {}}
+    for file_path in tqdm(sorted(file_paths), desc="Building manifest"):
+        if filesystem is not None:
+            size_in_bytes = filesystem.size(file_path)
+            with filesystem.open(file_path, "rb") as f:
+                metadata = pq.read_metadata(f)
+        else:
+            size_in_bytes = os.path.getsize(file_path)
+            metadata = pq.read_metadata(file_path)
+        rel_path = _get_manifest_rel_path(root_dir, file_path)
+        manifest["files"][rel_path] = _build_manifest_entry(
+            rel_path, metadata, size_in_bytes
         )
+    _save_manifest(root_dir, manifest, aws_profile=aws_profile)
+
+
+def _coerce_to_type_of(value: Any, ref_value: Any) -> Any:
+    """
+    Convert a value stored in the manifest to the type of a filter value.
+
+    E.g., a partition value `20220110` is parsed as an `int` from the path,
+    but it can be compared with a filter like `("date", "==", "20220110")`.
+    """
+    if isinstance(ref_value, (list, tuple, set)):
+        if not ref_value:
+            return value
+        ref_value = next(iter(ref_value))
+    if isinstance(ref_value, (pd.Timestamp, datetime.datetime)):
+        ret = pd.Timestamp(value)
+        if ret.tzinfo is None and ref_value.tzinfo is not None:
+            # Parquet stores tz-aware timestamps in UTC.
+            ret = ret.tz_localize("UTC")
+    elif isinstance(ref_value, str):
+        ret = str(value)
+    elif isinstance(ref_value, (int, float, np.number)) and isinstance(
+        value, str
+    ):
+        ret = float(value)
+    else:
+        ret = value
+    return ret
+
+
+def _may_satisfy_filter(
+    filter_: ParquetFilter,
+    entry: Dict[str, Any],
+) -> bool:
+    """
+    Return whether the rows of a file may satisfy a filtering condition.
+
+    This is conservative: `True` is returned whenever it's not possible to
+    exclude the file, e.g., when the column is not known.
+    """
+    col_name, op, value = filter_
+    try:
+        if col_name in entry["partition"]:
+            part_value = _coerce_to_type_of(entry["partition"][col_name], value)
+            min_ = max_ = part_value
+        elif col_name in entry["stats"]:
+            min_, max_ = entry["stats"][col_name]
+            min_ = _coerce_to_type_of(min_, value)
+            max_ = _coerce_to_type_of(max_, value)
+        else:
+            return True
+        if op in ("==", "="):
+            ret = min_ <= value <= max_
+        elif op == "!=":
+            ret = not min_ == max_ == value
+        elif op == "<":
+            ret = min_ < value
+        elif op == "<=":
+            ret = min_ <= value
+        elif op == ">":
+            ret = max_ > value
+        elif op == ">=":
+            ret = max_ >= value
+        elif op == "in":
+            ret = any(min_ <= val <= max_ for val in value)
+        elif op == "not in":
+            ret = not (min_ == max_ and min_ in value)
+        else:
+            ret = True
+    except (TypeError, ValueError):
+        # E.g., comparing a string and a number.
+        ret = True
+    return bool(ret)
+
+
+def _may_satisfy_filters(
+    filters: Optional[Union[ParquetOrAndFilter, ParquetAndFilter]],
+    entry: Dict[str, Any],
+) -> bool:
+    """
+    Return whether the rows of a file may satisfy OR-AND Parquet filters.
+    """
+    if not filters:
+        return True
+    if not isinstance(filters[0], list):
+        # Convert an AND filter into an OR-AND filter.
+        filters = [filters]
+    ret = any(
+        all(_may_satisfy_filter(filter_, entry) for filter_ in and_filter)
+        for and_filter in filters
+    )
+    return ret
+
+
+def _is_manifest_entry_fresh(
+    file_path: str,
+    entry: Dict[str, Any],
+    s3fs_: Optional[Any],
+) -> bool:
+    """
+    Check that a file in the manifest exists and has the expected size.
+    """
+    try:
+        if s3fs_ is not None:
+            size_in_bytes = s3fs_.size(file_path)
+        else:
+            size_in_bytes = os.path.getsize(file_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return False
+    return bool(size_in_bytes == entry["size_in_bytes"])
+
+
+def plan_files_from_manifest(
+    root_dir: str,
+    *,
+    filters: Optional[Union[ParquetOrAndFilter, ParquetAndFilter]] = None,
+    aws_profile: hs3.AwsProfile = None,
+) -> Optional[List[str]]:
+    """
+    Use the manifest of a dataset to find the files that need to be read.
+
+    Files are excluded when their partition values or column min / max
+    values don't satisfy `filters`. The remaining files are checked to
+    exist with the recorded size, with one request per file. This is cheaper
+    than listing the dataset only when few files are selected. Files added
+    to the dataset without updating the manifest are not detected.
+
+    :param root_dir: root dir of the dataset
+    :param filters: Parquet filters, as in `from_parquet()`
+    :param aws_profile: AWS profile to use if and only if using an S3 path
+    :return: paths of the files to read, or `None` if there is no manifest,
+        the manifest is stale, or no file is selected, in which case the
+        caller should list the dataset
+    """
+    manifest = load_manifest(root_dir, aws_profile=aws_profile)
+    if manifest is None:
+        return None
+    s3fs_ = hs3.get_s3fs(aws_profile) if aws_profile is not None else None
+    root_dir = root_dir.rstrip("/")
+    file_paths = []
+    for rel_path, entry in sorted(manifest["files"].items()):
+        if not _may_satisfy_filters(filters, entry):
+            continue
+        file_path = os.path.join(root_dir, rel_path)
+        if not _is_manifest_entry_fresh(file_path, entry, s3fs_):
+            _LOG.warning(
+                "Manifest for '%s' is stale because of '%s': falling back to "
+                "listing",
+                root_dir,
+                rel_path,
+            )
+            return None
+        file_paths.append(file_path)
+    if not file_paths:
+        # Let `pyarrow` handle the empty result (e.g., building the schema).
+        _LOG.debug("No file selected by the manifest for '%s'", root_dir)
+        return None
+    _LOG.debug(
+        "Manifest for '%s' selected %s out of %s files",
+        root_dir,
+        len(file_paths),
+        len(manifest["files"]),
+    )
+    return file_paths
+
+
+# #############################################################################
+# PartitionedParquetWriter
+# #############################################################################
+
+
+class _PartitionState:
+    """
+    Buffered data and open file of a single partition.
+    """
+
+    def __init__(self, partition_dir: str) -> None:
+        # E.g., `asset_id=1467591036/year=2022`.
+        self.partition_dir = partition_dir
+        self.buffer: List[pa.Table] = []
+        self.num_buffered_rows = 0
+        self.num_files = 0
+        self.sink: Optional[pa.NativeFile] = None
+        self.writer: Optional[pq.ParquetWriter] = None
+        self.file_path: Optional[str] = None
+
+
+class PartitionedParquetWriter:
+    """
+    Write dataframes to a partitioned Parquet dataset controlling the size of
+    files and row groups.
+
+    Differently from `to_partitioned_parquet()`, which writes one file per
+    partition per call with row groups as large as the input, this writer:
+    - buffers the data of each partition across calls to `write()`
+    - writes row groups of `row_group_size` rows, appending them to the
+      currently open file of the partition
+    - rolls over to a new file when the current file reaches
+      `target_file_size_in_bytes`
+    - writes different partitions concurrently
+
+    The layout of the dataset is the same as `to_partitioned_parquet()`,
+    e.g.,
+    ```
+    dst_dir/
+        asset_id=1467591036/
+            year=2022/
+                3f2a...-0.parquet
+                3f2a...-1.parquet
+    ```
+
+    The memory used is bounded by about `row_group_size` rows per partition,
+    plus the row groups being written. Data is on disk only after
+    `flush()` or `close()`, so the writer should be used as a context
+    manager, e.g.,
+    ```
+    with hparque.PartitionedParquetWriter(dst_dir, ["asset_id", "year"]) as writer:
+        for df in dfs:
+            writer.write(df)
+    ```
+    """
+
+    def __init__(
+        self,
+        dst_dir: str,
+        partition_columns: List[str],
+        *,
+        aws_profile: hs3.AwsProfile = None,
+        target_file_size_in_bytes: int = 256 * 1024**2,
+        row_group_size: int = 1_000_000,
+        num_threads: int = 4,
+        mode: str = "append",
+        update_manifest: bool = False,
+    ) -> None:
+        """
+        Constructor.
+
+        :param dst_dir: location of partitioned dataset
+        :param partition_columns: partitioning columns
+        :param aws_profile: the name of an AWS profile or a s3fs filesystem
+        :param target_file_size_in_bytes: size after which a file is closed
+            and a new one is started. Files can exceed the target by up to
+            one row group
+        :param row_group_size: number of rows of each row group, except for
+            the last row group written by `flush()` / `close()`
+        :param num_threads: number of partitions written concurrently
+        :param mode: how to handle partitions that already contain files
+            - "append": add new files next to the existing ones
+            - "overwrite_partitions": remove the existing files of a
+              partition before writing the first file to it
+        :param update_manifest: create or update the dataset manifest (see
+            `to_partitioned_parquet()`)
+        """
+        hdbg.dassert_isinstance(partition_columns, list)
+        hdbg.dassert_lte(1, len(partition_columns))
+        hdbg.dassert_lt(0, target_file_size_in_bytes)
+        hdbg.dassert_lt(0, row_group_size)
+        hdbg.dassert_lte(1, num_threads)
+        hdbg.dassert_in(mode, ("append", "overwrite_partitions"))
+        self._partition_columns = partition_columns
+        self._aws_profile = aws_profile
+        self._target_file_size_in_bytes = target_file_size_in_bytes
+        self._row_group_size = row_group_size
+        self._num_threads = num_threads
+        self._mode = mode
+        if aws_profile is not None:
+            s3fs_ = hs3.get_s3fs(aws_profile)
+            self._filesystem = pafs.PyFileSystem(pafs.FSSpecHandler(s3fs_))
+            dst_dir = dst_dir.replace("s3://", "", 1)
+        else:
+            self._filesystem = pafs.LocalFileSystem()
+        self._dst_dir = dst_dir.rstrip("/")
+        # An existing manifest is always updated, like in
+        # `to_partitioned_parquet()`.
+        self._update_manifest = update_manifest or manifest_exists(
+            self._dst_dir, aws_profile=aws_profile
+        )
+        # Prefix of the files written by this writer, so that files from
+        # different writers don't collide.
+        self._basename_prefix = uuid.uuid4().hex
+        # The schema of the data, without the partitioning columns.
+        self._schema: Optional[pa.Schema] = None
+        # Map from partition values to the state of the partition.
+        self._partitions: Dict[Tuple[Any, ...], _PartitionState] = {}
+        # Manifest entries of the closed files.
+        self._manifest_entries: List[Tuple[str, Dict[str, Any]]] = []
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=num_threads
+        )
+        self._is_closed = False
+
+    def __enter__(self) -> "PartitionedParquetWriter":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def write(self, df: pd.DataFrame) -> None:
+        """
+        Buffer a dataframe, writing the partitions that have full row groups.
+        """
+        hdbg.dassert(not self._is_closed, "The writer is closed")
+        hdbg.dassert_isinstance(df, pd.DataFrame)
+        hdbg.dassert_is_subset(self._partition_columns, df.columns)
+        if df.empty:
+            return
+        # A `RangeIndex` is stored as metadata referring to the entire frame,
+        # which is invalid once the data is split across files.
+        preserve_index = not isinstance(df.index, pd.RangeIndex)
+        table = pa.Table.from_pandas(df, preserve_index=preserve_index)
+        table = table.drop_columns(self._partition_columns)
+        if self._schema is None:
+            self._schema = table.schema
+        elif not table.schema.equals(self._schema, check_metadata=False):
+            table = table.cast(self._schema)
+        else:
+            table = table.replace_schema_metadata(self._schema.metadata)
+        # Split the data by partition.
+        groups = df.groupby(self._partition_columns, sort=False).indices
+        for key, idxs in groups.items():
+            if not isinstance(key, tuple):
+                key = (key,)
+            if key not in self._partitions:
+                partition_dir = "/".join(
+                    f"{col}={val}"
+                    for col, val in zip(self._partition_columns, key)
+                )
+                self._partitions[key] = _PartitionState(partition_dir)
+            state = self._partitions[key]
+            state.buffer.append(table.take(idxs))
+            state.num_buffered_rows += len(idxs)
+        # Write the partitions with at least one full row group.
+        states = [
+            state
+            for state in self._partitions.values()
+            if state.num_buffered_rows >= self._row_group_size
+        ]
+        self._run_concurrently(self._write_buffer, states, flush=False)
+
+    def flush(self) -> None:
+        """
+        Write all the buffered data, including partial row groups.
+        """
+        hdbg.dassert(not self._is_closed, "The writer is closed")
+        states = [
+            state
+            for state in self._partitions.values()
+            if state.num_buffered_rows > 0
+        ]
+        self._run_concurrently(self._write_buffer, states, flush=True)
+
+    def close(self) -> None:
+        """
+        Write all the buffered data and close all the files.
+        """
+        if self._is_closed:
+            return
+        self.flush()
+        states = [
+            state
+            for state in self._partitions.values()
+            if state.writer is not None
+        ]
+        self._run_concurrently(self._close_file, states)
+        self._executor.shutdown()
+        self._is_closed = True
+        if self._update_manifest:
+            removed_dirs = None
+            if self._mode == "overwrite_partitions":
+                removed_dirs = [
+                    state.partition_dir for state in self._partitions.values()
+                ]
+            update_manifest_entries(
+                self._dst_dir,
+                self._manifest_entries,
+                removed_dirs=removed_dirs,
+                aws_profile=self._aws_profile,
+            )
+
+    def _run_concurrently(
+        self,
+        func: Callable,
+        states: List[_PartitionState],
+        **kwargs: Any,
+    ) -> None:
+        """
+        Apply `func` to the state of each partition in parallel.
+
+        Each partition is processed by a single thread at a time, so the state
+        of a partition doesn't need to be protected by a lock.
+        """
+        if not states:
+            return
+        if self._num_threads == 1 or len(states) == 1:
+            for state in states:
+                func(state, **kwargs)
+        else:
+            futures = [
+                self._executor.submit(func, state, **kwargs) for state in states
+            ]
+            # Propagate the exceptions, if any.
+            for future in futures:
+                future.result()
+
+    def _write_buffer(self, state: _PartitionState, *, flush: bool) -> None:
+        """
+        Write the buffered data of a partition as row groups.
+
+        :param flush: write also the last partial row group, instead of
+            keeping it in the buffer
+        """
+        table = pa.concat_tables(state.buffer)
+        num_rows = table.num_rows
+        if not flush:
+            # Keep the partial row group in the buffer.
+            num_rows = num_rows // self._row_group_size * self._row_group_size
+        for offset in range(0, num_rows, self._row_group_size):
+            length = min(self._row_group_size, num_rows - offset)
+            if state.writer is None:
+                self._open_file(state)
+            state.writer.write_table(
+                table.slice(offset, length), row_group_size=length
+            )
+            if state.sink.tell() >= self._target_file_size_in_bytes:
+                self._close_file(state)
+        remainder = table.slice(num_rows)
+        state.buffer = [remainder] if remainder.num_rows > 0 else []
+        state.num_buffered_rows = remainder.num_rows
+
+    def _open_file(self, state: _PartitionState) -> None:
+        dir_name = f"{self._dst_dir}/{state.partition_dir}"
+        if state.num_files == 0:
+            if self._mode == "overwrite_partitions":
+                self._filesystem.delete_dir_contents(
+                    dir_name, missing_dir_ok=True
+                )
+            self._filesystem.create_dir(dir_name, recursive=True)
+        file_name = f"{self._basename_prefix}-{state.num_files}.parquet"
+        state.file_path = f"{dir_name}/{file_name}"
+        _LOG.debug("Opening '%s'", state.file_path)
+        state.sink = self._filesystem.open_output_stream(state.file_path)
+        state.writer = pq.ParquetWriter(state.sink, self._schema)
+        state.num_files += 1
+
+    def _close_file(self, state: _PartitionState) -> None:
+        state.writer.close()
+        size_in_bytes = state.sink.tell()
+        state.sink.close()
+        _LOG.debug(
+            "Closed '%s' with size=%s",
+            state.file_path,
+            hintros.format_size(size_in_bytes),
+        )
+        if self._update_manifest:
+            rel_path = _get_manifest_rel_path(self._dst_dir, state.file_path)
+            entry = _build_manifest_entry(
+                rel_path, state.writer.writer.metadata, size_in_bytes
+            )
+            # `list.append()` is thread-safe.
+            self._manifest_entries.append((rel_path, entry))
+        state.writer = None
+        state.sink = None
+        state.file_path = None
 
 
 def list_and_merge_pq_files(
@@ -1234,7 +2107,12 @@ def list_and_merge_pq_files(
         else:
             hdbg.dfatal("Supported drop duplicates modes: ohlcv, bid_ask")
         data = hdatafr.remove_duplicates(data, duplicate_columns, control_column)
+        # Write the rows in index order, independently of the order of the
+        # files.
+        data = data.sort_index()
         # Remove all old files and write the new, merged one.
+        # The manifest would reference the removed files, so drop it.
+        remove_manifest(root_dir, aws_profile=aws_profile)
         if filesystem:
             filesystem.rm(folder, recursive=True)
             pq.write_table(
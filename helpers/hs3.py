@@ -5,16 +5,24 @@ import helpers.hs3 as hs3
 """
 
 import argparse
+import collections
+import concurrent.futures
 import configparser
-import copy
 import functools
 import gzip
+import io
 import logging
 import os
 import pathlib
 import pprint
 import re
-from typing import Any, Dict, List, Optional, Tuple, Union
+import subprocess
+import tarfile
+import threading
+import time
+import weakref
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 _WARNING = "\033[33mWARNING\033[0m"
 
@@ -201,6 +209,120 @@ def _replace_star_with_double_star(pattern_to_modify: str) -> str:
     return new_pattern
 
 
+# Listings of S3 dirs cached by `listdir()` for each filesystem, mapping
+# `(dir_name, pattern, maxdepth)` to the time of the listing and the type
+# (e.g., "file", "directory") of each listed path.
+_LISTING_CACHE: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_LISTING_CACHE_LOCK = threading.Lock()
+# Number of invalidations, used to avoid caching a listing that was running
+# while the cache was invalidated.
+_LISTING_CACHE_NUM_INVALIDATIONS = 0
+
+
+def _normalize_s3_path(s3_path: str) -> str:
+    s3_path = s3_path[len("s3://") :] if is_s3_path(s3_path) else s3_path
+    return s3_path.rstrip("/")
+
+
+def invalidate_listing_cache(s3_path: Optional[str] = None) -> None:
+    """
+    Remove the cached listings of `listdir()` that can include `s3_path`.
+
+    The writes made through this module invalidate the cache automatically,
+    while writes made directly through `s3fs` need to call this function.
+
+    :param s3_path: S3 path of a written file or dir. If `None`, remove all the
+        cached listings
+    """
+    global _LISTING_CACHE_NUM_INVALIDATIONS
+    with _LISTING_CACHE_LOCK:
+        _LISTING_CACHE_NUM_INVALIDATIONS += 1
+        if s3_path is None:
+            _LISTING_CACHE.clear()
+            return
+        s3_path = _normalize_s3_path(s3_path)
+        for listings in _LISTING_CACHE.values():
+            keys_to_remove = [
+                key
+                for key in listings
+                # A listing is stale if the written path is under its dir or
+                # if a parent of its dir was written (e.g., removed).
+                if f"{s3_path}/".startswith(f"{key[0]}/")
+                or key[0].startswith(f"{s3_path}/")
+            ]
+            for key in keys_to_remove:
+                del listings[key]
+
+
+def _list_s3_dir(
+    s3fs_: s3fs.core.S3FileSystem,
+    dir_name: str,
+    pattern: str,
+    maxdepth: Optional[int],
+) -> Dict[str, str]:
+    """
+    List the paths under an S3 dir matching a pattern.
+
+    See `listdir()` for the params.
+
+    :return: type (e.g., "file", "directory") of each found path
+    """
+    dassert_path_exists(dir_name, s3fs_)
+    # Ensure that there are no multiple stars in pattern.
+    hdbg.dassert_not_in("**", pattern)
+    if re.search(r"[*?\[]", pattern):
+        # `hio.listdir` is using `find` which looks for files and directories
+        # descending recursively in the directory.
+        # One star in glob will use `maxdepth=1`.
+        pattern = _replace_star_with_double_star(pattern)
+        _LOG.debug("pattern=%s", pattern)
+        # Detailed S3 objects in dict form with metadata.
+        path_objects = s3fs_.glob(
+            f"{dir_name}/{pattern}", detail=True, maxdepth=maxdepth
+        )
+    else:
+        # Without wildcards the pattern is a path relative to `dir_name`, so
+        # look it up instead of listing.
+        try:
+            path_object = s3fs_.info(f"{dir_name}/{pattern}")
+        except FileNotFoundError:
+            path_objects = {}
+        else:
+            path_objects = {path_object["name"]: path_object}
+    # Use metadata to distinguish files from directories without calling
+    # `s3fs_.isdir/isfile`.
+    path_types = {
+        path: path_object["type"] for path, path_object in path_objects.items()
+    }
+    return path_types
+
+
+def _list_s3_dir_with_cache(
+    s3fs_: s3fs.core.S3FileSystem,
+    dir_name: str,
+    pattern: str,
+    maxdepth: Optional[int],
+    cache_ttl_in_secs: float,
+) -> Dict[str, str]:
+    """
+    Same as `_list_s3_dir()` but reusing listings younger than a TTL.
+    """
+    key = (_normalize_s3_path(dir_name), pattern, maxdepth)
+    with _LISTING_CACHE_LOCK:
+        value = _LISTING_CACHE.get(s3fs_, {}).get(key)
+        num_invalidations = _LISTING_CACHE_NUM_INVALIDATIONS
+    if value is not None and time.time() - value[0] <= cache_ttl_in_secs:
+        _LOG.debug("Using cached listing for '%s'", dir_name)
+        path_types: Dict[str, str] = value[1]
+        return path_types
+    timestamp = time.time()
+    path_types = _list_s3_dir(s3fs_, dir_name, pattern, maxdepth)
+    with _LISTING_CACHE_LOCK:
+        if num_invalidations == _LISTING_CACHE_NUM_INVALIDATIONS:
+            _LISTING_CACHE.setdefault(s3fs_, {})[key] = (timestamp, path_types)
+    return path_types
+
+
 def listdir(
     dir_name: str,
     pattern: str,
@@ -210,40 +332,38 @@ def listdir(
     exclude_git_dirs: bool = True,
     aws_profile: Optional[AwsProfile] = None,
     maxdepth: Optional[int] = None,
+    cache_ttl_in_secs: Optional[float] = None,
 ) -> List[str]:
     """
     Counterpart to `hio.listdir` with S3 support.
 
+    For S3, a `pattern` without wildcards is the path of a file or dir
+    relative to `dir_name` and is looked up without globbing.
+
     :param dir_name: S3 or local path
     :param aws_profile: AWS profile to use if and only if using an S3 path,
         otherwise `None` for local path
     :param maxdepth: limit the depth of directory traversal
+    :param cache_ttl_in_secs: reuse an S3 listing made with the same
+        filesystem and params up to this many seconds ago. `None` disables the
+        cache. Writes made through this module invalidate the cache, otherwise
+        see `invalidate_listing_cache()`
     """
     dassert_is_valid_aws_profile(dir_name, aws_profile)
     _LOG.debug("pattern=%s", pattern)
     if is_s3_path(dir_name):
         s3fs_ = get_s3fs(aws_profile)
-        dassert_path_exists(dir_name, s3fs_)
-        # Ensure that there are no multiple stars in pattern.
-        hdbg.dassert_not_in("**", pattern)
-        # `hio.listdir` is using `find` which looks for files and directories
-        # descending recursively in the directory.
-        # One star in glob will use `maxdepth=1`.
-        pattern = _replace_star_with_double_star(pattern)
-        _LOG.debug("pattern=%s", pattern)
-        # Detailed S3 objects in dict form with metadata.
-        path_objects = s3fs_.glob(
-            f"{dir_name}/{pattern}", detail=True, maxdepth=maxdepth
-        )
-        if only_files:
-            # Original `path_objects` must not be changed during loop.
-            temp_path_objects = copy.deepcopy(list(path_objects.values()))
-            # Use metadata to distinguish files from directories without
-            # calling `s3fs_.isdir/isfile`.
-            for path_object in temp_path_objects:
-                if path_object["type"] != "file":
-                    path_objects.pop(path_object["Key"])
-        paths = list(path_objects.keys())
+        if cache_ttl_in_secs is None:
+            path_types = _list_s3_dir(s3fs_, dir_name, pattern, maxdepth)
+        else:
+            path_types = _list_s3_dir_with_cache(
+                s3fs_, dir_name, pattern, maxdepth, cache_ttl_in_secs
+            )
+        paths = [
+            path
+            for path, type_ in path_types.items()
+            if not only_files or type_ == "file"
+        ]
         if exclude_git_dirs:
             paths = [
                 path for path in paths if ".git" not in pathlib.Path(path).parts
@@ -335,6 +455,7 @@ def to_file(
             if force_flush:
                 # TODO(Nikola): Investigate S3 alternative for `os.fsync(f.fileno())`.
                 s3_file.flush()
+        invalidate_listing_cache(file_name)
     else:
         use_gzip = file_name.endswith((".gz", ".gzip"))
         hio.to_file(
@@ -404,6 +525,7 @@ def copy_file_to_s3(
         aws_s3_cp_cmd += f" --profile {aws_profile}"
     _LOG.info("Copying from %s to %s", file_path, s3_dst_file_path)
     hsystem.system(aws_s3_cp_cmd, suppress_output=False)
+    invalidate_listing_cache(s3_dst_file_path)
 
 
 def get_local_or_s3_stream(
@@ -839,41 +961,132 @@ def get_aws_credentials(
 # ///////////////////////////////////////////////////////////////////////////////
 
 
-def get_s3fs(aws_profile: AwsProfile) -> s3fs.core.S3FileSystem:
+# The `s3fs` filesystems built from a profile name are cached per process and
+# shared by all the threads, so that the credentials are parsed and the
+# connection pools are created once instead of at every call.
+# - The cache is keyed by AWS profile and region
+# - `s3fs` filesystems hold an event loop and connections that can't be
+#   used after a `fork()` (e.g., in `loky` / `multiprocessing` workers), so the
+#   cache is reset in the child process
+# - Filesystems using temporary credentials (i.e., with a session token) are
+#   refreshed after `_S3FS_CREDENTIALS_TTL_IN_SECS`, re-reading the credentials
+
+# Map from (aws_profile, aws_region) to the filesystem, the time it was built
+# and whether it uses temporary credentials.
+_S3FS_CACHE: Dict[Tuple[str, Optional[str]], Tuple[Any, float, bool]] = {}
+_S3FS_CACHE_LOCK = threading.Lock()
+# PID of the process that populated the cache.
+_S3FS_CACHE_PID = os.getpid()
+# AWS session tokens last at least 15 minutes.
+_S3FS_CREDENTIALS_TTL_IN_SECS = 15 * 60
+
+
+def clear_s3fs_cache() -> None:
     """
-    Return a `s3fs` object from a given AWS profile.
+    Remove all the cached `s3fs` filesystems.
+    """
+    with _S3FS_CACHE_LOCK:
+        _S3FS_CACHE.clear()
 
-    :param aws_profile: the name of an AWS profile or a s3fs filesystem
+
+def _reset_s3fs_cache_after_fork() -> None:
     """
+    Reset the cache of `s3fs` filesystems in a child process.
+    """
+    global _S3FS_CACHE_LOCK, _S3FS_CACHE_PID
+    # After a `fork()` the lock can be in the state of the parent, e.g., held
+    # by a thread that doesn't exist in the child, so we replace it.
+    _S3FS_CACHE_LOCK = threading.Lock()
+    _S3FS_CACHE_PID = os.getpid()
+    _S3FS_CACHE.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_s3fs_cache_after_fork)
+
+
+def _build_s3fs(aws_profile: str) -> Tuple[s3fs.core.S3FileSystem, bool]:
+    """
+    Build a `s3fs` object from a given AWS profile.
+
+    :return: `s3fs` object and whether it uses temporary credentials
+    """
+    has_session_token = False
     if hserver.is_ig_prod():
         # On IG prod machines we let the Docker container infer the right AWS
         # account.
         _LOG.warning("Not using AWS profile='%s'", aws_profile)
         s3fs_ = s3fs.core.S3FileSystem()
+    # When deploying jobs via ECS the container obtains credentials
+    # based on passed task role specified in the ECS task-definition,
+    # refer to:
+    # https://docs.aws.amazon.com/AmazonECS/latest/developerguide/task-iam-roles.html
+    elif aws_profile == "ck" and hserver.is_inside_ecs_container():
+        _LOG.info("Fetching credentials from task IAM role")
+        s3fs_ = s3fs.core.S3FileSystem()
     else:
-        if isinstance(aws_profile, str):
-            # When deploying jobs via ECS the container obtains credentials
-            # based on passed task role specified in the ECS task-definition,
-            # refer to:
-            # https://docs.aws.amazon.com/AmazonECS/latest/developerguide/task-iam-roles.html
-            if aws_profile == "ck" and hserver.is_inside_ecs_container():
-                _LOG.info("Fetching credentials from task IAM role")
-                s3fs_ = s3fs.core.S3FileSystem()
-            else:
-                # From https://stackoverflow.com/questions/62562945
-                aws_credentials = get_aws_credentials(aws_profile)
-                _LOG.debug("%s", pprint.pformat(aws_credentials))
-                s3fs_ = s3fs.core.S3FileSystem(
-                    anon=False,
-                    key=aws_credentials["aws_access_key_id"],
-                    secret=aws_credentials["aws_secret_access_key"],
-                    token=aws_credentials["aws_session_token"],
-                    client_kwargs={"region_name": aws_credentials["aws_region"]},
-                )
-        elif isinstance(aws_profile, s3fs.core.S3FileSystem):
-            s3fs_ = aws_profile
-        else:
-            raise ValueError(f"Invalid aws_profile='{aws_profile}'")
+        # From https://stackoverflow.com/questions/62562945
+        aws_credentials = get_aws_credentials(aws_profile)
+        _LOG.debug("%s", pprint.pformat(aws_credentials))
+        s3fs_ = s3fs.core.S3FileSystem(
+            anon=False,
+            key=aws_credentials["aws_access_key_id"],
+            secret=aws_credentials["aws_secret_access_key"],
+            token=aws_credentials["aws_session_token"],
+            client_kwargs={"region_name": aws_credentials["aws_region"]},
+        )
+        has_session_token = aws_credentials["aws_session_token"] is not None
+    return s3fs_, has_session_token
+
+
+def _get_s3fs_cache_key(aws_profile: str) -> Tuple[str, Optional[str]]:
+    if aws_profile == "__ig_prod__" or (
+        aws_profile == "ck" and hserver.is_inside_ecs_container()
+    ):
+        # The credentials are provided by the environment.
+        region = None
+    else:
+        region = get_aws_credentials(aws_profile)["aws_region"]
+    return aws_profile, region
+
+
+def get_s3fs(aws_profile: AwsProfile) -> s3fs.core.S3FileSystem:
+    """
+    Return a `s3fs` object from a given AWS profile.
+
+    The object built from a profile name is cached and shared across threads
+    (see `_S3FS_CACHE`).
+
+    :param aws_profile: the name of an AWS profile or a s3fs filesystem
+    """
+    if hserver.is_ig_prod():
+        # On IG prod machines the passed profile or filesystem is ignored (see
+        # `_build_s3fs()`), so all the callers share the same filesystem.
+        aws_profile = "__ig_prod__"
+    elif isinstance(aws_profile, s3fs.core.S3FileSystem):
+        return aws_profile
+    elif not isinstance(aws_profile, str):
+        raise ValueError(f"Invalid aws_profile='{aws_profile}'")
+    if _S3FS_CACHE_PID != os.getpid():
+        # We are in a child process that didn't go through `fork()` hooks.
+        _reset_s3fs_cache_after_fork()
+    key = _get_s3fs_cache_key(aws_profile)
+    with _S3FS_CACHE_LOCK:
+        if key in _S3FS_CACHE:
+            s3fs_, timestamp, has_session_token = _S3FS_CACHE[key]
+            is_expired = (
+                has_session_token
+                and time.time() - timestamp > _S3FS_CREDENTIALS_TTL_IN_SECS
+            )
+            if not is_expired:
+                return s3fs_
+            # Re-read the temporary credentials, since they could have been
+            # renewed.
+            _LOG.debug("Refreshing credentials for aws_profile='%s'", aws_profile)
+            get_aws_credentials.cache_clear()
+        _LOG.debug("Building s3fs for aws_profile='%s'", aws_profile)
+        s3fs_, has_session_token = _build_s3fs(aws_profile)
+        _S3FS_CACHE[key] = (s3fs_, time.time(), has_session_token)
     return s3fs_
 
 
@@ -885,8 +1098,299 @@ def get_s3fs(aws_profile: AwsProfile) -> s3fs.core.S3FileSystem:
 # TODO(gp): -> helpers/aws_utils.py
 
 
+# S3 multipart uploads require parts of at least 5 MB, except for the last one.
+_MIN_PART_SIZE_IN_BYTES = 5 * 1024**2
+# Default size of the parts uploaded / downloaded concurrently.
+_ARCHIVE_PART_SIZE_IN_BYTES = 64 * 1024**2
+_ARCHIVE_NUM_THREADS = 8
+
+
+# #############################################################################
+# _ParallelGzipWriter
+# #############################################################################
+
+
+class _ParallelGzipWriter:
+    """
+    Write-only file-like object compressing data with gzip on multiple threads.
+
+    The data is split in chunks that are compressed concurrently as independent
+    gzip members and written in order to `fileobj`. A concatenation of gzip
+    members is a valid gzip stream, so the output can be expanded with `gzip`,
+    `tar xzf` or `tarfile` as usual.
+    """
+
+    def __init__(
+        self,
+        fileobj: Any,
+        *,
+        chunk_size_in_bytes: int = 4 * 1024**2,
+        num_threads: int = _ARCHIVE_NUM_THREADS,
+        compress_level: int = 6,
+    ) -> None:
+        """
+        Constructor.
+
+        :param fileobj: file-like object to write the compressed data to
+        :param chunk_size_in_bytes: size of the uncompressed data in each gzip
+            member
+        :param num_threads: number of threads compressing data
+        :param compress_level: gzip compression level
+        """
+        hdbg.dassert_lt(0, chunk_size_in_bytes)
+        hdbg.dassert_lte(1, num_threads)
+        self._fileobj = fileobj
+        self._chunk_size_in_bytes = chunk_size_in_bytes
+        self._compress_level = compress_level
+        self._buffer = bytearray()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=num_threads
+        )
+        # Bound the number of chunks in memory.
+        self._max_num_pending = 2 * num_threads
+        self._pending: collections.deque = collections.deque()
+
+    def __enter__(self) -> "_ParallelGzipWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._chunk_size_in_bytes:
+            chunk = bytes(self._buffer[: self._chunk_size_in_bytes])
+            del self._buffer[: self._chunk_size_in_bytes]
+            self._submit(chunk)
+        return len(data)
+
+    def close(self) -> None:
+        """
+        Compress the remaining data and write all the chunks in order.
+        """
+        if self._executor is None:
+            return
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending:
+                self._fileobj.write(self._pending.popleft().result())
+        except Exception:
+            self.abort()
+            raise
+        self._executor.shutdown()
+        self._executor = None
+
+    def abort(self) -> None:
+        """
+        Stop the compression discarding the data not written yet.
+        """
+        if self._executor is None:
+            return
+        self._executor.shutdown(cancel_futures=True)
+        self._executor = None
+        self._pending.clear()
+        self._buffer = bytearray()
+
+    def _submit(self, chunk: bytes) -> None:
+        # `zlib` releases the GIL, so the chunks are compressed in parallel.
+        # We fix `mtime` to make the output deterministic.
+        future = self._executor.submit(
+            gzip.compress, chunk, compresslevel=self._compress_level, mtime=0
+        )
+        self._pending.append(future)
+        while len(self._pending) > self._max_num_pending:
+            self._fileobj.write(self._pending.popleft().result())
+
+
+# #############################################################################
+# _S3MultipartWriter
+# #############################################################################
+
+
+class _S3MultipartWriter:
+    """
+    Write-only file-like object uploading data to S3 with a multipart upload.
+
+    Parts are uploaded concurrently while the caller keeps writing, so the data
+    never needs to be stored on the local disk.
+    """
+
+    def __init__(
+        self,
+        s3fs_: s3fs.core.S3FileSystem,
+        s3_file_path: str,
+        *,
+        part_size_in_bytes: int = _ARCHIVE_PART_SIZE_IN_BYTES,
+        num_threads: int = _ARCHIVE_NUM_THREADS,
+    ) -> None:
+        """
+        Constructor.
+
+        :param s3fs_: filesystem to use
+        :param s3_file_path: full S3 path of the file to write
+        :param part_size_in_bytes: size of each uploaded part
+        :param num_threads: number of parts uploaded concurrently
+        """
+        dassert_is_s3_path(s3_file_path)
+        hdbg.dassert_lte(_MIN_PART_SIZE_IN_BYTES, part_size_in_bytes)
+        hdbg.dassert_lte(1, num_threads)
+        self._s3fs = s3fs_
+        self._s3_file_path = s3_file_path
+        self._bucket, abs_path = split_path(s3_file_path)
+        self._key = abs_path.lstrip("/")
+        self._part_size_in_bytes = part_size_in_bytes
+        self._buffer = bytearray()
+        self._upload_id = self._s3fs.call_s3(
+            "create_multipart_upload", Bucket=self._bucket, Key=self._key
+        )["UploadId"]
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=num_threads
+        )
+        # Bound the number of parts in memory.
+        self._max_num_pending = num_threads
+        self._pending: collections.deque = collections.deque()
+        self._parts: List[Dict[str, Any]] = []
+        self._is_closed = False
+
+    def __enter__(self) -> "_S3MultipartWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._part_size_in_bytes:
+            part = bytes(self._buffer[: self._part_size_in_bytes])
+            del self._buffer[: self._part_size_in_bytes]
+            self._submit(part)
+        return len(data)
+
+    def close(self) -> None:
+        """
+        Upload the remaining data and complete the multipart upload.
+        """
+        if self._is_closed:
+            return
+        try:
+            # The last part can be smaller than the minimum size. An empty file
+            # still needs one part.
+            if self._buffer or not self._parts and not self._pending:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending:
+                self._parts.append(self._pending.popleft().result())
+            self._s3fs.call_s3(
+                "complete_multipart_upload",
+                Bucket=self._bucket,
+                Key=self._key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": self._parts},
+            )
+        except Exception:
+            self.abort()
+            raise
+        self._executor.shutdown()
+        self._is_closed = True
+        self._s3fs.invalidate_cache(self._s3_file_path)
+        invalidate_listing_cache(self._s3_file_path)
+
+    def abort(self) -> None:
+        """
+        Abort the multipart upload discarding the uploaded parts.
+        """
+        if self._is_closed:
+            return
+        self._executor.shutdown(cancel_futures=True)
+        self._s3fs.call_s3(
+            "abort_multipart_upload",
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=self._upload_id,
+        )
+        self._is_closed = True
+
+    def _upload_part(self, part_number: int, part: bytes) -> Dict[str, Any]:
+        ret = self._s3fs.call_s3(
+            "upload_part",
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=part,
+        )
+        return {"PartNumber": part_number, "ETag": ret["ETag"]}
+
+    def _submit(self, part: bytes) -> None:
+        part_number = len(self._parts) + len(self._pending) + 1
+        future = self._executor.submit(self._upload_part, part_number, part)
+        self._pending.append(future)
+        while len(self._pending) > self._max_num_pending:
+            self._parts.append(self._pending.popleft().result())
+
+
+# #############################################################################
+
+
+def _iterate_s3_file_parts(
+    s3fs_: s3fs.core.S3FileSystem,
+    s3_file_path: str,
+    *,
+    part_size_in_bytes: int = _ARCHIVE_PART_SIZE_IN_BYTES,
+    num_threads: int = _ARCHIVE_NUM_THREADS,
+) -> Iterator[bytes]:
+    """
+    Download an S3 file with concurrent range requests, yielding parts in order.
+
+    At most `num_threads` parts are downloaded ahead of the consumer.
+    """
+    hdbg.dassert_lt(0, part_size_in_bytes)
+    hdbg.dassert_lte(1, num_threads)
+    size = s3fs_.size(s3_file_path)
+    offsets = iter(range(0, size, part_size_in_bytes))
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=num_threads
+    ) as executor:
+        pending: collections.deque = collections.deque()
+
+        def _submit_next() -> None:
+            offset = next(offsets, None)
+            if offset is not None:
+                end = min(offset + part_size_in_bytes, size)
+                pending.append(
+                    executor.submit(
+                        s3fs_.cat_file, s3_file_path, start=offset, end=end
+                    )
+                )
+
+        for _ in range(num_threads):
+            _submit_next()
+        while pending:
+            part = pending.popleft().result()
+            _submit_next()
+            yield part
+
+
+# #############################################################################
+
+
 def archive_data_on_s3(
-    src_dir: str, s3_path: str, aws_profile: Optional[str], tag: str = ""
+    src_dir: str,
+    s3_path: str,
+    aws_profile: Optional[str],
+    tag: str = "",
+    *,
+    part_size_in_bytes: int = _ARCHIVE_PART_SIZE_IN_BYTES,
+    num_threads: int = _ARCHIVE_NUM_THREADS,
+    compress_level: int = 6,
 ) -> str:
     """
     Compress dir `src_dir` and save it on AWS S3 under `s3_path`.
@@ -895,12 +1399,20 @@ def archive_data_on_s3(
     The tgz is created so that when expanded a dir with the name `src_dir` is
     created.
 
+    The archive is streamed to S3: the tar stream is compressed on multiple
+    threads and uploaded with a concurrent multipart upload, without storing
+    the tgz on the local disk.
+
     :param src_dir: directory that will be compressed
     :param s3_path: full S3 path starting with `s3://`
     :param aws_profile: the profile to use. We use a string and not an
         `AwsProfile` since this is typically the outermost caller in the stack,
         and it doesn't reuse an S3 fs object
     :param tag: a tag to add to the name of the file
+    :param part_size_in_bytes: size of each part of the multipart upload
+    :param num_threads: number of threads used to compress and to upload
+    :param compress_level: gzip compression level
+    :return: path of the archive on S3
     """
     _LOG.info(
         "# Archiving '%s' to '%s' with aws_profile='%s'",
@@ -915,43 +1427,42 @@ def archive_data_on_s3(
     )
     # Add a timestamp if needed.
     dst_path = hsystem.append_timestamp_tag(src_dir, tag) + ".tgz"
-    # Compress the dir.
-    # > (cd .../TestRunExperimentArchiveOnS3.test_serial1; \
-    #    tar cvzf /app/.../TestRunExperimentArchiveOnS3.test_serial1.tgz experiment.RH1E)
+    s3_file_path = os.path.join(s3_path, os.path.basename(dst_path))
+    # The tgz expands to the original dir, e.g.,
+    # > tar tf .../TestRunExperimentArchiveOnS3.test_serial1.tgz
     # experiment.RH1E/
     # experiment.RH1E/log.20210802-123758.txt
     # experiment.RH1E/output_metadata.json
     # ...
-    _LOG.debug("Destination path is '%s'", dst_path)
-    with htimer.TimedScope(logging.INFO, "Compressing"):
-        dir_name = os.path.dirname(src_dir)
-        base_name = os.path.basename(src_dir)
-        hdbg.dassert_ne(base_name, "", "src_dir=%s", src_dir)
-        cmd = ""
-        if dir_name != "":
-            cmd += f"cd {dir_name} && "
-        cmd += f"tar czf {dst_path} {base_name}"
-        hsystem.system(cmd)
+    base_name = os.path.basename(os.path.normpath(src_dir))
+    hdbg.dassert_ne(base_name, "", "src_dir=%s", src_dir)
+    _LOG.info("Compressing and copying '%s' to '%s'", src_dir, s3_file_path)
+    s3fs_ = get_s3fs(aws_profile)
+    with htimer.TimedScope(logging.INFO, "Compressing and copying"):
+        with _S3MultipartWriter(
+            s3fs_,
+            s3_file_path,
+            part_size_in_bytes=part_size_in_bytes,
+            num_threads=num_threads,
+        ) as s3_writer:
+            with _ParallelGzipWriter(
+                s3_writer, num_threads=num_threads, compress_level=compress_level
+            ) as gzip_writer:
+                # `tar` only packs the files, while the compression runs on
+                # multiple threads.
+                cmd = ["tar", "cf", "-", base_name]
+                cwd = os.path.dirname(os.path.normpath(src_dir)) or None
+                with subprocess.Popen(
+                    cmd, cwd=cwd, stdout=subprocess.PIPE
+                ) as proc:
+                    for data in iter(lambda: proc.stdout.read(1024**2), b""):
+                        gzip_writer.write(data)
+                hdbg.dassert_eq(proc.returncode, 0, "cmd='%s' failed", cmd)
     _LOG.info(
         "The size of '%s' is %s",
-        dst_path,
-        hsystem.du(dst_path, human_format=True),
+        s3_file_path,
+        hintros.format_size(s3fs_.size(s3_file_path)),
     )
-    # Test expanding the tgz. The package should expand to the original dir.
-    # > tar tf /app/.../TestRunExperimentArchiveOnS3.test_serial1.tgz
-    # experiment.RH1E/
-    # experiment.RH1E/log.20210802-123758.txt
-    # experiment.RH1E/output_metadata.json
-    _LOG.info("Testing archive")
-    cmd = f"tar tvf {dst_path}"
-    hsystem.system(cmd, log_level=logging.INFO, suppress_output=False)
-    # Copy to S3.
-    s3_file_path = os.path.join(s3_path, os.path.basename(dst_path))
-    _LOG.info("Copying '%s' to '%s'", dst_path, s3_file_path)
-    hdbg.dassert_file_exists(dst_path)
-    s3fs_ = get_s3fs(aws_profile)
-    # TODO(gp): Make sure the S3 dir exists.
-    s3fs_.put(dst_path, s3_file_path)
     _LOG.info("Data archived on S3 to '%s'", s3_file_path)
     return s3_file_path
 
@@ -980,10 +1491,15 @@ def retrieve_archived_data_from_s3(
     dst_dir: str,
     aws_profile: Optional[str] = None,
     incremental: bool = True,
+    *,
+    part_size_in_bytes: int = _ARCHIVE_PART_SIZE_IN_BYTES,
+    num_threads: int = _ARCHIVE_NUM_THREADS,
 ) -> str:
     """
     Retrieve tgz file from S3, unless it's already present (incremental mode).
 
+    The file is downloaded with concurrent range requests.
+
     :param s3_file_path: path to the S3 file with the archived data. E.g.,
        `s3://.../experiment.20210802-121908.tgz`
     :param dst_dir: destination directory where to save the data
@@ -991,6 +1507,8 @@ def retrieve_archived_data_from_s3(
         `AwsProfile` since this is typically the outermost caller in the stack,
         and it doesn't reuse an S3 fs object
     :param incremental: skip if the tgz file is already present locally
+    :param part_size_in_bytes: size of each downloaded part
+    :param num_threads: number of parts downloaded concurrently
     :return: path with the local tgz file
     """
     _LOG.info(
@@ -1011,26 +1529,59 @@ def retrieve_archived_data_from_s3(
         s3fs_ = get_s3fs(aws_profile)
         dassert_path_exists(s3_file_path, s3fs_)
         _LOG.debug("Getting from s3: '%s' -> '%s", s3_file_path, dst_file)
-        s3fs_.get(s3_file_path, dst_file)
+        parts = _iterate_s3_file_parts(
+            s3fs_,
+            s3_file_path,
+            part_size_in_bytes=part_size_in_bytes,
+            num_threads=num_threads,
+        )
+        # Write to a temporary file so that an interrupted download is not
+        # mistaken for a complete one in incremental mode.
+        tmp_dst_file = dst_file + ".tmp"
+        with open(tmp_dst_file, "wb") as f:
+            for part in parts:
+                f.write(part)
+        os.replace(tmp_dst_file, dst_file)
         _LOG.info("Saved to '%s'", dst_file)
     return dst_file
 
 
-def expand_archived_data(src_tgz_file: str, dst_dir: str) -> str:
+def expand_archived_data(
+    src_tgz_file: str,
+    dst_dir: str,
+    *,
+    aws_profile: Optional[AwsProfile] = None,
+    part_size_in_bytes: int = _ARCHIVE_PART_SIZE_IN_BYTES,
+    num_threads: int = _ARCHIVE_NUM_THREADS,
+) -> str:
     """
-    Expand an S3 tarball storing results of an experiment.
+    Expand a tarball storing results of an experiment.
 
     E.g.,
     - given a tgz file like `s3://.../experiment.20210802-121908.tgz` (which is the
       result of compressing a dir like `/app/.../experiment.RH1E`)
     - expand it into a dir `{dst_dir}/experiment.RH1E`
 
-    :param src_tgz_file: path to the local file with the archived data. E.g.,
-       `/.../experiment.20210802-121908.tgz`
+    If `src_tgz_file` is on S3, the archive is downloaded with concurrent range
+    requests and expanded while streaming, without storing the tgz locally.
+
+    :param src_tgz_file: path to the local or S3 file with the archived data.
+        E.g., `/.../experiment.20210802-121908.tgz`
     :param dst_dir: directory where expand the archive tarball
+    :param aws_profile: the profile to use when `src_tgz_file` is on S3
+    :param part_size_in_bytes: size of each downloaded part
+    :param num_threads: number of parts downloaded concurrently
     :return: dir with the expanded data (e.g., `{dst_dir/experiment.RH1E`)
     """
     _LOG.debug("Expanding '%s'", src_tgz_file)
+    if is_s3_path(src_tgz_file):
+        return _expand_archived_data_from_s3(
+            src_tgz_file,
+            dst_dir,
+            aws_profile,
+            part_size_in_bytes=part_size_in_bytes,
+            num_threads=num_threads,
+        )
     # Get the name of the including dir, e.g., `experiment.RH1E`.
     cmd = f"cd {dst_dir} && tar tzf {src_tgz_file} | head -1"
     rc, enclosing_tgz_dir_name = hsystem.system_to_one_line(cmd)
@@ -1062,6 +1613,73 @@ def expand_archived_data(src_tgz_file: str, dst_dir: str) -> str:
     return tgz_dst_dir
 
 
+def _expand_archived_data_from_s3(
+    s3_file_path: str,
+    dst_dir: str,
+    aws_profile: Optional[AwsProfile],
+    *,
+    part_size_in_bytes: int,
+    num_threads: int,
+) -> str:
+    """
+    Expand a tarball on S3 while downloading it.
+
+    See `expand_archived_data()` for the params.
+    """
+    s3fs_ = get_s3fs(aws_profile)
+    dassert_path_exists(s3_file_path, s3fs_)
+    hio.create_dir(dst_dir, incremental=True)
+    parts = _iterate_s3_file_parts(
+        s3fs_,
+        s3_file_path,
+        part_size_in_bytes=part_size_in_bytes,
+        num_threads=num_threads,
+    )
+    first_part = next(parts)
+    # Get the name of the including dir, e.g., `experiment.RH1E`, from the
+    # first member of the archive.
+    enclosing_tgz_dir_name = _get_first_tgz_member_name(first_part)
+    _LOG.debug(hprint.to_str("enclosing_tgz_dir_name"))
+    tgz_dst_dir = os.path.join(dst_dir, enclosing_tgz_dir_name)
+    if os.path.exists(tgz_dst_dir):
+        _LOG.info(
+            "While expanding '%s' dst dir '%s' already exists: skipping",
+            s3_file_path,
+            tgz_dst_dir,
+        )
+        parts.close()
+    else:
+        with htimer.TimedScope(logging.INFO, "Downloading and decompressing"):
+            # `tar` expands the data as soon as it's downloaded, while the
+            # next parts are downloaded concurrently.
+            cmd = ["tar", "xzf", "-"]
+            with subprocess.Popen(
+                cmd, cwd=dst_dir, stdin=subprocess.PIPE
+            ) as proc:
+                proc.stdin.write(first_part)
+                for part in parts:
+                    proc.stdin.write(part)
+                proc.stdin.close()
+            hdbg.dassert_eq(proc.returncode, 0, "cmd='%s' failed", cmd)
+    hdbg.dassert_dir_exists(tgz_dst_dir)
+    return tgz_dst_dir
+
+
+def _get_first_tgz_member_name(tgz_head: bytes) -> str:
+    """
+    Get the top-level name of the first member from the head of a tgz file.
+    """
+    # The header of the first member, including possible extended headers, is
+    # at the beginning of the uncompressed data.
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    tar_head = decompressor.decompress(tgz_head, 1024**2)
+    with tarfile.open(fileobj=io.BytesIO(tar_head), mode="r|") as tar:
+        first_member = tar.next()
+    hdbg.dassert_is_not(first_member, None, "Empty archive")
+    name: str = first_member.name.split("/")[0]
+    return name
+
+
 def get_s3_bucket_from_stage(stage: str, *, add_suffix: str = None) -> str:
     """
     Retrieve the S3 bucket name based on the provided deployment stage.
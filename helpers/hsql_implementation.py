@@ -4,19 +4,40 @@ Import as:
 import helpers.hsql_implementation as hsqlimpl
 """
 
+import asyncio
 import collections
+import contextlib
 import io
 import logging
 import os
 import re
+import struct
+import threading
 import time
-from typing import Any, Dict, List, Optional, Tuple, Union, cast
+import uuid
+import weakref
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
 
 import numpy as np
 import pandas as pd
 import psycopg2 as psycop
+import psycopg2.extensions as psexten
 import psycopg2.extras as extras
+import psycopg2.pool as pspool
 import psycopg2.sql as psql
+from tqdm.autonotebook import tqdm
 
 import helpers.hasyncio as hasynci
 import helpers.hdatetime as hdateti
@@ -27,6 +48,7 @@ import helpers.hprint as hprint
 import helpers.hs3 as hs3
 import helpers.hsecrets as hsecret
 import helpers.htimer as htimer
+import helpers.htqdm as htqdm
 
 _LOG = logging.getLogger(__name__)
 
@@ -50,11 +72,23 @@ def get_connection(
     user: str,
     password: str,
     autocommit: bool = True,
+    *,
+    use_pool: bool = False,
 ) -> DbConnection:
     """
     Create a connection and cursor for a SQL database.
+
+    :param use_pool: check out the connection from the shared pool for
+        these connection parameters (see `get_connection_pool()`) instead
+        of opening a new one. Closing the connection returns it to the pool
     """
-    _LOG.debug(hprint.to_str("host dbname port user"))
+    _LOG.debug(hprint.to_str("host dbname port user use_pool"))
+    if use_pool:
+        pool = get_connection_pool(
+            host, dbname, port, user, password, autocommit=autocommit
+        )
+        connection = pool.get_connection()
+        return connection
     connection = psycop.connect(
         host=host, dbname=dbname, port=port, user=user, password=password
     )
@@ -67,6 +101,7 @@ def get_connection_from_aws_secret(
     aws_region: str,
     *,
     stage: str = "prod",
+    use_pool: bool = False,
 ) -> DbConnection:
     """
     Create an SQL connection using credentials obtained from AWS
@@ -77,6 +112,7 @@ def get_connection_from_aws_secret(
 
     :param aws_region: AWS DB region, e.g. "eu-north-1", "ap-northeast-1"
     :param stage: DB stage to connect to. For "prod" stage it is only possible to obtain a read-only connection via this method.
+    :param use_pool: same as in `get_connection()`
     """
     hdbg.dassert_in(stage, ["prod", "preprod", "test"])
     hdbg.dassert_in(aws_region, hs3.AWS_REGIONS)
@@ -97,14 +133,17 @@ def get_connection_from_aws_secret(
         port=db_creds["port"],
         user=db_creds["username"],
         password=db_creds["password"],
+        use_pool=use_pool,
     )
     return connection
 
 
-def get_connection_from_env_vars() -> DbConnection:
+def get_connection_from_env_vars(*, use_pool: bool = False) -> DbConnection:
     """
     Create a SQL connection with the information from the environment
     variables.
+
+    :param use_pool: same as in `get_connection()`
     """
     # Get values from the environment variables.
     host = os.environ["POSTGRES_HOST"]
@@ -119,6 +158,7 @@ def get_connection_from_env_vars() -> DbConnection:
         port=port,
         user=user,
         password=password,
+        use_pool=use_pool,
     )
     return connection
 
@@ -249,6 +289,415 @@ def db_connection_to_tuple(connection: DbConnection) -> DbConnectionInfo:
     return ret
 
 
+# #############################################################################
+# Connection pool
+# #############################################################################
+
+
+class _PooledConnection(psexten.connection):
+    """
+    Connection that is returned to its pool when closed.
+
+    Pass it as `connection_factory` to `psycopg2.connect()` in the
+    `connect_func` of a `ConnectionPool` to return the connections to the
+    pool with `close()`, besides `put_connection()`.
+    """
+
+    pool: Optional["ConnectionPool"] = None
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.put_connection(self)
+        else:
+            super().close()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB connections.
+
+    Idle connections are reused in LIFO order, so that the connections that
+    are not needed anymore stay idle and are closed after
+    `idle_timeout_in_secs`, keeping at least `min_size` connections open.
+
+    A returned connection is reset to the session state it had when it was
+    opened: the open transaction is rolled back, `reset_query` is run and
+    `autocommit`, `isolation_level`, `readonly` and `deferrable` are
+    restored. A connection that can't be reset is closed.
+
+    E.g.,
+    ```
+    with ConnectionPool(connect_func, max_size=4) as pool:
+        with pool.connection() as connection:
+            df = execute_query_to_df(connection, query)
+    ```
+    """
+
+    def __init__(
+        self,
+        connect_func: Callable[[], DbConnection],
+        *,
+        min_size: int = 1,
+        max_size: int = 10,
+        idle_timeout_in_secs: float = 300.0,
+        checkout_timeout_in_secs: float = 30.0,
+        health_check_query: Optional[str] = "SELECT 1",
+        reset_query: Optional[str] = "DISCARD ALL",
+    ) -> None:
+        """
+        Constructor.
+
+        :param connect_func: function opening a new connection, e.g.,
+            `psycopg2.connect()` with the connection params
+        :param min_size: number of connections to open at construction and
+            to keep open when idle
+        :param max_size: maximum number of connections open at the same time
+        :param idle_timeout_in_secs: close the connections that are idle for
+            more than this time, in excess of `min_size`
+        :param checkout_timeout_in_secs: time to wait for a connection to be
+            returned when `max_size` connections are checked out, before
+            raising `PoolError`
+        :param health_check_query: query run on a connection before checking
+            it out, to replace the connections that were dropped by the
+            server. `None` to only check whether the connection is closed
+        :param reset_query: query run on a returned connection to reset the
+            session (e.g., temp tables, `SET` params, `LISTEN` channels).
+            `None` to skip it
+        """
+        hdbg.dassert_lte(0, min_size)
+        hdbg.dassert_lte(min_size, max_size)
+        hdbg.dassert_lt(0, max_size)
+        hdbg.dassert_lt(0, idle_timeout_in_secs)
+        self._connect_func = connect_func
+        self._min_size = min_size
+        self._max_size = max_size
+        self._idle_timeout_in_secs = idle_timeout_in_secs
+        self._checkout_timeout_in_secs = checkout_timeout_in_secs
+        self._health_check_query = health_check_query
+        self._reset_query = reset_query
+        self._cond = threading.Condition()
+        # Idle connections with the time when they were returned, from the
+        # least to the most recently used.
+        self._idle: Deque[Tuple[DbConnection, float]] = collections.deque()
+        # Number of open connections, idle or checked out.
+        self._num_connections = 0
+        # Session settings of the open connections at creation time, by
+        # connection id.
+        self._session_settings: Dict[int, Tuple[Any, ...]] = {}
+        # Open connections by id, to check ownership and to keep the ids
+        # valid.
+        self._connections: Dict[int, DbConnection] = {}
+        self._is_closed = False
+        # Connections can't be shared across processes.
+        self._pid = os.getpid()
+        for _ in range(min_size):
+            connection = self._connect()
+            self._idle.append((connection, time.monotonic()))
+
+    def __enter__(self) -> "ConnectionPool":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    @property
+    def num_connections(self) -> int:
+        """
+        Return the number of open connections, idle or checked out.
+        """
+        return self._num_connections
+
+    @property
+    def num_idle_connections(self) -> int:
+        return len(self._idle)
+
+    @property
+    def is_closed(self) -> bool:
+        return self._is_closed
+
+    def get_connection(
+        self, *, timeout_in_secs: Optional[float] = None
+    ) -> DbConnection:
+        """
+        Check out a connection, opening one if no connection is idle.
+
+        :param timeout_in_secs: override `checkout_timeout_in_secs`
+        """
+        if timeout_in_secs is None:
+            timeout_in_secs = self._checkout_timeout_in_secs
+        deadline = time.monotonic() + timeout_in_secs
+        while True:
+            with self._cond:
+                hdbg.dassert(not self._is_closed, "The pool is closed")
+                self._maybe_reset_after_fork()
+                self._close_idle_connections()
+                if self._idle:
+                    connection, _ = self._idle.pop()
+                elif self._num_connections < self._max_size:
+                    # Reserve a slot and open the connection outside the lock.
+                    self._num_connections += 1
+                    connection = None
+                else:
+                    remaining_time = deadline - time.monotonic()
+                    if remaining_time <= 0:
+                        raise pspool.PoolError(
+                            f"No connection available after {timeout_in_secs} "
+                            f"seconds with max_size={self._max_size}"
+                        )
+                    self._cond.wait(remaining_time)
+                    continue
+            if connection is None:
+                try:
+                    connection = self._connect(reserved=True)
+                except Exception:
+                    self._release_slot()
+                    raise
+                break
+            if self._is_healthy(connection):
+                break
+            _LOG.warning("Replacing a broken connection")
+            self._discard(connection)
+        return connection
+
+    def put_connection(self, connection: DbConnection) -> None:
+        """
+        Return a connection to the pool.
+
+        The session of the connection is reset and a broken connection is
+        closed.
+        """
+        if os.getpid() != self._pid:
+            # The connection belongs to the parent process.
+            return
+        with self._cond:
+            hdbg.dassert_is(
+                self._connections.get(id(connection)),
+                connection,
+                "The connection doesn't belong to the pool",
+            )
+            if any(connection is idle for idle, _ in self._idle):
+                # The connection was already returned, e.g., closed twice.
+                return
+        is_broken = bool(connection.closed)
+        if not is_broken:
+            try:
+                self._reset_session(connection)
+            except psycop.Error as e:
+                _LOG.warning("Closing a connection that can't be reset: %s", e)
+                is_broken = True
+        with self._cond:
+            if not is_broken and not self._is_closed:
+                self._idle.append((connection, time.monotonic()))
+                self._cond.notify()
+                return
+        self._discard(connection)
+
+    @contextlib.contextmanager
+    def connection(
+        self, *, timeout_in_secs: Optional[float] = None
+    ) -> Iterator[DbConnection]:
+        """
+        Check out a connection for the duration of a `with` block.
+        """
+        connection = self.get_connection(timeout_in_secs=timeout_in_secs)
+        try:
+            yield connection
+        finally:
+            self.put_connection(connection)
+
+    def close(self) -> None:
+        """
+        Close the idle connections and the ones that are returned later.
+        """
+        with self._cond:
+            self._is_closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for connection in idle:
+            self._discard(connection)
+
+    def _connect(self, *, reserved: bool = False) -> DbConnection:
+        """
+        Open a new connection.
+
+        :param reserved: the slot for the connection was already counted
+        """
+        connection = self._connect_func()
+        session_settings = (
+            connection.autocommit,
+            connection.isolation_level,
+            connection.readonly,
+            connection.deferrable,
+        )
+        with self._cond:
+            self._connections[id(connection)] = connection
+            self._session_settings[id(connection)] = session_settings
+            if not reserved:
+                self._num_connections += 1
+        if isinstance(connection, _PooledConnection):
+            connection.pool = self
+        return connection
+
+    def _forget(self, connection: DbConnection) -> None:
+        """
+        Stop tracking a connection, without closing it.
+
+        Must be called with the lock held.
+        """
+        self._connections.pop(id(connection), None)
+        self._session_settings.pop(id(connection), None)
+        if isinstance(connection, _PooledConnection):
+            connection.pool = None
+
+    def _reset_session(self, connection: DbConnection) -> None:
+        """
+        Restore the session state of a connection at creation time.
+        """
+        status = connection.info.transaction_status
+        if status != psexten.TRANSACTION_STATUS_IDLE:
+            if connection.autocommit:
+                # E.g., the transaction was started with `BEGIN`, which
+                # `rollback()` ignores in autocommit mode.
+                with connection.cursor() as cursor:
+                    cursor.execute("ROLLBACK")
+            else:
+                connection.rollback()
+        autocommit, isolation_level, readonly, deferrable = (
+            self._session_settings[id(connection)]
+        )
+        if self._reset_query is not None:
+            # E.g., `DISCARD ALL` can't run inside a transaction.
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(self._reset_query)
+        connection.autocommit = autocommit
+        connection.isolation_level = isolation_level
+        connection.readonly = readonly
+        connection.deferrable = deferrable
+
+    def _release_slot(self) -> None:
+        with self._cond:
+            self._num_connections -= 1
+            self._cond.notify()
+
+    def _discard(self, connection: DbConnection) -> None:
+        """
+        Close a connection and free its slot.
+        """
+        with self._cond:
+            self._forget(connection)
+        try:
+            connection.close()
+        except psycop.Error as e:
+            _LOG.debug("Error closing connection: %s", e)
+        self._release_slot()
+
+    def _is_healthy(self, connection: DbConnection) -> bool:
+        if connection.closed:
+            return False
+        if self._health_check_query is None:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(self._health_check_query)
+            if not connection.autocommit:
+                connection.rollback()
+        except psycop.Error:
+            return False
+        return True
+
+    def _close_idle_connections(self) -> None:
+        """
+        Close the connections idle for too long in excess of `min_size`.
+
+        Must be called with the lock held.
+        """
+        now = time.monotonic()
+        while (
+            self._idle
+            and self._num_connections > self._min_size
+            and now - self._idle[0][1] > self._idle_timeout_in_secs
+        ):
+            connection, _ = self._idle.popleft()
+            self._forget(connection)
+            try:
+                connection.close()
+            except psycop.Error as e:
+                _LOG.debug("Error closing connection: %s", e)
+            self._num_connections -= 1
+
+    def _maybe_reset_after_fork(self) -> None:
+        """
+        Forget the connections of the parent process after a fork.
+
+        Must be called with the lock held. The connections are not closed
+        since this would close them also for the parent.
+        """
+        if os.getpid() == self._pid:
+            return
+        self._idle.clear()
+        self._connections.clear()
+        self._session_settings.clear()
+        self._num_connections = 0
+        self._pid = os.getpid()
+
+
+# Pools shared by `get_connection(..., use_pool=True)`, by connection params.
+_CONNECTION_POOLS: Dict[Tuple[Any, ...], ConnectionPool] = {}
+_CONNECTION_POOLS_LOCK = threading.Lock()
+
+
+def get_connection_pool(
+    host: str,
+    dbname: str,
+    port: int,
+    user: str,
+    password: str,
+    autocommit: bool = True,
+    **kwargs: Any,
+) -> ConnectionPool:
+    """
+    Return the pool shared by all the callers with the same connection
+    parameters, creating it if needed.
+
+    :param kwargs: params passed to the `ConnectionPool` constructor when
+        the pool is created
+    """
+    key = (host, dbname, port, user, password, autocommit)
+    with _CONNECTION_POOLS_LOCK:
+        pool = _CONNECTION_POOLS.get(key)
+        if pool is None or pool.is_closed:
+
+            def _connect() -> DbConnection:
+                connection = psycop.connect(
+                    host=host,
+                    dbname=dbname,
+                    port=port,
+                    user=user,
+                    password=password,
+                    connection_factory=_PooledConnection,
+                )
+                if autocommit:
+                    connection.autocommit = True
+                return connection
+
+            pool = ConnectionPool(_connect, **kwargs)
+            _CONNECTION_POOLS[key] = pool
+    return pool
+
+
+def close_connection_pools() -> None:
+    """
+    Close all the pools created by `get_connection_pool()`.
+    """
+    with _CONNECTION_POOLS_LOCK:
+        pools = list(_CONNECTION_POOLS.values())
+        _CONNECTION_POOLS.clear()
+    for pool in pools:
+        pool.close()
+
+
 # #############################################################################
 # State of the whole DB
 # #############################################################################
@@ -391,6 +840,67 @@ def get_table_names(connection: DbConnection) -> List[str]:
     return tables
 
 
+# Metadata of the tables of each connection, to avoid a query per insert.
+# It's invalidated when tables are removed through this module and can be
+# invalidated explicitly with `invalidate_table_metadata_cache()`.
+_TABLE_METADATA_CACHE: "weakref.WeakKeyDictionary[DbConnection, Dict]" = (
+    weakref.WeakKeyDictionary()
+)
+_TABLE_METADATA_CACHE_LOCK = threading.Lock()
+
+
+def invalidate_table_metadata_cache(
+    connection: Optional[DbConnection] = None,
+) -> None:
+    """
+    Forget the cached table metadata of `connection` or of all connections.
+
+    Call it after creating or altering tables without this module.
+    """
+    with _TABLE_METADATA_CACHE_LOCK:
+        if connection is None:
+            _TABLE_METADATA_CACHE.clear()
+        else:
+            _TABLE_METADATA_CACHE.pop(connection, None)
+
+
+def _get_table_metadata_cache(connection: DbConnection) -> Dict[str, Any]:
+    with _TABLE_METADATA_CACHE_LOCK:
+        cache = _TABLE_METADATA_CACHE.get(connection)
+        if cache is None:
+            cache = {"table_names": None, "column_types": {}}
+            _TABLE_METADATA_CACHE[connection] = cache
+    return cache
+
+
+def _dassert_table_exists(connection: DbConnection, table_name: str) -> None:
+    """
+    Check that a table exists, querying the DB only if it's not among the
+    cached table names.
+    """
+    cache = _get_table_metadata_cache(connection)
+    table_names: Optional[Set[str]] = cache["table_names"]
+    if table_names is None or table_name not in table_names:
+        table_names = set(get_table_names(connection))
+        cache["table_names"] = table_names
+    hdbg.dassert_in(table_name, table_names)
+
+
+def _get_cached_table_column_types(
+    connection: DbConnection, table_name: str, columns: List[str]
+) -> Dict[str, str]:
+    """
+    Same as `get_table_column_types()` but querying the DB only if the
+    cached types don't include `columns`.
+    """
+    column_types_cache = _get_table_metadata_cache(connection)["column_types"]
+    column_types = column_types_cache.get(table_name)
+    if column_types is None or not set(columns).issubset(column_types):
+        column_types = get_table_column_types(connection, table_name)
+        column_types_cache[table_name] = column_types
+    return column_types
+
+
 def get_tables_size(
     connection: DbConnection,
     only_public: bool = True,
@@ -483,6 +993,28 @@ def get_table_columns(connection: DbConnection, table_name: str) -> List[str]:
     return columns
 
 
+def get_table_column_types(
+    connection: DbConnection, table_name: str
+) -> Dict[str, str]:
+    """
+    Get the column names and their types for given table.
+
+    :param table_name: table name, optionally qualified with the schema
+    :return: column names in table order and their internal type names, e.g.,
+        `{"id": "int4", "timestamp": "timestamptz", "name": "text"}`
+    """
+    query = """
+        SELECT a.attname, t.typname
+            FROM pg_attribute a JOIN pg_type t ON a.atttypid = t.oid
+            WHERE a.attrelid = %s::regclass AND a.attnum > 0
+                AND NOT a.attisdropped
+            ORDER BY a.attnum"""
+    with connection.cursor() as cursor:
+        cursor.execute(query, (table_name,))
+        column_types = dict(cursor.fetchall())
+    return column_types
+
+
 def find_tables_common_columns(
     connection: DbConnection,
     tables: List[str],
@@ -537,6 +1069,7 @@ def remove_table(
     if cascade:
         query = " ".join([query, "CASCADE"])
     connection.cursor().execute(query)
+    invalidate_table_metadata_cache(connection)
 
 
 def remove_all_tables(connection: DbConnection, cascade: bool = False) -> None:
@@ -570,6 +1103,10 @@ def execute_query_to_df(
 ) -> pd.DataFrame:
     """
     Execute a query.
+
+    To read results that don't fit in memory or deep pages, see
+    `execute_query_to_df_chunks()` and
+    `execute_query_to_df_with_keyset_pagination()`.
     """
     if False:
         # Ask the user before executing a query.
@@ -605,6 +1142,164 @@ def execute_query_to_df(
     return df
 
 
+# Dtypes of the columns of the dfs built from query results, by OID of the
+# PostgreSQL type, so that all the chunks of a result have the same dtypes
+# regardless of their values. The columns of the other types are `object`.
+_PG_TYPE_OID_TO_DTYPE = {
+    # bool.
+    16: "boolean",
+    # int8, int2, int4.
+    20: "Int64",
+    21: "Int64",
+    23: "Int64",
+    # float4, float8.
+    700: "float64",
+    701: "float64",
+    # timestamp, timestamptz.
+    1114: "datetime64[ns]",
+    1184: "datetime64[ns, UTC]",
+}
+
+
+def _rows_to_df(rows: List[tuple], description: Any) -> pd.DataFrame:
+    """
+    Build a df from rows returned by a cursor, with dtypes depending only
+    on the types of the columns.
+
+    :param description: `cursor.description` of the query
+    """
+    columns = [column.name for column in description]
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    for idx, column in enumerate(description):
+        dtype = _PG_TYPE_OID_TO_DTYPE.get(column.type_code)
+        if dtype is None:
+            continue
+        srs = df.iloc[:, idx]
+        if dtype == "datetime64[ns, UTC]":
+            srs = pd.to_datetime(srs, utc=True)
+        elif dtype == "datetime64[ns]":
+            srs = pd.to_datetime(srs)
+        else:
+            srs = srs.astype(dtype)
+        df.isetitem(idx, srs)
+    return df
+
+
+def execute_query_to_df_chunks(
+    connection: DbConnection,
+    query: str,
+    *,
+    chunk_size_in_rows: int = 100_000,
+) -> Iterator[pd.DataFrame]:
+    """
+    Execute a query and yield the result in chunks, streaming it with a
+    server-side cursor.
+
+    Unlike `execute_query_to_df()`, the memory used doesn't depend on the
+    size of the result. All the chunks have the same dtypes, which depend on
+    the types of the columns (see `_PG_TYPE_OID_TO_DTYPE`), e.g., integer
+    columns are `Int64` also when they have no nulls.
+
+    A server-side cursor lives in a transaction, so an autocommit connection
+    is switched to a transaction while iterating. The connection can't be
+    used for other queries until the iteration is over.
+
+    :param query: query to execute
+    :param chunk_size_in_rows: number of rows to fetch from the server and
+        to yield at a time
+    """
+    hdbg.dassert_lt(0, chunk_size_in_rows)
+    autocommit = connection.autocommit
+    if autocommit:
+        connection.autocommit = False
+    cursor = connection.cursor(name=f"hsql_cursor_{uuid.uuid4().hex}")
+    cursor.itersize = chunk_size_in_rows
+    try:
+        cursor.execute(query)
+        is_first_chunk = True
+        while True:
+            rows = cursor.fetchmany(chunk_size_in_rows)
+            if not rows and not is_first_chunk:
+                break
+            # Yield an empty df for an empty result, to report the columns.
+            yield _rows_to_df(rows, cursor.description)
+            is_first_chunk = False
+            if len(rows) < chunk_size_in_rows:
+                break
+    finally:
+        if not cursor.closed and (
+            connection.info.transaction_status
+            != psexten.TRANSACTION_STATUS_INERROR
+        ):
+            cursor.close()
+        if autocommit:
+            # End the transaction opened for the cursor.
+            connection.rollback()
+            connection.autocommit = True
+
+
+def execute_query_to_df_with_keyset_pagination(
+    connection: DbConnection,
+    query: str,
+    key_columns: List[str],
+    *,
+    page_size_in_rows: int = 100_000,
+) -> Iterator[pd.DataFrame]:
+    """
+    Execute a query and yield the result in pages ordered by `key_columns`.
+
+    Each page is fetched by a separate query starting after the last key of
+    the previous page, e.g.,
+    ```
+    SELECT * FROM (<query>) AS q WHERE (timestamp, id) > (%s, %s)
+        ORDER BY timestamp, id LIMIT 100000
+    ```
+    so that, with an index on `key_columns`, fetching a page costs the same
+    regardless of its position, unlike with `OFFSET`. With an autocommit
+    connection no transaction is kept open between pages.
+
+    :param query: query to execute, without `ORDER BY` and `LIMIT`. It is
+        always passed to `cursor.execute()` with params, so a literal `%`
+        must be written as `%%` (e.g., `LIKE 'BTC%%'`)
+    :param key_columns: non-null columns of the result that identify a row,
+        which are used to order the result
+    :param page_size_in_rows: number of rows in each page
+    :return: the pages as dfs with the same dtypes as in
+        `execute_query_to_df_chunks()`
+    """
+    hdbg.dassert_lt(0, page_size_in_rows)
+    hdbg.dassert_lt(0, len(key_columns))
+    key_columns_str = ",".join(key_columns)
+    placeholders = ",".join(["%s"] * len(key_columns))
+    last_key: Tuple[Any, ...] = ()
+    while True:
+        if not last_key:
+            where = ""
+        else:
+            where = f"WHERE ({key_columns_str}) > ({placeholders})"
+        page_query = (
+            f"SELECT * FROM ({query}) AS q {where} "
+            f"ORDER BY {key_columns_str} LIMIT {page_size_in_rows}"
+        )
+        with connection.cursor() as cursor:
+            # Pass the params also for the first page, so that `%` is
+            # interpreted in the same way for all the pages.
+            cursor.execute(page_query, last_key)
+            rows = cursor.fetchall()
+            description = cursor.description
+        if not rows and last_key:
+            break
+        df = _rows_to_df(rows, description)
+        yield df
+        if len(rows) < page_size_in_rows:
+            break
+        # Convert the key to Python types that `psycopg2` can adapt.
+        last_key = tuple(
+            value.item() if isinstance(value, np.generic) else value
+            for value in df[key_columns].iloc[-1].tolist()
+        )
+
+
 # #############################################################################
 # Insert
 # #############################################################################
@@ -648,7 +1343,7 @@ def copy_rows_with_copy_from(
     :param table_name: name of the table for insertion
     """
     # The target table needs to exist.
-    hdbg.dassert_in(table_name, get_table_names(connection))
+    _dassert_table_exists(connection, table_name)
     # Read the data.
     buffer = io.StringIO()
     df.to_csv(buffer, index=False, header=False)
@@ -660,6 +1355,348 @@ def copy_rows_with_copy_from(
     connection.commit()
 
 
+# The binary COPY format is described at
+# https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+_BINARY_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_BINARY_COPY_TRAILER = struct.pack(">h", -1)
+
+# Big-endian encoding of the PostgreSQL types with a fixed size.
+_BINARY_COPY_FIXED_SIZE_TYPES = {
+    "bool": np.dtype("u1"),
+    "int2": np.dtype(">i2"),
+    "int4": np.dtype(">i4"),
+    "int8": np.dtype(">i8"),
+    "float4": np.dtype(">f4"),
+    "float8": np.dtype(">f8"),
+    # Microseconds since 2000-01-01.
+    "timestamp": np.dtype(">i8"),
+    "timestamptz": np.dtype(">i8"),
+    # Days since 2000-01-01.
+    "date": np.dtype(">i4"),
+}
+
+# PostgreSQL types encoded as UTF-8 text.
+_BINARY_COPY_TEXT_TYPES = ("text", "varchar", "bpchar", "name", "json", "jsonb")
+
+
+def _encode_binary_copy_column(
+    srs: pd.Series, pg_type: str
+) -> Tuple[Union[np.ndarray, List[bytes]], np.ndarray]:
+    """
+    Encode the values of a column in the binary COPY format of `pg_type`.
+
+    :return:
+        - a big-endian array for the types with a fixed size, or the encoded
+          values that are not null, for the other types
+        - a bool array that is True for the null values
+    """
+    is_null = srs.isna().to_numpy()
+    if pg_type in _BINARY_COPY_FIXED_SIZE_TYPES:
+        dtype = _BINARY_COPY_FIXED_SIZE_TYPES[pg_type]
+        if pg_type in ("timestamp", "timestamptz", "date"):
+            times = pd.to_datetime(srs)
+            if times.dt.tz is not None:
+                times = times.dt.tz_convert("UTC").dt.tz_localize(None)
+            unit = "D" if pg_type == "date" else "us"
+            values = times.to_numpy().astype(f"datetime64[{unit}]")
+            values = values - np.datetime64("2000-01-01", unit)
+            values = values.view("i8")
+        else:
+            values = srs.to_numpy(na_value=0)
+        encoded_values = np.ascontiguousarray(values, dtype=dtype)
+        if dtype.kind == "i" and not np.array_equal(encoded_values, values):
+            # E.g., a float with a fractional part or an int overflowing.
+            raise ValueError(
+                f"Column '{srs.name}' has values that can't be stored "
+                f"exactly as '{pg_type}'"
+            )
+        values = encoded_values
+    elif pg_type in _BINARY_COPY_TEXT_TYPES:
+        values = [str(value).encode("utf-8") for value in srs[~is_null]]
+        if pg_type == "jsonb":
+            # Prepend the version of the jsonb format.
+            values = [b"\x01" + value for value in values]
+    else:
+        raise ValueError(
+            f"Type '{pg_type}' of column '{srs.name}' is not supported: use "
+            "`copy_rows_with_copy_from()`"
+        )
+    return values, is_null
+
+
+def _scatter_bytes(
+    buffer: np.ndarray, offsets: np.ndarray, values: np.ndarray
+) -> None:
+    """
+    Write each of `values` in `buffer` starting at the corresponding offset.
+    """
+    width = values.dtype.itemsize
+    values = np.ascontiguousarray(values).view(np.uint8).reshape(-1, width)
+    buffer[offsets[:, None] + np.arange(width)] = values
+
+
+def _encode_binary_copy_rows(df: pd.DataFrame, pg_types: List[str]) -> bytes:
+    """
+    Encode the rows of `df` in the binary COPY format.
+
+    :param pg_types: PostgreSQL types of the columns of `df`
+    """
+    num_rows, num_cols = df.shape
+    columns = [
+        _encode_binary_copy_column(srs, pg_type)
+        for (_, srs), pg_type in zip(df.items(), pg_types)
+    ]
+    is_fixed_size = [isinstance(values, np.ndarray) for values, _ in columns]
+    if all(is_fixed_size) and not any(is_null.any() for _, is_null in columns):
+        # All the rows have the same layout, so we build them in one shot.
+        fields = [("num_cols", ">i2")]
+        for idx, (values, _) in enumerate(columns):
+            fields.append((f"size{idx}", ">i4"))
+            fields.append((f"value{idx}", values.dtype))
+        rows = np.empty(num_rows, dtype=fields)
+        rows["num_cols"] = num_cols
+        for idx, (values, _) in enumerate(columns):
+            rows[f"size{idx}"] = values.dtype.itemsize
+            rows[f"value{idx}"] = values
+        return rows.tobytes()
+    # Compute the size of each field and row.
+    sizes = []
+    for values, is_null in columns:
+        size = np.zeros(num_rows, dtype=np.int64)
+        if isinstance(values, np.ndarray):
+            size[~is_null] = values.dtype.itemsize
+        else:
+            size[~is_null] = [len(value) for value in values]
+        sizes.append(size)
+    row_sizes = 2 + 4 * num_cols + np.sum(sizes, axis=0)
+    offsets = np.zeros(num_rows, dtype=np.int64)
+    np.cumsum(row_sizes[:-1], out=offsets[1:])
+    buffer = np.empty(int(row_sizes.sum()), dtype=np.uint8)
+    # Write the fields.
+    _scatter_bytes(buffer, offsets, np.full(num_rows, num_cols, dtype=">i2"))
+    offsets += 2
+    for (values, is_null), size in zip(columns, sizes):
+        field_sizes = np.where(is_null, -1, size).astype(">i4")
+        _scatter_bytes(buffer, offsets, field_sizes)
+        offsets += 4
+        is_not_null = ~is_null
+        if isinstance(values, np.ndarray):
+            _scatter_bytes(buffer, offsets[is_not_null], values[is_not_null])
+        elif values:
+            data = np.frombuffer(b"".join(values), dtype=np.uint8)
+            # Map each byte of `data` to its position in `buffer`.
+            value_sizes = size[is_not_null]
+            value_starts = np.cumsum(value_sizes) - value_sizes
+            positions = np.repeat(
+                offsets[is_not_null] - value_starts, value_sizes
+            )
+            positions += np.arange(len(data))
+            buffer[positions] = data
+        offsets += size
+    return buffer.tobytes()
+
+
+class _BinaryCopyStream(io.RawIOBase):
+    """
+    File-like object reading `df` in the binary COPY format, one chunk of
+    rows at a time.
+    """
+
+    def __init__(
+        self, df: pd.DataFrame, pg_types: List[str], chunk_size_in_rows: int
+    ) -> None:
+        self._chunks = self._iterate_chunks(df, pg_types, chunk_size_in_rows)
+        self._buffer = memoryview(b"")
+        # Error raised encoding the rows, which `psycopg2` reports only as a
+        # failed COPY.
+        self.error: Optional[Exception] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b: Any) -> int:
+        while not self._buffer:
+            try:
+                chunk = next(self._chunks, None)
+            except Exception as e:
+                self.error = e
+                raise
+            if chunk is None:
+                return 0
+            self._buffer = memoryview(chunk)
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    @staticmethod
+    def _iterate_chunks(
+        df: pd.DataFrame, pg_types: List[str], chunk_size_in_rows: int
+    ) -> Iterator[bytes]:
+        yield _BINARY_COPY_HEADER
+        for start in range(0, df.shape[0], chunk_size_in_rows):
+            chunk = df.iloc[start : start + chunk_size_in_rows]
+            yield _encode_binary_copy_rows(chunk, pg_types)
+        yield _BINARY_COPY_TRAILER
+
+
+def _copy_binary_stream(
+    cursor: Any, query: str, stream: _BinaryCopyStream
+) -> None:
+    """
+    Run a COPY from `stream`, raising the encoding errors as they are.
+    """
+    try:
+        cursor.copy_expert(query, stream, size=1024**2)
+    except psycop.Error:
+        if stream.error is not None:
+            raise stream.error from None
+        raise
+
+
+def copy_rows_with_binary_copy(
+    connection: DbConnection,
+    df: pd.DataFrame,
+    table_name: str,
+    *,
+    chunk_size_in_rows: int = 100_000,
+    unique_columns: Optional[List[str]] = None,
+    update_on_conflict: bool = True,
+) -> None:
+    """
+    Copy dataframe contents into DB with a binary COPY.
+
+    Unlike `copy_rows_with_copy_from()`, the rows are encoded directly from
+    the columns of `df` in the binary format of the column types of the
+    table, and streamed one chunk at a time, without building a CSV of the
+    whole df. Missing values (e.g., `NaN`, `None`, `NaT`) are stored as
+    NULL and naive timestamps are stored as UTC in `timestamptz` columns.
+
+    :param connection: DB connection
+    :param df: data to insert, with a subset of the columns of the table
+    :param table_name: name of the table for insertion
+    :param chunk_size_in_rows: number of rows to encode at a time
+    :param unique_columns: if not `None`, upsert the rows on these columns,
+        which must have a unique constraint, by copying them into a
+        temporary staging table and merging it into the table
+    :param update_on_conflict: when upserting, update the other columns of
+        the existing rows if True, otherwise keep the existing rows
+    """
+    hdbg.dassert_isinstance(df, pd.DataFrame)
+    hdbg.dassert_lt(0, chunk_size_in_rows)
+    columns = [str(col_name) for col_name in df.columns]
+    column_types = _get_cached_table_column_types(
+        connection, table_name, columns
+    )
+    hdbg.dassert(column_types, "Table '%s' doesn't exist", table_name)
+    hdbg.dassert_is_subset(columns, list(column_types.keys()))
+    pg_types = [column_types[col_name] for col_name in columns]
+    columns_str = ",".join(columns)
+    stream = _BinaryCopyStream(df, pg_types, chunk_size_in_rows)
+    cursor = connection.cursor()
+    if unique_columns is None:
+        # Copy the data directly to the table.
+        query = (
+            f"COPY {table_name} ({columns_str}) FROM STDIN WITH (FORMAT binary)"
+        )
+        _copy_binary_stream(cursor, query, stream)
+    else:
+        hdbg.dassert_is_subset(unique_columns, columns)
+        staging_table_name = "tmp_staging_" + table_name.replace(".", "_")
+        cursor.execute(
+            f"CREATE TEMP TABLE {staging_table_name} "
+            f"(LIKE {table_name} INCLUDING DEFAULTS)"
+        )
+        try:
+            query = (
+                f"COPY {staging_table_name} ({columns_str}) FROM STDIN WITH "
+                "(FORMAT binary)"
+            )
+            _copy_binary_stream(cursor, query, stream)
+            # Merge the staging table into the table.
+            update_columns = [
+                col_name
+                for col_name in columns
+                if col_name not in unique_columns
+            ]
+            if update_on_conflict and update_columns:
+                set_str = ",".join(
+                    f"{col_name} = EXCLUDED.{col_name}"
+                    for col_name in update_columns
+                )
+                on_conflict = f"DO UPDATE SET {set_str}"
+            else:
+                on_conflict = "DO NOTHING"
+            query = (
+                f"INSERT INTO {table_name} ({columns_str}) "
+                f"SELECT {columns_str} FROM {staging_table_name} "
+                f"ON CONFLICT ({','.join(unique_columns)}) {on_conflict}"
+            )
+            cursor.execute(query)
+        finally:
+            if (
+                connection.info.transaction_status
+                == psexten.TRANSACTION_STATUS_INERROR
+            ):
+                # Rolling back the failed transaction drops the staging table.
+                connection.rollback()
+            else:
+                cursor.execute(f"DROP TABLE IF EXISTS {staging_table_name}")
+    connection.commit()
+
+
+# Maximum number of values rendered by `execute_values()` in one statement.
+_MAX_VALUES_PER_INSERT_STATEMENT = 50_000
+
+
+def _get_insert_page_size(num_rows: int, num_cols: int) -> int:
+    """
+    Return the number of rows to insert with each statement.
+
+    Small inserts take a single statement, while large inserts are split in
+    pages of the same size with at most `_MAX_VALUES_PER_INSERT_STATEMENT`
+    values.
+    """
+    max_page_size = max(1, _MAX_VALUES_PER_INSERT_STATEMENT // max(1, num_cols))
+    num_pages = max(1, -(-num_rows // max_page_size))
+    page_size = max(1, -(-num_rows // num_pages))
+    return page_size
+
+
+def _df_to_insert_values(df: pd.DataFrame) -> List[tuple]:
+    """
+    Convert the rows of a df into tuples of Python values for `psycopg2`.
+
+    The columns are converted at once, with missing values (e.g., `NaN`,
+    `None`, `NaT`) becoming `None`, i.e., NULL.
+    """
+    columns = []
+    for _, srs in df.items():
+        if srs.dtype.kind == "M":
+            # Python datetimes are adapted faster than `pd.Timestamp`.
+            values = srs.array.to_pydatetime().astype(object)
+            values[srs.isna().to_numpy()] = None
+        else:
+            # Numpy scalars become the corresponding Python objects.
+            values = srs.to_numpy(dtype=object, na_value=None)
+        columns.append(values.tolist())
+    return list(zip(*columns))
+
+
+def _execute_insert_values(
+    connection: DbConnection, query: str, df: pd.DataFrame
+) -> None:
+    """
+    Execute an INSERT query with a `VALUES %s` placeholder for the rows of
+    `df`.
+    """
+    values = _df_to_insert_values(df)
+    page_size = _get_insert_page_size(*df.shape)
+    with connection.cursor() as cursor:
+        extras.execute_values(cursor, query, values, page_size=page_size)
+    connection.commit()
+
+
 # TODO(gp): -> table_name, df
 def create_insert_query(df: pd.DataFrame, table_name: str) -> str:
     """
@@ -725,19 +1762,13 @@ def execute_insert_query(
     else:
         df = obj
     hdbg.dassert_isinstance(df, pd.DataFrame)
-    hdbg.dassert_in(table_name, get_table_names(connection))
-    _LOG.debug("df=\n%s", hpandas.df_to_str(df, use_tabulate=False))
-    # Ensure the DataFrame has compatible types with 
-    # downstream consumers (e.g., database).
-    df = df.applymap(lambda x: float(x) if isinstance(x, np.float64) else x)
-    # Transform dataframe into list of tuples.
-    values = [tuple(v) for v in df.to_numpy()]
+    _dassert_table_exists(connection, table_name)
+    if _LOG.isEnabledFor(logging.DEBUG):
+        _LOG.debug("df=\n%s", hpandas.df_to_str(df, use_tabulate=False))
     # Generate a query for multiple rows.
     query = create_insert_query(df, table_name)
-    # Execute query for each provided row.
-    cur = connection.cursor()
-    extras.execute_values(cur, query, values)
-    connection.commit()
+    # Execute query for all the rows.
+    _execute_insert_values(connection, query, df)
 
 
 # TODO(gp): -> connection, table_name, obj
@@ -763,10 +1794,9 @@ def execute_insert_on_conflict_do_nothing_query(
     else:
         df = obj
     hdbg.dassert_isinstance(df, pd.DataFrame)
-    hdbg.dassert_in(table_name, get_table_names(connection))
-    _LOG.debug("df=\n%s", hpandas.df_to_str(df, use_tabulate=False))
-    # Transform dataframe into list of tuples.
-    values = [tuple(v) for v in df.to_numpy()]
+    _dassert_table_exists(connection, table_name)
+    if _LOG.isEnabledFor(logging.DEBUG):
+        _LOG.debug("df=\n%s", hpandas.df_to_str(df, use_tabulate=False))
     # Generate a query for multiple rows.
     if not unique_columns:
         # If unique_columns is an empty list, currently used when saving
@@ -776,17 +1806,15 @@ def execute_insert_on_conflict_do_nothing_query(
         query = create_insert_on_conflict_do_nothing_query(
             df, table_name, unique_columns
         )
-    # Execute query for each provided row.
-    cur = connection.cursor()
+    # Execute query for all the rows.
     try:
-        extras.execute_values(cur, query, values)
-        connection.commit()
+        _execute_insert_values(connection, query, df)
     except Exception as e:
         _LOG.error(
             "Failed to insert data with the '%s'. Query %s. Values: %s",
             str(e),
             query,
-            values,
+            df.values.tolist(),
         )
         raise e
 
@@ -853,6 +1881,183 @@ def get_remove_duplicates_query(
     return remove_statement
 
 
+def get_index_column_names(
+    connection: DbConnection, table_name: str
+) -> List[List[str]]:
+    """
+    Return the names of the columns of each index of a table, in index order.
+    """
+    query = """
+        SELECT array_agg(a.attname ORDER BY k.ord)
+        FROM pg_index AS i
+        CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute AS a
+            ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+        WHERE i.indrelid = to_regclass(%s)
+        GROUP BY i.indexrelid
+    """
+    cursor = connection.cursor()
+    cursor.execute(query, (table_name,))
+    index_column_names = [column_names for (column_names,) in cursor.fetchall()]
+    return index_column_names
+
+
+def create_index_if_not_exists(
+    connection: DbConnection,
+    table_name: str,
+    column_names: List[str],
+    *,
+    index_name: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Create an index on columns of a table, unless one already covers them.
+
+    An existing index covers the columns if it starts with them in the same
+    order, since it can serve the same lookups.
+
+    :param connection: connection to the DB
+    :param table_name: name of the table
+    :param column_names: names of the columns to index
+    :param index_name: name of the index to create, by default
+        `{table_name}_{column_names}_idx`
+    :return: name of the created index or `None` if it was not needed
+    """
+    hdbg.dassert_lte(1, len(column_names))
+    _dassert_table_exists(connection, table_name)
+    for index_column_names in get_index_column_names(connection, table_name):
+        if index_column_names[: len(column_names)] == column_names:
+            _LOG.debug(
+                "Table '%s' has already an index on %s: %s",
+                table_name,
+                column_names,
+                index_column_names,
+            )
+            return None
+    if index_name is None:
+        index_name = "_".join([table_name] + column_names + ["idx"])
+    query = (
+        f"CREATE INDEX IF NOT EXISTS {index_name}"
+        f" ON {table_name} ({', '.join(column_names)})"
+    )
+    _LOG.info("Creating index: %s", query)
+    execute_query(connection, query)
+    return index_name
+
+
+def remove_duplicates(
+    connection: DbConnection,
+    table_name: str,
+    id_col_name: str,
+    column_names: List[str],
+    *,
+    batch_size_in_rows: int = 50_000,
+    create_index: bool = True,
+) -> int:
+    """
+    Remove duplicates from a table, keeping the last duplicated row.
+
+    The result is the same as running the query from
+    `get_remove_duplicates_query()` (e.g., rows with NULL in `column_names`
+    are never duplicates), but the self-join deletes all the rows in one
+    transaction, locking them for the whole run. Instead this function:
+    - ranks the rows with `ROW_NUMBER() OVER (PARTITION BY ...)` in a single
+      read-only pass, which doesn't block the writers, storing the ids of
+      the duplicated rows in a temporary table
+    - deletes these rows in batches of consecutive ids, each in its own
+      transaction, reporting the progress
+
+    Rows inserted while the function runs are not deduplicated.
+
+    :param connection: connection to the DB
+    :param table_name: name of the table
+    :param id_col_name: name of the unique id column, increasing with the
+        insertion order
+    :param column_names: names of the columns to compare on
+    :param batch_size_in_rows: number of rows deleted in each transaction
+    :param create_index: create the index on `id_col_name`, if missing, that
+        the batches use to find the rows to delete
+    :return: number of removed rows
+    """
+    hdbg.dassert_lte(1, len(column_names))
+    hdbg.dassert_not_in(id_col_name, column_names)
+    hdbg.dassert_lte(1, batch_size_in_rows)
+    _dassert_table_exists(connection, table_name)
+    if create_index:
+        create_index_if_not_exists(connection, table_name, [id_col_name])
+    columns = ", ".join(column_names)
+    are_not_null = " AND ".join(f"{c} IS NOT NULL" for c in column_names)
+    duplicates_table_name = f"tmp_{table_name}_duplicates"
+    cursor = connection.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {duplicates_table_name}")
+    try:
+        # Find the duplicated rows, ranking the rows with the same values
+        # from the last one.
+        query = f"""
+            CREATE TEMPORARY TABLE {duplicates_table_name} AS
+            SELECT {id_col_name} FROM (
+                SELECT {id_col_name}, ROW_NUMBER() OVER (
+                    PARTITION BY {columns} ORDER BY {id_col_name} DESC
+                ) AS row_num
+                FROM {table_name}
+                WHERE {are_not_null}
+            ) AS ranked
+            WHERE row_num > 1
+        """
+        cursor.execute(query)
+        num_duplicates = cursor.rowcount
+        _LOG.info(
+            "Found %s duplicated rows in '%s'", num_duplicates, table_name
+        )
+        # Split the ids in batches of `batch_size_in_rows` ids, each one
+        # ending with the id in `batch_ends`.
+        query = f"""
+            SELECT {id_col_name} FROM (
+                SELECT {id_col_name}, ROW_NUMBER() OVER (
+                    ORDER BY {id_col_name}
+                ) AS row_num
+                FROM {duplicates_table_name}
+            ) AS numbered
+            WHERE row_num %% %(batch_size)s = 0
+                OR row_num = %(num_duplicates)s
+            ORDER BY {id_col_name}
+        """
+        cursor.execute(
+            query,
+            {"batch_size": batch_size_in_rows, "num_duplicates": num_duplicates},
+        )
+        batch_ends = [batch_end for (batch_end,) in cursor.fetchall()]
+        if not connection.autocommit:
+            connection.commit()
+        # Delete.
+        query = f"""
+            DELETE FROM {table_name} WHERE {id_col_name} IN (
+                SELECT {id_col_name} FROM {duplicates_table_name}
+                WHERE (%(start)s IS NULL OR {id_col_name} > %(start)s)
+                    AND {id_col_name} <= %(end)s
+            )
+        """
+        tqdm_out = htqdm.TqdmToLogger(_LOG, level=logging.INFO)
+        num_removed_rows = 0
+        start = None
+        for end in tqdm(batch_ends, file=tqdm_out, desc=table_name):
+            cursor.execute(query, {"start": start, "end": end})
+            num_removed_rows += cursor.rowcount
+            if not connection.autocommit:
+                connection.commit()
+            start = end
+    finally:
+        if not connection.autocommit:
+            # Discard a failed transaction, if any.
+            connection.rollback()
+        cursor.execute(f"DROP TABLE IF EXISTS {duplicates_table_name}")
+        if not connection.autocommit:
+            connection.commit()
+    _LOG.info(
+        "Removed %s duplicated rows from '%s'", num_removed_rows, table_name
+    )
+    return num_removed_rows
+
+
 def get_num_rows(connection: DbConnection, table_name: str) -> int:
     """
     Return the number of rows in a DB table.
@@ -866,6 +2071,208 @@ def get_num_rows(connection: DbConnection, table_name: str) -> int:
     return vals[0][0]  # type: ignore[no-any-return]
 
 
+def get_max_value(
+    connection: DbConnection, table_name: str, col_name: str
+) -> Any:
+    """
+    Return the max value of a column of a DB table.
+
+    This is cheap on large tables when the column is indexed, unlike
+    `get_num_rows()`.
+    """
+    cursor = connection.cursor()
+    query = f"SELECT MAX({col_name}) FROM {table_name}"
+    cursor.execute(query)
+    vals = cursor.fetchall()
+    hdbg.dassert_eq(len(vals), 1)
+    return vals[0][0]
+
+
+# #############################################################################
+# Notification functions
+# #############################################################################
+
+
+def get_notification_channel(table_name: str) -> str:
+    """
+    Return the name of the channel notified when a table changes.
+
+    The name is lower case, like an unquoted table name in SQL, so that all
+    the spellings of a table name map to the same channel. Channel names are
+    case-sensitive in `pg_notify()` but lower cased by an unquoted `LISTEN`,
+    so the name must always be quoted.
+    """
+    channel = f"{table_name}_changes".lower()
+    # PostgreSQL truncates longer identifiers.
+    hdbg.dassert_lte(
+        len(channel.encode()), 63, "Channel name '%s' is too long", channel
+    )
+    return channel
+
+
+def _get_notification_trigger_name(table_name: str) -> str:
+    """
+    Return the name of the trigger and of the function notifying the changes
+    of a table, also when the table name is qualified by the schema.
+    """
+    return table_name.replace(".", "_") + "_notify"
+
+
+def create_notification_trigger(
+    connection: DbConnection, table_name: str
+) -> None:
+    """
+    Install a trigger notifying the channel of a table on every change.
+
+    The trigger fires once per statement (not per row) on `INSERT`, `UPDATE`,
+    `DELETE` and `TRUNCATE`, with the operation as payload. The listeners
+    receive the notification when the transaction commits.
+
+    :param connection: connection to the DB
+    :param table_name: name of the table to watch
+    """
+    if "." not in table_name:
+        # Only the tables in the public schema are cached.
+        _dassert_table_exists(connection, table_name)
+    channel = psql.Literal(get_notification_channel(table_name))
+    channel_str = channel.as_string(connection)
+    trigger_name = _get_notification_trigger_name(table_name)
+    query = f"""
+        CREATE OR REPLACE FUNCTION {trigger_name}() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify({channel_str}, TG_OP);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        DROP TRIGGER IF EXISTS {trigger_name} ON {table_name};
+        CREATE TRIGGER {trigger_name}
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table_name}
+            FOR EACH STATEMENT EXECUTE FUNCTION {trigger_name}();
+    """
+    execute_query(connection, query)
+
+
+def remove_notification_trigger(
+    connection: DbConnection, table_name: str
+) -> None:
+    """
+    Remove the trigger installed by `create_notification_trigger()`, if any.
+    """
+    trigger_name = _get_notification_trigger_name(table_name)
+    query = f"""
+        DROP TRIGGER IF EXISTS {trigger_name} ON {table_name};
+        DROP FUNCTION IF EXISTS {trigger_name}();
+    """
+    execute_query(connection, query)
+
+
+def has_notification_trigger(connection: DbConnection, table_name: str) -> bool:
+    """
+    Return whether a table has the trigger from `create_notification_trigger()`.
+    """
+    cursor = connection.cursor()
+    query = (
+        "SELECT 1 FROM pg_trigger"
+        " WHERE tgrelid = to_regclass(%s) AND tgname = %s"
+    )
+    trigger_name = _get_notification_trigger_name(table_name)
+    cursor.execute(query, (table_name, trigger_name))
+    return len(cursor.fetchall()) > 0
+
+
+async def wait_for_table_change(
+    polling_func: hasynci.PollingFunction,
+    connection: DbConnection,
+    table_name: str,
+    poll_kwargs: Dict[str, Any],
+    *,
+    tag: Optional[str] = None,
+    use_notifications: bool = True,
+) -> Tuple[int, Any]:
+    """
+    Call `polling_func()` every time a table changes until it returns success.
+
+    If the table has a notification trigger (see
+    `create_notification_trigger()`) and the connection is in autocommit
+    mode, the function listens to the channel of the table and calls
+    `polling_func()` once upfront and then only when a notification arrives.
+    Otherwise, it falls back to `hasynci.poll()`, calling `polling_func()`
+    every `sleep_in_secs` secs.
+
+    :param polling_func: function returning a tuple (success, value)
+    :param connection: connection to the DB, also used by `polling_func()`
+    :param table_name: name of the table to watch
+    :param poll_kwargs: a dictionary with the kwargs for `poll()`
+    :param tag: name of the caller function
+    :param use_notifications: use the notifications, if available
+    :return:
+        - number of calls to `polling_func`
+        - result from `polling_func`
+    :raises: TimeoutError if there is no success within `timeout_in_secs`
+        secs
+    """
+    if tag is None:
+        # Use the function calling this function.
+        tag = hintros.get_function_name(count=0)
+    use_notifications = (
+        use_notifications
+        and connection.autocommit
+        and has_notification_trigger(connection, table_name)
+    )
+    if use_notifications:
+        loop = asyncio.get_running_loop()
+        is_readable = asyncio.Event()
+        try:
+            loop.add_reader(connection.fileno(), is_readable.set)
+        except (NotImplementedError, RuntimeError) as e:
+            # E.g., the event loop can't watch sockets.
+            _LOG.debug("Can't watch the DB connection: %s", e)
+            use_notifications = False
+    if not use_notifications:
+        _LOG.debug("%s: polling table '%s'", tag, table_name)
+        return await hasynci.poll(polling_func, tag=tag, **poll_kwargs)
+    _LOG.debug("%s: listening to the changes of table '%s'", tag, table_name)
+    timeout_in_secs = poll_kwargs["timeout_in_secs"]
+    hdbg.dassert_lt(0, timeout_in_secs)
+    channel = psql.Identifier(get_notification_channel(table_name))
+    cursor = connection.cursor()
+    # Listen before checking, so that no change is lost between the check and
+    # the wait.
+    cursor.execute(psql.SQL("LISTEN {}").format(channel))
+    try:
+        deadline = loop.time() + timeout_in_secs
+        num_iter = 1
+        while True:
+            # Consume the notifications for the changes that the check is
+            # going to see.
+            connection.poll()
+            del connection.notifies[:]
+            is_readable.clear()
+            success, value = polling_func()
+            _LOG.debug("success=%s, value=%s", success, value)
+            if success:
+                return num_iter, value
+            num_iter += 1
+            if connection.notifies:
+                # The notifications arrived while running the check have
+                # already been read from the socket, so check again.
+                continue
+            try:
+                await asyncio.wait_for(
+                    is_readable.wait(), deadline - loop.time()
+                )
+            except asyncio.TimeoutError as e:
+                msg = "Timeout for " + hprint.to_str(
+                    "polling_func table_name timeout_in_secs tag"
+                )
+                _LOG.error(msg)
+                raise TimeoutError(msg) from e
+    finally:
+        loop.remove_reader(connection.fileno())
+        cursor.execute(psql.SQL("UNLISTEN {}").format(channel))
+        del connection.notifies[:]
+
+
 # #############################################################################
 # Polling functions
 # #############################################################################
@@ -886,26 +2293,69 @@ def is_row_with_value_present(
     E.g., this can be used with polling to wait for the target value
     "hello_world.txt" in the "filename" field of the table "table_name" to appear
 
+    :param show_db_state: log the content of the table, when the debug
+        logging is enabled
     :return:
         - success if the value is present
         - result: None
     """
     _LOG.debug(hprint.to_str("connection table_name field_name target_value"))
     # Print the state of the DB, if needed.
-    if show_db_state:
+    if show_db_state and _LOG.isEnabledFor(logging.DEBUG):
         query = f"SELECT * FROM {table_name} ORDER BY filename"
         df = execute_query_to_df(connection, query)
         _LOG.debug("df=\n%s", hpandas.df_to_str(df, use_tabulate=False))
     # Check if the required row is available.
-    query = f"SELECT {field_name} FROM {table_name} WHERE {field_name}='{target_value}'"
-    df = execute_query_to_df(connection, query)
-    _LOG.debug("df=\n%s", hpandas.df_to_str(df, use_tabulate=False))
+    cursor = connection.cursor()
+    query = f"SELECT 1 FROM {table_name} WHERE {field_name} = %s LIMIT 1"
+    cursor.execute(query, (target_value,))
     # Package results.
-    success = df.shape[0] > 0
+    success = len(cursor.fetchall()) > 0
     result = None
     return success, result
 
 
+async def wait_for_row_with_value(
+    get_wall_clock_time: hdateti.GetWallClockTime,
+    db_connection: DbConnection,
+    table_name: str,
+    field_name: str,
+    target_value: str,
+    poll_kwargs: Dict[str, Any],
+    *,
+    tag: Optional[str] = None,
+    use_notifications: bool = True,
+) -> None:
+    """
+    Wait until a row with `field_name` == `target_value` is in a table.
+
+    See `wait_for_table_change()` for the params.
+    """
+    if tag is None:
+        # Use name of the caller function.
+        tag = hintros.get_function_name(count=0)
+    if poll_kwargs is None:
+        poll_kwargs = hasynci.get_poll_kwargs(get_wall_clock_time)
+
+    def _is_row_with_value_present() -> hasynci.PollOutput:
+        return is_row_with_value_present(
+            db_connection,
+            table_name,
+            field_name,
+            target_value,
+            show_db_state=False,
+        )
+
+    await wait_for_table_change(
+        _is_row_with_value_present,
+        db_connection,
+        table_name,
+        poll_kwargs,
+        tag=tag,
+        use_notifications=use_notifications,
+    )
+
+
 # TODO(gp): Add unit test.
 async def wait_for_change_in_number_of_rows(
     get_wall_clock_time: hdateti.GetWallClockTime,
@@ -914,20 +2364,40 @@ async def wait_for_change_in_number_of_rows(
     poll_kwargs: Dict[str, Any],
     *,
     tag: Optional[str] = None,
+    id_col_name: Optional[str] = None,
+    use_notifications: bool = True,
 ) -> int:
     """
     Wait until the number of rows in a table changes.
 
+    The number of rows is checked only when the table changes, if it has a
+    notification trigger, or every `sleep_in_secs` otherwise (see
+    `wait_for_table_change()`).
+
     :param get_wall_clock_time: a function to get current time
     :param db_connection: connection to the target DB
     :param table_name: name of the table to poll
     :param poll_kwargs: a dictionary with the kwargs for `poll()`
     :param tag: name of the caller function
+    :param id_col_name: name of an indexed and increasing id column; if
+        passed, the rows are counted only when the max id changes, which is
+        cheaper than counting the rows of a large table at every check, but
+        misses the deletions
+    :param use_notifications: use the notifications, if available
     :return: number of new rows found
     """
     num_rows = get_num_rows(db_connection, table_name)
+    max_id = None
+    if id_col_name is not None:
+        max_id = get_max_value(db_connection, table_name, id_col_name)
 
     def _is_number_of_rows_changed() -> hasynci.PollOutput:
+        nonlocal max_id
+        if id_col_name is not None:
+            new_max_id = get_max_value(db_connection, table_name, id_col_name)
+            if new_max_id == max_id:
+                return False, 0
+            max_id = new_max_id
         new_num_rows = get_num_rows(db_connection, table_name)
         _LOG.debug("new_num_rows=%s num_rows=%s", new_num_rows, num_rows)
         success = new_num_rows != num_rows
@@ -940,10 +2410,13 @@ async def wait_for_change_in_number_of_rows(
         tag = hintros.get_function_name(count=0)
     if poll_kwargs is None:
         poll_kwargs = hasynci.get_poll_kwargs(get_wall_clock_time)
-    num_iters, diff_num_rows = await hasynci.poll(
+    num_iters, diff_num_rows = await wait_for_table_change(
         _is_number_of_rows_changed,
+        db_connection,
+        table_name,
+        poll_kwargs,
         tag=tag,
-        **poll_kwargs,
+        use_notifications=use_notifications,
     )
     _ = num_iters
     diff_num_rows = cast(int, diff_num_rows)
@@ -1,9 +1,12 @@
 import logging
 import os
+from typing import Any
 
+import numpy as np
 import pandas as pd
 
 import helpers.hcsv as hcsv
+import helpers.hio as hio
 import helpers.hunit_test as hunitest
 
 _LOG = logging.getLogger(__name__)
@@ -58,9 +61,336 @@ class Test_to_typed_csv(hunitest.TestCase):
 
     def test1(self) -> None:
         dir_name = self.get_input_dir()
-        test_csv_path = os.path.join(dir_name, "test.csv")
-        test_csv_types_path = os.path.join(dir_name, "test.csv.types")
-        df = pd.read_csv(test_csv_path)
+        df = pd.read_csv(os.path.join(dir_name, "test.csv"))
+        # Write to the scratch dir to leave the input untouched.
+        scratch_dir = self.get_scratch_space()
+        test_csv_path = os.path.join(scratch_dir, "test.csv")
+        test_csv_types_path = os.path.join(scratch_dir, "test.csv.types")
         hcsv.to_typed_csv(df, test_csv_path)
         self.assertTrue(os.path.exists(test_csv_types_path))
-        os.remove(test_csv_types_path)
+
+
+def _get_typed_df(num_rows: int) -> pd.DataFrame:
+    """
+    Build a df with columns of all the types supported by typed CSVs.
+    """
+    np.random.seed(42)
+    df = pd.DataFrame(
+        {
+            "timestamp": pd.date_range(
+                "2022-01-01", periods=num_rows, freq="s", tz="America/New_York"
+            ),
+            "naive_timestamp": pd.date_range(
+                "2022-01-01", periods=num_rows, freq="s"
+            ),
+            "asset": pd.Categorical(
+                np.random.choice(["BTC", "ETH", "SOL"], num_rows),
+                categories=["SOL", "ETH", "BTC", "ADA"],
+                ordered=True,
+            ),
+            "price": np.random.rand(num_rows),
+            "volume": np.random.randint(0, 1000, num_rows),
+            "is_buy": np.random.rand(num_rows) > 0.5,
+            "comment": np.random.choice(["a", "b,c", 'd"e', None], num_rows),
+            "delay": pd.to_timedelta(np.random.randint(0, 100, num_rows), "ms"),
+        }
+    )
+    return df
+
+
+class Test_typed_csv_round_trip(hunitest.TestCase):
+    def test1(self) -> None:
+        """
+        Check that the values and dtypes survive a round trip.
+        """
+        df = _get_typed_df(100)
+        df.loc[3, "price"] = np.nan
+        df.loc[4, "timestamp"] = pd.NaT
+        df.loc[5, "asset"] = np.nan
+        file_name = os.path.join(self.get_scratch_space(), "test.csv")
+        # Run.
+        hcsv.to_typed_csv(df, file_name)
+        actual = hcsv.from_typed_csv(file_name)
+        # Check.
+        pd.testing.assert_frame_equal(actual, df)
+
+    def test2(self) -> None:
+        """
+        Check reading a file written by `DataFrame.to_csv()`.
+        """
+        df = _get_typed_df(10)
+        file_name = os.path.join(self.get_scratch_space(), "test.csv")
+        hcsv.to_typed_csv(df, file_name)
+        df.to_csv(file_name, index=False)
+        # Run.
+        actual = hcsv.from_typed_csv(file_name)
+        # Check.
+        pd.testing.assert_frame_equal(actual, df)
+
+
+def _write_sorted_csv(file_name: str, num_rows: int) -> pd.DataFrame:
+    """
+    Write a CSV sorted by the column `key` with `num_rows` rows.
+    """
+    df = pd.DataFrame(
+        {
+            "key": np.arange(num_rows) // 3,
+            "value": np.arange(num_rows) * 0.5,
+        }
+    )
+    df.to_csv(file_name, index=False)
+    return df
+
+
+class Test_build_csv_offset_index(hunitest.TestCase):
+    def test1(self) -> None:
+        """
+        Check the offsets of the sampled lines.
+        """
+        file_name = os.path.join(self.get_scratch_space(), "test.csv")
+        hio.to_file(file_name, "a,b\n1,10\n2,20\n3,30\n4,40\n")
+        # Run.
+        offset_index = hcsv.build_csv_offset_index(file_name, sample_every=2)
+        # Check.
+        self.assertEqual(offset_index["offsets"].tolist(), [0, 9, 19])
+        self.assertEqual(offset_index["num_lines"], 5)
+        self.assertEqual(offset_index["file_size"], 24)
+        # The saved index is the same.
+        loaded_offset_index = hcsv.load_csv_offset_index(file_name)
+        self.assertIsNotNone(loaded_offset_index)
+        self.assertEqual(loaded_offset_index["offsets"].tolist(), [0, 9, 19])
+        # The index is stale after the file changes.
+        hio.to_file(file_name, "a,b\n1,10\n")
+        self.assertIsNone(hcsv.load_csv_offset_index(file_name))
+
+    def test2(self) -> None:
+        """
+        Check that reading a range through the index is the same as parsing.
+        """
+        file_name = os.path.join(self.get_scratch_space(), "test.csv")
+        _write_sorted_csv(file_name, 100)
+        offset_index = hcsv.build_csv_offset_index(file_name, sample_every=7)
+        for from_, to in [(1, 2), (1, 101), (20, 35), (99, 110), (105, 110)]:
+            # Run.
+            actual = hcsv._read_csv_range(
+                file_name, from_, to, offset_index=offset_index
+            )
+            # Check.
+            expected = hcsv._read_csv_range(file_name, from_, to)
+            self.assert_equal(actual.to_csv(), expected.to_csv())
+
+
+class Test_find_first_matching_row_in_sorted_csv(hunitest.TestCase):
+    def test1(self) -> None:
+        """
+        Check that the binary search finds the same row as the scan.
+        """
+        file_name = os.path.join(self.get_scratch_space(), "test.csv")
+        _write_sorted_csv(file_name, 100)
+        for val in [-1, 0, 5, 6, 21, 33, 34]:
+            # Run.
+            actual = hcsv.find_first_matching_row_in_sorted_csv(
+                file_name, "key", val, sample_every=4
+            )
+            # Check.
+            expected = hcsv.find_first_matching_row(
+                file_name, "key", val, nrows_at_a_time=10
+            )
+            self.assertEqual(actual, expected)
+
+
+def _key_by_asset(df: pd.DataFrame) -> Any:
+    return df.groupby("asset")
+
+
+class Test__csv_mapreduce(hunitest.TestCase):
+    def helper(self, file_format: str) -> str:
+        """
+        Split a CSV by asset, with more assets than open files.
+        """
+        scratch_dir = self.get_scratch_space()
+        csv_path = os.path.join(scratch_dir, "input.csv")
+        df = pd.DataFrame(
+            {
+                "asset": [f"asset{i % 3}" for i in range(20)],
+                "value": range(20),
+            }
+        )
+        df.to_csv(csv_path, index=False)
+        out_dir = os.path.join(scratch_dir, "output")
+        hio.create_dir(out_dir, incremental=False)
+        # Run.
+        hcsv._csv_mapreduce(
+            csv_path,
+            out_dir,
+            _key_by_asset,
+            None,
+            chunk_size=4,
+            file_format=file_format,
+            max_open_files=2,
+            buffer_size_in_bytes=16,
+        )
+        return out_dir
+
+    def test1(self) -> None:
+        """
+        Check the CSV output.
+        """
+        out_dir = self.helper("csv")
+        # Check.
+        self.assertEqual(
+            sorted(os.listdir(out_dir)),
+            ["asset0.csv", "asset1.csv", "asset2.csv"],
+        )
+        actual = hio.from_file(os.path.join(out_dir, "asset1.csv"))
+        expected = r"""
+        asset1,1
+        asset1,4
+        asset1,7
+        asset1,10
+        asset1,13
+        asset1,16
+        asset1,19
+        """
+        self.assert_equal(actual, expected, dedent=True)
+
+    def test2(self) -> None:
+        """
+        Check the Parquet output.
+        """
+        out_dir = self.helper("parquet")
+        # Check.
+        self.assertEqual(
+            sorted(os.listdir(out_dir)), ["asset0", "asset1", "asset2"]
+        )
+        df = pd.read_parquet(os.path.join(out_dir, "asset1"))
+        self.assertEqual(df["value"].tolist(), [1, 4, 7, 10, 13, 16, 19])
+
+
+# #############################################################################
+
+
+def _write_csv_dir(csv_dir: str, num_files: int, num_rows: int) -> None:
+    """
+    Write `num_files` gzipped header-less CSV files to `csv_dir`.
+    """
+    hio.create_dir(csv_dir, incremental=False)
+    for idx in range(num_files):
+        df = pd.DataFrame(
+            {
+                "timestamp": pd.date_range(
+                    "2022-01-01", periods=num_rows, freq="min"
+                ).astype(str),
+                "asset": f"asset{idx}",
+                "close": np.arange(num_rows) + 0.5,
+                "volume": np.arange(num_rows),
+            }
+        )
+        file_name = os.path.join(csv_dir, f"asset{idx}.csv.gz")
+        df.to_csv(file_name, header=False, index=False)
+
+
+def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    df.columns = ["timestamp", "asset", "close", "volume"]
+    return df
+
+
+class Test_convert_csv_dir_to_pq_dir(hunitest.TestCase):
+    def convert(self, csv_dir: str, pq_dir: str, **kwargs: Any) -> None:
+        hcsv.convert_csv_dir_to_pq_dir(
+            csv_dir,
+            pq_dir,
+            normalizer=_normalize_columns,
+            incremental=True,
+            **kwargs,
+        )
+
+    def test1(self) -> None:
+        """
+        Check that converting in blocks gives the same output as `pandas`.
+        """
+        scratch_dir = self.get_scratch_space()
+        csv_dir = os.path.join(scratch_dir, "csv")
+        _write_csv_dir(csv_dir, 3, 100)
+        # Run.
+        pq_dir1 = os.path.join(scratch_dir, "pq1")
+        self.convert(csv_dir, pq_dir1, block_size_in_bytes=1024)
+        pq_dir2 = os.path.join(scratch_dir, "pq2")
+        self.convert(csv_dir, pq_dir2, block_size_in_bytes=None)
+        # Check.
+        self.assertEqual(
+            sorted(os.listdir(pq_dir1)),
+            ["asset0.pq", "asset1.pq", "asset2.pq"],
+        )
+        for file_name in os.listdir(pq_dir1):
+            df1 = pd.read_parquet(os.path.join(pq_dir1, file_name))
+            df2 = pd.read_parquet(os.path.join(pq_dir2, file_name))
+            self.assertEqual(df1.shape, (100, 4))
+            self.assertEqual(df1.dtypes.to_dict(), df2.dtypes.to_dict())
+            pd.testing.assert_frame_equal(df1, df2)
+
+    def test2(self) -> None:
+        """
+        Check that only the changed files are converted in incremental mode.
+        """
+        scratch_dir = self.get_scratch_space()
+        csv_dir = os.path.join(scratch_dir, "csv")
+        _write_csv_dir(csv_dir, 3, 10)
+        pq_dir = os.path.join(scratch_dir, "pq")
+        log_file = os.path.join(scratch_dir, "convert.log")
+        self.convert(
+            csv_dir,
+            pq_dir,
+            num_threads=2,
+            backend="threading",
+            log_file=log_file,
+        )
+        self.assertTrue(os.path.exists(log_file))
+        mtimes = {
+            file_name: os.stat(os.path.join(pq_dir, file_name)).st_mtime_ns
+            for file_name in os.listdir(pq_dir)
+        }
+        # Change one file.
+        df = pd.DataFrame([["2022-01-02 00:00:00", "asset1", 1.5, 1]])
+        df.to_csv(
+            os.path.join(csv_dir, "asset1.csv.gz"), header=False, index=False
+        )
+        # Run.
+        self.convert(csv_dir, pq_dir, num_threads=2, backend="threading")
+        # Check.
+        for file_name, mtime in mtimes.items():
+            new_mtime = os.stat(os.path.join(pq_dir, file_name)).st_mtime_ns
+            self.assertEqual(new_mtime != mtime, file_name == "asset1.pq")
+        df = pd.read_parquet(os.path.join(pq_dir, "asset1.pq"))
+        self.assertEqual(df["volume"].tolist(), [1])
+
+    def test3(self) -> None:
+        """
+        Check that a failed conversion leaves no file behind.
+        """
+        scratch_dir = self.get_scratch_space()
+        csv_dir = os.path.join(scratch_dir, "csv")
+        _write_csv_dir(csv_dir, 1, 100)
+        csv_path = os.path.join(csv_dir, "asset0.csv.gz")
+        pq_path = os.path.join(scratch_dir, "asset0.pq")
+        num_blocks = 0
+
+        def _fail_on_second_block(df: pd.DataFrame) -> pd.DataFrame:
+            nonlocal num_blocks
+            num_blocks += 1
+            if num_blocks == 2:
+                raise ValueError("Invalid block")
+            return _normalize_columns(df)
+
+        # Run.
+        with self.assertRaises(ValueError):
+            hcsv.convert_csv_to_pq(
+                csv_path,
+                pq_path,
+                normalizer=_fail_on_second_block,
+                header=None,
+                block_size_in_bytes=1024,
+            )
+        # Check.
+        self.assertEqual(num_blocks, 2)
+        self.assertEqual(os.listdir(scratch_dir), ["csv"])
@@ -191,6 +191,37 @@ class Test_apply_nan_mode(hunitest.TestCase):
         series = pd.Series(dtype="float64")
         hdatafr.apply_nan_mode(series)
 
+    def test7(self) -> None:
+        """
+        Test that `copy=False` returns the input series if it has no NaNs.
+        """
+        series = self._get_series_with_nans(seed=1).dropna()
+        actual = hdatafr.apply_nan_mode(series, mode="ffill", copy=False)
+        self.assertIs(actual, series)
+        actual = hdatafr.apply_nan_mode(series, mode="ffill")
+        self.assertIsNot(actual, series)
+        hunitest.compare_df(actual, series)
+
+    def test8(self) -> None:
+        """
+        Test the info for `mode="drop"` and the error for `mode="strict"`.
+        """
+        series = self._get_series_with_nans(seed=1)
+        info: dict = {}
+        hdatafr.apply_nan_mode(series, mode="drop", info=info)
+        expected = {
+            "series_name": 0,
+            "num_elems_before": 40,
+            "num_nans_before": 8,
+            "num_elems_removed": 8,
+            "num_nans_imputed": 0,
+            "percentage_elems_removed": 20.0,
+            "percentage_elems_imputed": 0.0,
+        }
+        self.assertDictEqual(info, expected)
+        with self.assertRaises(ValueError):
+            hdatafr.apply_nan_mode(series, mode="strict")
+
     @staticmethod
     def _get_series_with_nans(seed: int) -> pd.Series:
         date_range = {"start": "1/1/2010", "periods": 40, "freq": "M"}
@@ -205,6 +236,83 @@ class Test_apply_nan_mode(hunitest.TestCase):
         return series
 
 
+# #############################################################################
+# Test_apply_nan_mode_to_df
+# #############################################################################
+
+
+class Test_apply_nan_mode_to_df(hunitest.TestCase):
+
+    @staticmethod
+    def get_df() -> pd.DataFrame:
+        df = pd.DataFrame(
+            {
+                "a": [np.nan, 1.0, np.nan, 3.0, 4.0],
+                "b": [np.nan, np.nan, 2.0, np.nan, 4.0],
+                "c": [0.0, 1.0, 2.0, 3.0, 4.0],
+            },
+            index=pd.date_range("2010-01-01", periods=5, freq="D"),
+        )
+        return df
+
+    def test1(self) -> None:
+        """
+        Test that the columns are processed like with `apply_nan_mode()`.
+        """
+        df = self.get_df()
+        for mode in ["leave_unchanged", "ffill", "fill_with_zero"]:
+            actual = hdatafr.apply_nan_mode_to_df(df, mode=mode)
+            expected = df.apply(hdatafr.apply_nan_mode, mode=mode)
+            hunitest.compare_df(actual, expected)
+
+    def test2(self) -> None:
+        """
+        Test that `mode="drop"` drops the rows with NaNs in any column.
+        """
+        df = self.get_df()
+        info: dict = {}
+        actual = hdatafr.apply_nan_mode_to_df(df, mode="drop", info=info)
+        hunitest.compare_df(actual, df.iloc[[4]])
+        self.assertEqual(info["num_elems_removed"], 4)
+        self.assertEqual(
+            info["num_nans_before"].to_dict(), {"a": 2, "b": 3, "c": 0}
+        )
+        self.assertEqual(info["num_nans_imputed"].sum(), 0)
+
+    def test3(self) -> None:
+        """
+        Test that `mode="ffill_and_drop_leading"` drops the rows until all the
+        columns have a value.
+        """
+        df = self.get_df()
+        info: dict = {}
+        actual = hdatafr.apply_nan_mode_to_df(
+            df, mode="ffill_and_drop_leading", info=info
+        )
+        actual = hpandas.df_to_str(actual, num_rows=None)
+        expected = r"""
+                      a    b    c
+        2010-01-03  1.0  2.0  2.0
+        2010-01-04  3.0  2.0  3.0
+        2010-01-05  4.0  4.0  4.0
+        """
+        self.assert_equal(actual, expected, fuzzy_match=True)
+        self.assertEqual(info["num_elems_removed"], 2)
+        self.assertEqual(
+            info["num_nans_imputed"].to_dict(), {"a": 1, "b": 1, "c": 0}
+        )
+
+    def test4(self) -> None:
+        """
+        Test that `copy=False` returns the input df if there is nothing to do.
+        """
+        df = self.get_df()
+        actual = hdatafr.apply_nan_mode_to_df(df, copy=False)
+        self.assertIs(actual, df)
+        with self.assertRaises(ValueError):
+            hdatafr.apply_nan_mode_to_df(df, mode="strict")
+
+
 # #############################################################################
 # Test_compute_points_per_year_for_given_freq
 # #############################################################################
@@ -297,8 +405,50 @@ class TestRemoveDuplicates(hunitest.TestCase):
         control_column = "knowledge_timestamp"
         actual = hdatafr.remove_duplicates(df, duplicate_columns, control_column)
         actual = hpandas.df_to_str(actual)
+        # The row with the max `knowledge_timestamp` is kept.
         expected = r"""
                     dummy_value_1 dummy_value_2 knowledge_timestamp end_download_timestamp
-                    1 2 A 2 2
-                    2 1 A 1 1"""
+                    0 1 A 3 3
+                    1 2 A 2 2"""
+        self.assert_equal(actual, expected, fuzzy_match=True)
+
+    def test_remove_duplicates4(self) -> None:
+        """
+        Test that the rows keep their order and NaNs are equal.
+        """
+        test_data = {
+            "dummy_value_1": [np.nan, 2, np.nan, 2],
+            "knowledge_timestamp": [1, 2, 3, 1],
+        }
+        df = pd.DataFrame(data=test_data, index=[3, 2, 1, 0])
+        duplicate_columns = ["dummy_value_1"]
+        control_column = "knowledge_timestamp"
+        actual = hdatafr.remove_duplicates(df, duplicate_columns, control_column)
+        actual = hpandas.df_to_str(actual)
+        expected = r"""
+                    dummy_value_1 knowledge_timestamp
+                    2 2.0 2
+                    1 NaN 3"""
         self.assert_equal(actual, expected, fuzzy_match=True)
+
+    def test_remove_duplicates5(self) -> None:
+        """
+        Test that an empty list means all the columns and that any list-like
+        is accepted.
+        """
+        test_data = {
+            "dummy_value_1": [1, 2, 1],
+            "dummy_value_2": ["A", "A", "A"],
+        }
+        df = pd.DataFrame(data=test_data)
+        control_column = None
+        expected = r"""
+                    dummy_value_1 dummy_value_2
+                    0 1 A
+                    1 2 A"""
+        for duplicate_columns in [[], ("dummy_value_1",), df.columns]:
+            actual = hdatafr.remove_duplicates(
+                df, duplicate_columns, control_column
+            )
+            actual = hpandas.df_to_str(actual)
+            self.assert_equal(actual, expected, fuzzy_match=True)
@@ -465,6 +465,56 @@ class Test_to_generalized_datetime(hunitest.TestCase):
         )
         pd.testing.assert_series_equal(actual, expected)
 
+    def test_weekly2(self) -> None:
+        """
+        Test weekly dates without separator and with the ISO 8601 standard.
+        """
+        srs = pd.Series(["2020W12", "2021W01"])
+        actual = hdateti.to_generalized_datetime(srs)
+        expected = pd.Series(
+            [pd.Timestamp("2020-03-28"), pd.Timestamp("2021-01-09")]
+        )
+        pd.testing.assert_series_equal(actual, expected)
+        #
+        actual = hdateti.to_generalized_datetime(srs, date_standard="ISO_8601")
+        expected = pd.Series(
+            [pd.Timestamp("2020-03-21"), pd.Timestamp("2021-01-09")]
+        )
+        pd.testing.assert_series_equal(actual, expected)
+
+    def test_mixed1(self) -> None:
+        """
+        Test values in different formats, repeated values and missing values.
+        """
+        srs = pd.Series(
+            ["2021-Q3", "2020W12", "2020-01-15", "1 Jan 2010", None, "2021-Q3"],
+            index=list("abcdef"),
+            name="date",
+        )
+        actual = hdateti.to_generalized_datetime(srs)
+        expected = pd.Series(
+            [
+                pd.Timestamp("2021-09-30"),
+                pd.Timestamp("2020-03-28"),
+                pd.Timestamp("2020-01-15"),
+                pd.Timestamp("2010-01-01"),
+                pd.NaT,
+                pd.Timestamp("2021-09-30"),
+            ],
+            index=list("abcdef"),
+            name="date",
+        )
+        pd.testing.assert_series_equal(actual, expected)
+
+    def test_invalid1(self) -> None:
+        """
+        Test that values that can't be converted become `NaT`.
+        """
+        idx = pd.Index(["2020-M13", "not a date", "2020-M12"])
+        actual = hdateti.to_generalized_datetime(idx)
+        expected = pd.DatetimeIndex([pd.NaT, pd.NaT, pd.Timestamp("2020-12-31")])
+        pd.testing.assert_index_equal(actual, expected)
+
 
 # #############################################################################
 # Test_find_bar_timestamp1
@@ -1,10 +1,12 @@
 import csv
 import datetime
 import io
+import itertools
 import logging
 import os
 import re
 import time
+import unittest.mock as umock
 import uuid
 from typing import Any, Dict, List, Optional, Tuple
 
@@ -12,6 +14,8 @@ import numpy as np
 import pandas as pd
 import pytest
 
+import helpers.hdataframe as hdatafr
+import helpers.hdbg as hdbg
 import helpers.hpandas as hpandas
 import helpers.hprint as hprint
 import helpers.hs3 as hs3
@@ -1115,6 +1119,159 @@ class Test_trim_df2(Test_trim_df1):
         self.check_trimmed_df(df, ts_col_name, start_ts, end_ts)
 
 
+# #############################################################################
+# Test_TrimIndex
+# #############################################################################
+
+
+class Test_TrimIndex(hunitest.TestCase):
+    """
+    Compare `TrimIndex.trim()` with a mask on the filter values.
+    """
+
+    @staticmethod
+    def get_df(layout: str) -> pd.DataFrame:
+        """
+        Get a df with 3 assets and timestamps repeated for each asset.
+
+        :param layout: how the rows are sorted
+            - "by_ts": by timestamp and asset
+            - "by_asset": by asset and timestamp
+            - "shuffled": not sorted
+        """
+        timestamps = pd.date_range("2022-01-04 09:30", periods=20, freq="min")
+        df = pd.DataFrame(
+            {
+                "start_time": np.repeat(timestamps, 3),
+                "asset_id": np.tile([101, 102, 103], 20),
+            }
+        )
+        df["close"] = np.arange(len(df), dtype=float)
+        if layout == "by_asset":
+            df = df.sort_values(["asset_id", "start_time"])
+        elif layout == "shuffled":
+            df = df.sample(frac=1, random_state=0)
+        else:
+            hdbg.dassert_eq(layout, "by_ts")
+        return df
+
+    def check_windows(
+        self, df: pd.DataFrame, ts_col_name: Optional[str], **kwargs: Any
+    ) -> None:
+        """
+        Check trimming `df` to several windows with all the boundary types.
+        """
+        trim_index = hpandas.TrimIndex(df, ts_col_name, **kwargs)
+        if ts_col_name in df.columns:
+            values = df[ts_col_name]
+        else:
+            values = pd.Series(df.index.get_level_values(ts_col_name), df.index)
+        windows = [
+            (pd.Timestamp("2022-01-04 09:33"), pd.Timestamp("2022-01-04 09:38")),
+            (pd.Timestamp("2022-01-04 09:25"), pd.Timestamp("2022-01-04 09:31")),
+            (pd.Timestamp("2022-01-04 09:40"), pd.Timestamp("2022-01-04 09:40")),
+            (None, pd.Timestamp("2022-01-04 09:35")),
+            (pd.Timestamp("2022-01-04 09:45"), None),
+        ]
+        # Use the timezone of the values for the windows.
+        tz = getattr(values.dtype, "tz", None)
+        windows = [
+            tuple(None if ts is None else ts.tz_localize(tz) for ts in window)
+            for window in windows
+        ]
+        for start_ts, end_ts in windows:
+            for left_close, right_close in itertools.product(
+                [True, False], repeat=2
+            ):
+                actual = trim_index.trim(
+                    start_ts, end_ts, left_close, right_close
+                )
+                mask = values.notna()
+                if start_ts is not None:
+                    mask &= (
+                        values >= start_ts if left_close else values > start_ts
+                    )
+                if end_ts is not None:
+                    mask &= (
+                        values <= end_ts if right_close else values < end_ts
+                    )
+                expected = df[mask]
+                pd.testing.assert_frame_equal(actual, expected)
+
+    def test_sorted1(self) -> None:
+        """
+        Test values sorted by timestamp.
+        """
+        df = self.get_df("by_ts")
+        self.check_windows(df, "start_time")
+
+    def test_sorted_runs1(self) -> None:
+        """
+        Test values sorted by timestamp for each asset.
+        """
+        df = self.get_df("by_asset")
+        self.check_windows(df, "start_time")
+
+    def test_sorted_runs2(self) -> None:
+        """
+        Test tz-aware values sorted by timestamp for each asset.
+        """
+        df = self.get_df("by_asset")
+        df["start_time"] = df["start_time"].dt.tz_localize("America/New_York")
+        self.check_windows(df, "start_time")
+
+    def test_shuffled1(self) -> None:
+        """
+        Test values that are not sorted.
+        """
+        df = self.get_df("shuffled")
+        with umock.patch.object(hpandas, "_MAX_NUM_SORTED_RUNS", 2):
+            self.check_windows(df, "start_time")
+            self.check_windows(df, "start_time", sort_values=False)
+
+    def test_nans1(self) -> None:
+        """
+        Test that rows with NaT values are never in the interval.
+        """
+        df = self.get_df("by_asset")
+        df.iloc[[0, 30, 59], 0] = pd.NaT
+        self.check_windows(df, "start_time")
+        with umock.patch.object(hpandas, "_MAX_NUM_SORTED_RUNS", 2):
+            self.check_windows(df, "start_time")
+            self.check_windows(df, "start_time", sort_values=False)
+
+    def test_multiindex1(self) -> None:
+        """
+        Test filtering on a level of a multiindex.
+        """
+        for layout in ["by_ts", "by_asset", "shuffled"]:
+            df = self.get_df(layout).set_index(["asset_id", "start_time"])
+            self.check_windows(df, "start_time")
+
+    def test_trim_df1(self) -> None:
+        """
+        Test `trim_df()` filtering on a level of a multiindex.
+        """
+        df = self.get_df("by_asset").set_index(["asset_id", "start_time"])
+        start_ts = pd.Timestamp("2022-01-04 09:35")
+        end_ts = pd.Timestamp("2022-01-04 09:37")
+        df_trim = hpandas.trim_df(
+            df, "start_time", start_ts, end_ts, True, False
+        )
+        actual = hpandas.df_to_str(df_trim, num_rows=None)
+        expected = r"""
+                                      close
+        asset_id start_time
+        101      2022-01-04 09:35:00   15.0
+                 2022-01-04 09:36:00   18.0
+        102      2022-01-04 09:35:00   16.0
+                 2022-01-04 09:36:00   19.0
+        103      2022-01-04 09:35:00   17.0
+                 2022-01-04 09:36:00   20.0
+        """
+        self.assert_equal(actual, expected, dedent=True, fuzzy_match=True)
+
+
 # #############################################################################
 
 
@@ -1313,6 +1470,62 @@ class Test_df_to_str(hunitest.TestCase):
         """
         self.assert_equal(actual, expected, fuzzy_match=True)
 
+    def test_df_to_str11(self) -> None:
+        """
+        Test that `-0.0` is replaced with `0.0` in the displayed rows, without
+        modifying the input df.
+        """
+        df = pd.DataFrame({"A": [-0.0, 1.0, -0.0, 2.0, -0.0], "B": range(5)})
+        actual = hpandas.df_to_str(df, num_rows=2, handle_signed_zeros=True)
+        expected = r"""
+             A  B
+        0  0.0  0
+        ...
+        4  0.0  4"""
+        self.assert_equal(actual, expected, fuzzy_match=True)
+        self.assertTrue(np.signbit(df["A"]).tolist()[0])
+
+    def test_df_to_str12(self) -> None:
+        """
+        Test common call to `df_to_str` with `print_nan_info = True`.
+        """
+        df = pd.DataFrame({"A": [1.0, np.nan, 3.0], "B": [None, "b", "c"]})
+        df["C"] = 0
+        actual = hpandas.df_to_str(df, print_nan_info=True)
+        expected = r"""
+        num_nans=2 / 9 = 22.22%
+        num_zeros=2 / 9 = 22.22%
+        num_nan_rows=1 / 9 = 11.11%
+        num_nan_cols=1 / 9 = 11.11%
+             A     B  C
+        0  1.0  None  0
+        1  NaN     b  0
+        2  3.0     c  0"""
+        self.assert_equal(actual, expected, fuzzy_match=True)
+
+    def test_df_to_str13(self) -> None:
+        """
+        Test that `use_tabulate = True` formats only the displayed rows.
+        """
+        df = pd.DataFrame({"A": range(100)})
+        actual = hpandas.df_to_str(df, num_rows=4, use_tabulate=True)
+        expected = r"""
+        +----+-----+
+        |    |   A |
+        |----+-----|
+        |  0 |   0 |
+        |  1 |   1 |
+        | 98 |  98 |
+        | 99 |  99 |
+        +----+-----+
+            A
+        0   0
+        1   1
+        ...
+        98  98
+        99  99"""
+        self.assert_equal(actual, expected, fuzzy_match=True)
+
 
 # #############################################################################
 # Test_assemble_df_rows
@@ -2091,6 +2304,138 @@ class TestDropDuplicates(hunitest.TestCase):
         self.assert_equal(no_duplicates_df, expected_signature, fuzzy_match=True)
 
 
+# #############################################################################
+# Test_get_duplicated_mask
+# #############################################################################
+
+
+class Test_get_duplicated_mask(hunitest.TestCase):
+    @staticmethod
+    def get_df() -> pd.DataFrame:
+        df = pd.DataFrame(
+            {
+                "key": [1.0, np.nan, 1.0, np.nan, 0.0, 1.0],
+                "value": [10, 20, 30, 40, 50, 30],
+            },
+            index=[0, 0, 1, 0, 0, 1],
+        )
+        return df
+
+    def test1(self) -> None:
+        """
+        Test that NaNs are equal to each other but not to zeros.
+        """
+        df = self.get_df()
+        actual = hpandas.get_duplicated_mask(df, subset=["key"])
+        expected = [False, False, True, True, False, True]
+        self.assertEqual(actual.tolist(), expected)
+
+    def test2(self) -> None:
+        """
+        Test using the index together with a column.
+        """
+        df = self.get_df()
+        actual = hpandas.get_duplicated_mask(df, subset=["key"], use_index=True)
+        expected = [False, False, False, True, False, True]
+        self.assertEqual(actual.tolist(), expected)
+
+    def test3(self) -> None:
+        """
+        Test keeping the first row with the max value of a control column.
+        """
+        df = self.get_df()
+        actual = hpandas.get_duplicated_mask(
+            df, subset=["key"], control_column="value"
+        )
+        expected = [True, True, False, False, False, True]
+        self.assertEqual(actual.tolist(), expected)
+
+    def test4(self) -> None:
+        """
+        Test that a control column with only NaNs keeps the first row.
+        """
+        df = pd.DataFrame(
+            {"key": ["a", "b", "a", "b"], "value": [np.nan, np.nan, np.nan, 1.0]}
+        )
+        actual = hpandas.get_duplicated_mask(
+            df, subset=["key"], control_column="value"
+        )
+        expected = [False, True, True, False]
+        self.assertEqual(actual.tolist(), expected)
+
+    def test5(self) -> None:
+        """
+        Test a multiindex and all the columns.
+        """
+        df = self.get_df()
+        df.index = pd.MultiIndex.from_arrays([df.index, [0, 0, 0, 0, 0, 1]])
+        actual = hpandas.get_duplicated_mask(df, use_index=True)
+        expected = [False, False, False, False, False, False]
+        self.assertEqual(actual.tolist(), expected)
+        #
+        actual = hpandas.get_duplicated_mask(df)
+        expected = [False, False, False, False, False, True]
+        self.assertEqual(actual.tolist(), expected)
+
+    def test6(self) -> None:
+        """
+        Test that rows with equal hashes and different values are not
+        duplicates.
+        """
+        df = self.get_df()
+        with umock.patch.object(
+            hpandas,
+            "_get_row_hashes",
+            side_effect=lambda values: np.zeros(len(values[0]), dtype=np.uint64),
+        ):
+            actual = hpandas.get_duplicated_mask(
+                df, subset=["key"], control_column="value"
+            )
+        expected = [True, True, False, False, False, True]
+        self.assertEqual(actual.tolist(), expected)
+
+    def test7(self) -> None:
+        """
+        Test that NaNs with different bit patterns are equal to each other.
+        """
+        with np.errstate(invalid="ignore"):
+            nans = [np.nan, np.inf - np.inf, -np.nan, np.float64(0) / 0]
+        df = pd.DataFrame({"key": 1, "value": nans}, index=[0, 0, 0, 0])
+        self.assertEqual(len({np.float64(v).tobytes() for v in nans}), 2)
+        actual = hpandas.get_duplicated_mask(df, use_index=True)
+        expected = [False, True, True, True]
+        self.assertEqual(actual.tolist(), expected)
+        self.assertEqual(actual.tolist(), df.duplicated().tolist())
+
+
+# #############################################################################
+# Test_drop_duplicated
+# #############################################################################
+
+
+class Test_drop_duplicated(hunitest.TestCase):
+    def test1(self) -> None:
+        """
+        Test that duplicates are removed without modifying the input.
+        """
+        df = pd.DataFrame(
+            {"A": [1.0, np.nan, 1.0, np.nan, 0.0], "B": [1, 2, 1, 2, 2]},
+            index=pd.Index([0, 1, 0, 1, 1], name="idx"),
+        )
+        df_before = df.copy()
+        actual = hpandas.drop_duplicated(df)
+        pd.testing.assert_frame_equal(df, df_before)
+        actual = hpandas.df_to_str(actual)
+        expected = r"""
+               A  B
+        idx
+        0    1.0  1
+        1    NaN  2
+        1    0.0  2
+        """
+        self.assert_equal(actual, expected, dedent=True, fuzzy_match=True)
+
+
 # #############################################################################
 # TestCheckAndFilterMatchingColumns
 # #############################################################################
@@ -2182,6 +2527,183 @@ class TestCheckAndFilterMatchingColumns(hunitest.TestCase):
 # #############################################################################
 
 
+# #############################################################################
+# Test_find_gaps_in_time_series
+# #############################################################################
+
+
+def _get_time_series_with_gaps() -> pd.Series:
+    """
+    Build a time series of minutes with gaps, an off-grid point and a NaT.
+    """
+    timestamps = pd.date_range(
+        "2022-01-01 00:00:00", periods=10, freq="min", tz="UTC"
+    )
+    timestamps = timestamps.delete([0, 3, 4, 9]).append(
+        pd.DatetimeIndex(["2022-01-01 00:05:30", pd.NaT], tz="UTC")
+    )
+    # Shuffle the timestamps.
+    time_series = pd.Series(timestamps[[6, 2, 0, 7, 1, 3, 4, 5]])
+    return time_series
+
+
+class Test_find_gaps_in_time_series(hunitest.TestCase):
+
+    def test1(self) -> None:
+        """
+        Find the missing points of a time series.
+        """
+        time_series = _get_time_series_with_gaps()
+        start_timestamp = pd.Timestamp("2022-01-01 00:00:00", tz="UTC")
+        end_timestamp = pd.Timestamp("2022-01-01 00:10:00", tz="UTC")
+        # Run.
+        actual = hpandas.find_gaps_in_time_series(
+            time_series, start_timestamp, end_timestamp, "min"
+        )
+        # Check.
+        expected = pd.DatetimeIndex(
+            [
+                "2022-01-01 00:00:00",
+                "2022-01-01 00:03:00",
+                "2022-01-01 00:04:00",
+                "2022-01-01 00:09:00",
+                "2022-01-01 00:10:00",
+            ],
+            tz="UTC",
+        )
+        self.assert_equal(str(actual), str(expected))
+
+    def test2(self) -> None:
+        """
+        Find the missing points of a time series of unix epochs in ms.
+        """
+        time_series = _get_time_series_with_gaps().dropna()
+        time_series = time_series.astype("int64") // 10**6
+        start_timestamp = pd.Timestamp("2022-01-01 00:00:00", tz="UTC")
+        end_timestamp = pd.Timestamp("2022-01-01 00:10:00", tz="UTC")
+        # Run.
+        actual = hpandas.find_gaps_in_time_series(
+            time_series, start_timestamp, end_timestamp, "min"
+        )
+        # Check.
+        self.assertEqual(len(actual), 5)
+        self.assertEqual(actual[-1], end_timestamp)
+
+
+# #############################################################################
+# Test_find_gap_intervals_in_time_series
+# #############################################################################
+
+
+class Test_find_gap_intervals_in_time_series(hunitest.TestCase):
+
+    def test1(self) -> None:
+        """
+        Find the intervals of missing points of a time series.
+        """
+        time_series = _get_time_series_with_gaps()
+        start_timestamp = pd.Timestamp("2022-01-01 00:00:00", tz="UTC")
+        end_timestamp = pd.Timestamp("2022-01-01 00:10:00", tz="UTC")
+        # Run.
+        actual = hpandas.find_gap_intervals_in_time_series(
+            time_series, start_timestamp, end_timestamp, "min"
+        )
+        # Check.
+        actual = hpandas.df_to_str(actual)
+        expected = r"""
+                    start_timestamp             end_timestamp  num_missing_points
+        0 2022-01-01 00:00:00+00:00 2022-01-01 00:00:00+00:00                   1
+        1 2022-01-01 00:03:00+00:00 2022-01-01 00:04:00+00:00                   2
+        2 2022-01-01 00:09:00+00:00 2022-01-01 00:10:00+00:00                   2
+        """
+        self.assert_equal(actual, expected, fuzzy_match=True)
+
+    def test2(self) -> None:
+        """
+        Find the intervals of missing points with a calendar frequency.
+        """
+        time_series = pd.Series(
+            pd.DatetimeIndex(["2022-02-01", "2022-03-01", "2022-06-01"])
+        )
+        start_timestamp = pd.Timestamp("2022-01-01")
+        end_timestamp = pd.Timestamp("2022-06-30")
+        # Run.
+        actual = hpandas.find_gap_intervals_in_time_series(
+            time_series, start_timestamp, end_timestamp, "MS"
+        )
+        # Check.
+        actual = hpandas.df_to_str(actual)
+        expected = r"""
+          start_timestamp end_timestamp  num_missing_points
+        0      2022-01-01    2022-01-01                   1
+        1      2022-04-01    2022-05-01                   2
+        """
+        self.assert_equal(actual, expected, fuzzy_match=True)
+
+    def test3(self) -> None:
+        """
+        Check that a complete daily time series has no gaps across a DST
+        change.
+        """
+        time_series = pd.Series(
+            pd.date_range(
+                "2022-03-10", "2022-03-16", freq="D", tz="America/New_York"
+            )
+        )
+        start_timestamp = time_series.iloc[0]
+        end_timestamp = time_series.iloc[-1]
+        # Run.
+        actual = hpandas.find_gap_intervals_in_time_series(
+            time_series, start_timestamp, end_timestamp, "D"
+        )
+        # Check.
+        self.assertEqual(len(actual), 0)
+        actual = hpandas.find_gaps_in_time_series(
+            time_series, start_timestamp, end_timestamp, "D"
+        )
+        self.assertEqual(len(actual), 0)
+
+
+# #############################################################################
+# Test_find_gap_intervals_by_asset
+# #############################################################################
+
+
+class Test_find_gap_intervals_by_asset(hunitest.TestCase):
+
+    def test1(self) -> None:
+        """
+        Find the intervals of missing points of each asset.
+        """
+        time_series = _get_time_series_with_gaps()
+        df = pd.DataFrame(
+            {
+                "timestamp": pd.concat([time_series, time_series.iloc[:3]]),
+                "asset_id": [200] * len(time_series) + [100] * 3,
+            }
+        )
+        start_timestamp = pd.Timestamp("2022-01-01 00:00:00", tz="UTC")
+        end_timestamp = pd.Timestamp("2022-01-01 00:10:00", tz="UTC")
+        # Run.
+        actual = hpandas.find_gap_intervals_by_asset(
+            df, "timestamp", "asset_id", start_timestamp, end_timestamp, "min"
+        )
+        # Check.
+        actual["start_timestamp"] = actual["start_timestamp"].dt.strftime("%M")
+        actual["end_timestamp"] = actual["end_timestamp"].dt.strftime("%M")
+        actual = hpandas.df_to_str(actual, num_rows=None)
+        expected = r"""
+           asset_id start_timestamp end_timestamp  num_missing_points
+        0       100              00            00                   1
+        1       100              02            04                   3
+        2       100              06            10                   5
+        3       200              00            00                   1
+        4       200              03            04                   2
+        5       200              09            10                   2
+        """
+        self.assert_equal(actual, expected, fuzzy_match=True)
+
+
 # #############################################################################
 # Test_merge_dfs1
 # #############################################################################
@@ -2398,8 +2920,76 @@ class Test_merge_dfs1(hunitest.TestCase):
                 on=cols_to_merge_on,
             )
 
+    def test5(self) -> None:
+        """
+        The types of `threshold_col` values are different.
+        """
+        # Create test data.
+        data1 = {
+            "col1": [1, 10, 100],
+            "threshold_col": [7, 70, 700],
+        }
+        df1 = self.get_dataframe(data1, [1, 2, 3])
+        data2 = {
+            "col2": [2, 20, 200],
+            "threshold_col": [7.0, 70.0, 700.0],
+        }
+        df2 = self.get_dataframe(data2, [1, 2, 3])
+        # Check.
+        with self.assertRaises(AssertionError) as cm:
+            hpandas.merge_dfs(
+                df1,
+                df2,
+                "threshold_col",
+                how="outer",
+                on=["threshold_col"],
+            )
+        self.assertIn("is different from type(obj2)", str(cm.exception))
 
-# #############################################################################
+    def test6(self) -> None:
+        """
+        Overlap of string `threshold_col` values with repeated values.
+        """
+        # Create test data.
+        data1 = {
+            "col1": [1, 10, 100, 1000],
+            "threshold_col": ["a", "b", "b", "c"],
+        }
+        df1 = self.get_dataframe(data1, [1, 2, 3, 4])
+        data2 = {
+            "col2": [2, 20, 200],
+            "threshold_col": ["a", "a", "b"],
+        }
+        df2 = self.get_dataframe(data2, [1, 2, 3])
+        # Run.
+        merged_df = hpandas.merge_dfs(
+            df1,
+            df2,
+            "threshold_col",
+            threshold=0.6,
+            how="inner",
+            on=["threshold_col"],
+        )
+        # Check.
+        actual = hpandas.df_to_str(merged_df)
+        expected = r"""
+           col1 threshold_col  col2
+        0     1             a     2
+        1     1             a    20
+        2    10             b   200
+        3   100             b   200
+        """
+        self.assert_equal(actual, expected, fuzzy_match=True)
+        # 2 out of 3 values of `df1` are in `df2`.
+        with self.assertRaises(AssertionError):
+            hpandas.merge_dfs(
+                df1,
+                df2,
+                "threshold_col",
+                threshold=0.7,
+                how="inner",
+                on=["threshold_col"],
+            )
 
 
 # #############################################################################
@@ -2706,30 +3296,13 @@ class Test_compare_dfs(hunitest.TestCase):
         act = str(cm.exception)
         exp = r"""
         * Failed assertion *
-        DataFrame.iloc[:, 0] (column name="A") are different
-
-        DataFrame.iloc[:, 0] (column name="A") values are different (66.66667 %)
-        [index]: [0, 1, 2, 3, 4, 5]
-        [left]:  [1.1, nan, 3.1, nan, inf, inf]
-        [right]: [3.0, 2.2, nan, nan, nan, inf]
-        At positional index 0, first diff: 1.1 != 3.0
-        df1=
-             A  B
-        0  1.1  0
-        1  NaN  0
-        2  3.1  0
-        3  NaN  0
-        4  inf  0
-        5  inf  0
-        and df2=
-             A  B
-        0  3.0  0
-        1  2.2  0
-        2  NaN  0
-        3  NaN  0
-        4  NaN  0
-        5  inf  0
-        are not equal.
+        df1 and df2 are not equal.
+        4 / 12 cells are different, top 4 by absolute diff:
+          column  df1  df2  diff
+        1      A  NaN  2.2   NaN
+        2      A  3.1  NaN   NaN
+        4      A  inf  NaN   NaN
+        0      A  1.1  3.0  -1.9
         """
         self.assert_equal(act, exp, purify_text=True, fuzzy_match=True)
 
@@ -2830,25 +3403,19 @@ class Test_compare_dfs(hunitest.TestCase):
         act = str(cm.exception)
         exp = r"""
         * Failed assertion *
-        DataFrame.iloc[:, 0] (column name="tsA") are different
-
-        DataFrame.iloc[:, 0] (column name="tsA") values are different (100.0 %)
-        [index]: [2022-01-01 21:01:00+00:00, 2022-01-01 21:02:00+00:00, 2022-01-01 21:03:00+00:00]
-        [left]:  [False, False, False]
-        [right]: [True, True, True]
-        df1=
-                                       tsA      tsB      tsC
-        timestamp
-        2022-01-01 21:01:00+00:00  100.001  400.004  700.007
-        2022-01-01 21:02:00+00:00  200.002  500.005      inf
-        2022-01-01 21:03:00+00:00  300.003  600.006  900.009
-        and df2=
-                                   tsA  tsB  tsC
+        df1 and df2 have pct_change more than `assert_diff_threshold`.
+        9 / 9 cells are different, top 9 by absolute pct_change:
+                                  column      df1    df2  pct_change
         timestamp
-        2022-01-01 21:01:00+00:00  100  400  700
-        2022-01-01 21:02:00+00:00  200  500  800
-        2022-01-01 21:03:00+00:00  300  600  900
-        have pct_change more than `assert_diff_threshold`.
+        2022-01-01 21:02:00+00:00    tsC      inf  800.0         inf
+        2022-01-01 21:03:00+00:00    tsA  300.003  300.0       0.001
+        2022-01-01 21:03:00+00:00    tsB  600.006  600.0       0.001
+        2022-01-01 21:02:00+00:00    tsB  500.005  500.0       0.001
+        2022-01-01 21:01:00+00:00    tsC  700.007  700.0       0.001
+        2022-01-01 21:01:00+00:00    tsA  100.001  100.0       0.001
+        2022-01-01 21:02:00+00:00    tsA  200.002  200.0       0.001
+        2022-01-01 21:01:00+00:00    tsB  400.004  400.0       0.001
+        2022-01-01 21:03:00+00:00    tsC  900.009  900.0       0.001
         """
         self.assert_equal(act, exp, purify_text=True, fuzzy_match=True)
 
@@ -2924,6 +3491,108 @@ class Test_compare_dfs(hunitest.TestCase):
         """
         self.assert_equal(actual, expected, fuzzy_match=True)
 
+    def test14(self) -> None:
+        """
+        Check that only the largest `num_diffs_to_report` differences are
+        reported.
+        """
+        df1 = pd.DataFrame({"A": np.arange(100.0), "B": np.arange(100.0)})
+        df2 = df1.copy()
+        df2["A"] += np.arange(100.0) / 10
+        df2.loc[3, "B"] = np.nan
+        with self.assertRaises(AssertionError) as cm:
+            hpandas.compare_dfs(
+                df1, df2, num_diffs_to_report=3, only_warning=False
+            )
+        act = str(cm.exception)
+        exp = r"""
+        * Failed assertion *
+        df1 and df2 are not equal.
+        100 / 200 cells are different, top 3 by absolute diff:
+           column   df1    df2  diff
+        3       B   3.0    NaN   NaN
+        99      A  99.0  108.9  -9.9
+        98      A  98.0  107.8  -9.8
+        """
+        self.assert_equal(act, exp, purify_text=True, fuzzy_match=True)
+
+    def test15(self) -> None:
+        """
+        Check `row_mode = "inner"` with unsorted indices.
+        """
+        df1, df2 = self.get_test_dfs_different()
+        df1 = df1.iloc[::-1]
+        df_diff = hpandas.compare_dfs(
+            df1,
+            df2,
+            row_mode="inner",
+            column_mode="inner",
+            diff_mode="diff",
+            assert_diff_threshold=None,
+        )
+        actual = hpandas.df_to_str(df_diff)
+        expected = r"""               tsA.diff  tsB.diff
+        timestamp
+        2022-01-01 21:02:00+00:00       0.1       0.0
+        2022-01-01 21:01:00+00:00      -0.1       4.0
+        """
+        self.assert_equal(actual, expected, fuzzy_match=True)
+
+    def test16(self) -> None:
+        """
+        Check that the input dataframes are not modified.
+        """
+        df1, df2 = self.get_test_dfs_close_to_zero()
+        expected = hpandas.df_to_str(df1, num_rows=None, precision=12)
+        hpandas.compare_dfs(
+            df1, df2, diff_mode="pct_change", assert_diff_threshold=None
+        )
+        actual = hpandas.df_to_str(df1, num_rows=None, precision=12)
+        self.assert_equal(actual, expected)
+
+    def test17(self) -> None:
+        """
+        Check `row_mode = "inner"` with duplicated index labels.
+        """
+        df1 = pd.DataFrame({"A": [1.0, 2.0, 3.0, 4.0]}, index=[2, 1, 1, 3])
+        df2 = pd.DataFrame({"A": [1.5, 2.0, 3.0]}, index=[2, 1, 1])
+        # The common rows are in the same order.
+        df_diff = hpandas.compare_dfs(df1, df2, row_mode="inner")
+        actual = hpandas.df_to_str(df_diff)
+        expected = r"""
+           A.diff
+        2    -0.5
+        1     0.0
+        1     0.0
+        """
+        self.assert_equal(actual, expected, fuzzy_match=True)
+        # The common rows can't be aligned.
+        df2 = pd.DataFrame({"A": [2.0, 1.0, 3.0]}, index=[1, 2, 1])
+        with self.assertRaises(AssertionError) as cm:
+            hpandas.compare_dfs(df1, df2, row_mode="inner")
+        act = str(cm.exception)
+        self.assertIn("Can't align the rows of df1", act)
+
+    def test18(self) -> None:
+        """
+        Check the report of the differences with "%" in the column names.
+        """
+        df1 = pd.DataFrame({"ret%": [1.0, 2.0], "%d": [1.0, 2.0]})
+        df2 = df1 + 1
+        for diff_mode in ["diff", "pct_change"]:
+            with self.assertRaises(AssertionError) as cm:
+                hpandas.compare_dfs(
+                    df1,
+                    df2,
+                    diff_mode=diff_mode,
+                    assert_diff_threshold=1e-3,
+                    only_warning=False,
+                )
+            act = str(cm.exception)
+            self.assertNotIn("Caught assertion while formatting", act)
+            self.assertIn("4 / 4 cells are different", act)
+            self.assertIn("ret%", act)
+
     def test_invalid_input(self) -> None:
         """
         Put two different DataFrames with `equal` mode.
@@ -2942,6 +3611,29 @@ class Test_compare_dfs(hunitest.TestCase):
 # #############################################################################
 
 
+class Test_are_dfs_equal(hunitest.TestCase):
+    def test1(self) -> None:
+        """
+        Check equal dataframes, within the tolerance and with NaNs.
+        """
+        df1 = pd.DataFrame({"A": [1.0, np.nan, np.inf], "B": [1, 2, 3]})
+        df2 = pd.DataFrame({"B": [1, 2, 3], "A": [1.000001, np.nan, np.inf]})
+        self.assertTrue(
+            hpandas.are_dfs_equal(df1, df2, chunk_size_in_rows=2)
+        )
+
+    def test2(self) -> None:
+        """
+        Check a difference in the last chunk.
+        """
+        df1 = pd.DataFrame({"A": [1.0, 2.0, 3.0], "B": [1, 2, 3]})
+        df2 = df1.copy()
+        df2.loc[2, "B"] = 4
+        self.assertFalse(
+            hpandas.are_dfs_equal(df1, df2, chunk_size_in_rows=2)
+        )
+
+
 # #############################################################################
 # Test_subset_multiindex_df
 # #############################################################################
@@ -3609,6 +4301,30 @@ class Test_compute_duration_df(hunitest.TestCase):
             valid_intersect, expected_start_timestamp, expected_end_timestamp
         )
 
+    def test2(self) -> None:
+        """
+        Check timestamp stats for an unsorted index and a df without valid
+        rows.
+        """
+        tag_to_df = self.get_dict_with_dfs()
+        tag_to_df["tag2"] = tag_to_df["tag2"].iloc[[2, 0, 3, 1]]
+        tag_to_df["tag3"] = tag_to_df["tag3"].iloc[:2]
+        # Run.
+        df_stats, _ = hpandas.compute_duration_df(tag_to_df)
+        # Check.
+        self.assertEqual(
+            df_stats.dtypes.astype(str).unique().tolist(),
+            ["datetime64[ns, UTC]"],
+        )
+        actual = hpandas.df_to_str(df_stats)
+        expected = r"""
+                              min_index                  max_index            min_valid_index            max_valid_index
+        tag1  2022-01-01 21:00:00+00:00  2022-01-01 21:06:00+00:00  2022-01-01 21:02:00+00:00  2022-01-01 21:06:00+00:00
+        tag2  2022-01-01 21:02:00+00:00  2022-01-01 21:05:00+00:00  2022-01-01 21:02:00+00:00  2022-01-01 21:04:00+00:00
+        tag3  2022-01-01 21:01:00+00:00  2022-01-01 21:02:00+00:00                        NaT                        NaT
+        """
+        self.assert_equal(actual, expected, fuzzy_match=True)
+
 
 # #############################################################################
 
@@ -4039,6 +4755,77 @@ class Test_get_df_from_iterator(hunitest.TestCase):
         """
         self.assert_equal(actual_signature, expected_signature, fuzzy_match=True)
 
+    @staticmethod
+    def get_dfs(
+        starts: List[str], *, tz: Optional[str] = None
+    ) -> List[pd.DataFrame]:
+        """
+        Build dataframes with a sorted index of 3 hours from each start.
+        """
+        dfs = []
+        for i, start in enumerate(starts):
+            index = pd.date_range(start, periods=3, freq="h", tz=tz)
+            df = pd.DataFrame(
+                {
+                    "num_col": np.arange(3) + 10 * i,
+                    "cat_col": pd.Categorical(["A", "B", "A"]),
+                    "ts_col": pd.date_range("2022-01-01", periods=3, tz="UTC"),
+                },
+                index=index,
+            )
+            dfs.append(df)
+        return dfs
+
+    def test2(self) -> None:
+        """
+        Check dataframes that are already in order.
+        """
+        starts = ["2022-01-01 00:00", "2022-01-01 03:00"]
+        dfs = self.get_dfs(starts)
+        # Run.
+        df = hpandas.get_df_from_iterator(iter(dfs))
+        # Check.
+        expected = pd.concat(self.get_dfs(starts))
+        hunitest.compare_df(df, expected)
+        self.assertEqual(df.dtypes.to_dict(), expected.dtypes.to_dict())
+
+    def test3(self) -> None:
+        """
+        Check that interleaved dataframes are merged keeping the ties in the
+        order of the iterator.
+        """
+        starts = ["2022-01-01 01:00", "2022-01-01 00:00", "2022-01-01 01:00"]
+        dfs = self.get_dfs(starts, tz="America/New_York")
+        # Run.
+        df = hpandas.get_df_from_iterator(iter(dfs))
+        # Check.
+        self.assertEqual(df.index.tz, dfs[0].index.tz)
+        self.assertEqual(
+            df["num_col"].tolist(), [10, 0, 11, 20, 1, 12, 21, 2, 22]
+        )
+        expected = pd.concat(dfs).sort_index(kind="stable")
+        hunitest.compare_df(df, expected)
+        self.assertEqual(df.dtypes.to_dict(), expected.dtypes.to_dict())
+
+    def test4(self) -> None:
+        """
+        Check dataframes with different columns and no sorting.
+        """
+        dfs = self.get_dfs(["2022-01-01 01:00", "2022-01-01 00:00"])
+        dfs[1] = dfs[1].drop(columns="cat_col")
+        # Run.
+        df = hpandas.get_df_from_iterator(iter(dfs), sort_index=False)
+        # Check.
+        expected = pd.concat(dfs)
+        hunitest.compare_df(df, expected)
+
+    def test5(self) -> None:
+        """
+        Check that an empty iterator raises like `pd.concat()`.
+        """
+        with self.assertRaises(ValueError):
+            hpandas.get_df_from_iterator(iter([]))
+
 
 # #############################################################################
 # Test_multiindex_df_info1
@@ -1,9 +1,11 @@
 import datetime
+import glob
 import logging
 import os
 import random
 from typing import Any, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 import pyarrow
 import pyarrow.parquet as parquet
@@ -1464,3 +1466,225 @@ class TestPartitionedParquet2(hunitest.TestCase):
         2024-05-20 00:00:00+00:00  2024-06-04 20:38:43.467599+00:00   263   240  BTC_USDT
         """
         self.assert_equal(actual, expected, fuzzy_match=True)
+
+
+# #############################################################################
+# TestParquetManifest1
+# #############################################################################
+
+
+class TestParquetManifest1(hunitest.TestCase):
+    """
+    Test maintaining and using the manifest of a partitioned dataset.
+    """
+
+    def write_dataset(self) -> str:
+        """
+        Write a dataset partitioned by `idx` in two calls.
+        """
+        dst_dir = os.path.join(self.get_scratch_space(), "data.parquet")
+        partition_columns = ["idx"]
+        df = _get_df_example1()
+        hparque.to_partitioned_parquet(
+            df[df["idx"] < 3].copy(),
+            partition_columns,
+            dst_dir,
+            update_manifest=True,
+        )
+        # The second call updates the existing manifest.
+        hparque.to_partitioned_parquet(
+            df[df["idx"] >= 3].copy(), partition_columns, dst_dir
+        )
+        return dst_dir
+
+    def test_write1(self) -> None:
+        """
+        Check the content of the manifest after incremental writes.
+        """
+        dst_dir = self.write_dataset()
+        manifest = hparque.load_manifest(dst_dir)
+        # Check.
+        files = manifest["files"]
+        actual = [
+            (rel_path.split("/")[0], entry["partition"], entry["num_rows"])
+            for rel_path, entry in sorted(files.items())
+        ]
+        expected = [
+            ("idx=0", {"idx": 0}, 79),
+            ("idx=1", {"idx": 1}, 79),
+            ("idx=2", {"idx": 2}, 79),
+            ("idx=3", {"idx": 3}, 79),
+            ("idx=4", {"idx": 4}, 79),
+        ]
+        self.assertEqual(actual, expected)
+        entry = files[sorted(files)[4]]
+        self.assertEqual(entry["stats"]["instr"], ["E", "E"])
+        file_path = os.path.join(dst_dir, sorted(files)[4])
+        self.assertEqual(entry["size_in_bytes"], os.path.getsize(file_path))
+
+    def test_plan1(self) -> None:
+        """
+        Check that filters on partition and data columns prune files.
+        """
+        dst_dir = self.write_dataset()
+        filters = [[("idx", "<=", 1)], [("instr", "==", "D")]]
+        file_paths = hparque.plan_files_from_manifest(dst_dir, filters=filters)
+        # Check.
+        actual = [os.path.relpath(path, dst_dir)[:5] for path in file_paths]
+        expected = ["idx=0", "idx=1", "idx=3"]
+        self.assertEqual(actual, expected)
+
+    def test_read1(self) -> None:
+        """
+        Check that reading through the manifest matches reading by listing.
+        """
+        dst_dir = self.write_dataset()
+        filters = [("idx", "in", (1, 4)), ("val1", ">", 50)]
+        df1 = hparque.from_parquet(dst_dir, filters=filters, use_manifest=True)
+        df2 = hparque.from_parquet(dst_dir, filters=filters)
+        # Check.
+        self.assertEqual(sorted(df1["idx"].unique()), [1, 4])
+        _compare_dfs(self, df1, df2)
+
+    def test_stale1(self) -> None:
+        """
+        Check that a stale manifest is detected and not used.
+        """
+        dst_dir = self.write_dataset()
+        # Rewrite one file out of band.
+        file_path = sorted(glob.glob(os.path.join(dst_dir, "idx=2", "*")))[0]
+        df = parquet.read_table(file_path).to_pandas()
+        df.iloc[:10].to_parquet(file_path)
+        # Check.
+        file_paths = hparque.plan_files_from_manifest(dst_dir)
+        self.assertIsNone(file_paths)
+        df = hparque.from_parquet(dst_dir, use_manifest=True)
+        self.assertEqual(df.shape[0], 4 * 79 + 10)
+
+    def test_collate1(self) -> None:
+        """
+        Check that the tile metadata from the manifest matches the one from
+        walking the dir.
+        """
+        dst_dir = self.write_dataset()
+        df1 = hparque.collate_parquet_tile_metadata(dst_dir, use_manifest=True)
+        df2 = hparque.collate_parquet_tile_metadata(dst_dir)
+        # Check.
+        pd.testing.assert_frame_equal(df1, df2)
+
+    def test_build1(self) -> None:
+        """
+        Check that building a manifest from scratch matches the incremental
+        one.
+        """
+        dst_dir = self.write_dataset()
+        manifest1 = hparque.load_manifest(dst_dir)
+        hparque.remove_manifest(dst_dir)
+        self.assertFalse(hparque.manifest_exists(dst_dir))
+        hparque.build_manifest(dst_dir)
+        manifest2 = hparque.load_manifest(dst_dir)
+        # Check.
+        self.assertEqual(manifest1, manifest2)
+
+
+# #############################################################################
+# TestPartitionedParquetWriter1
+# #############################################################################
+
+
+def _get_writer_test_df(num_rows: int, num_assets: int) -> pd.DataFrame:
+    """
+    Build a frame with one row per minute and per asset.
+    """
+    num_timestamps = num_rows // num_assets
+    index = pd.date_range(
+        "2022-01-01", periods=num_timestamps, freq="T", tz="UTC"
+    ).repeat(num_assets)
+    df = pd.DataFrame(
+        {
+            "asset_id": np.tile(np.arange(num_assets), num_timestamps),
+            "close": np.arange(num_timestamps * num_assets, dtype=float),
+        },
+        index=index,
+    )
+    return df
+
+
+class TestPartitionedParquetWriter1(hunitest.TestCase):
+
+    def write_helper(
+        self,
+        df: pd.DataFrame,
+        dst_dir: str,
+        chunk_size: int,
+        **kwargs: Any,
+    ) -> None:
+        """
+        Write `df` in chunks of `chunk_size` rows.
+        """
+        with hparque.PartitionedParquetWriter(
+            dst_dir, ["asset_id"], **kwargs
+        ) as writer:
+            for i in range(0, df.shape[0], chunk_size):
+                writer.write(df.iloc[i : i + chunk_size])
+
+    def check_read_back(self, df: pd.DataFrame, dst_dir: str) -> None:
+        df2 = hparque.from_parquet(dst_dir)
+        df2["asset_id"] = df2["asset_id"].astype(df["asset_id"].dtype)
+        df2 = df2[df.columns].sort_values(["close"])
+        pd.testing.assert_frame_equal(df2, df, check_freq=False)
+
+    def test_row_groups1(self) -> None:
+        """
+        Check that data is buffered across calls into full row groups.
+        """
+        dst_dir = os.path.join(self.get_scratch_space(), "data.parquet")
+        df = _get_writer_test_df(num_rows=1000, num_assets=2)
+        self.write_helper(df, dst_dir, chunk_size=30, row_group_size=100)
+        # Check.
+        file_paths = glob.glob(os.path.join(dst_dir, "*", "*.parquet"))
+        self.assertEqual(len(file_paths), 2)
+        metadata = parquet.read_metadata(file_paths[0])
+        num_rows = [
+            metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)
+        ]
+        self.assertEqual(num_rows, [100] * 5)
+        self.check_read_back(df, dst_dir)
+
+    def test_rollover1(self) -> None:
+        """
+        Check that files are rolled over at the target size.
+        """
+        dst_dir = os.path.join(self.get_scratch_space(), "data.parquet")
+        df = _get_writer_test_df(num_rows=2000, num_assets=2)
+        self.write_helper(
+            df,
+            dst_dir,
+            chunk_size=100,
+            row_group_size=100,
+            target_file_size_in_bytes=4000,
+        )
+        # Check.
+        file_paths = glob.glob(os.path.join(dst_dir, "asset_id=0", "*.parquet"))
+        self.assertLess(1, len(file_paths))
+        for file_path in file_paths:
+            # A file exceeds the target by at most one row group.
+            self.assertLess(os.path.getsize(file_path), 2 * 4000)
+        self.check_read_back(df, dst_dir)
+
+    def test_append1(self) -> None:
+        """
+        Check that "append" mode adds files and "overwrite_partitions" mode
+        replaces them, keeping the manifest in sync.
+        """
+        dst_dir = os.path.join(self.get_scratch_space(), "data.parquet")
+        df = _get_writer_test_df(num_rows=200, num_assets=2)
+        self.write_helper(df, dst_dir, chunk_size=50, update_manifest=True)
+        self.write_helper(df, dst_dir, chunk_size=50, mode="append")
+        df2 = hparque.from_parquet(dst_dir)
+        self.assertEqual(df2.shape[0], 400)
+        self.assertEqual(len(hparque.load_manifest(dst_dir)["files"]), 4)
+        #
+        self.write_helper(df, dst_dir, chunk_size=50, mode="overwrite_partitions")
+        self.assertEqual(len(hparque.load_manifest(dst_dir)["files"]), 2)
+        self.check_read_back(df, dst_dir)
@@ -1,8 +1,15 @@
+import concurrent.futures
+import gzip
+import io
 import logging
 import os
+import tarfile
+import time
+import unittest.mock as umock
 from typing import Generator, Tuple
 
 import pytest
+import s3fs
 
 import helpers.hio as hio
 import helpers.hmoto as hmoto
@@ -294,6 +301,150 @@ class TestListdir1(hmoto.S3Mock_TestCase):
         ]
         self.assertListEqual(paths, expected_paths)
 
+    def test_listdir5(self) -> None:
+        """
+        Verify that a pattern without wildcards matches a path directly under
+        the dir.
+        """
+        bucket_s3_path, moto_s3fs = self.prepare_test_data()
+        only_files = False
+        use_relative_paths = True
+        paths = hs3.listdir(
+            bucket_s3_path,
+            "depth_one",
+            only_files,
+            use_relative_paths,
+            aws_profile=moto_s3fs,
+        )
+        self.assertListEqual(paths, ["depth_one"])
+        # A nested path with the same name is not matched.
+        paths = hs3.listdir(
+            bucket_s3_path,
+            "regular_mock3.txt",
+            only_files,
+            use_relative_paths,
+            aws_profile=moto_s3fs,
+        )
+        self.assertListEqual(paths, [])
+
+    def test_listdir6(self) -> None:
+        """
+        Verify that a pattern without wildcards is resolved as a path relative
+        to the dir, whatever `maxdepth` is.
+        """
+        bucket_s3_path, moto_s3fs = self.prepare_test_data()
+        pattern = "depth_one/mock1.txt"
+        only_files = True
+        use_relative_paths = True
+        for maxdepth in [None, 3]:
+            paths = hs3.listdir(
+                bucket_s3_path,
+                pattern,
+                only_files,
+                use_relative_paths,
+                aws_profile=moto_s3fs,
+                maxdepth=maxdepth,
+            )
+            self.assertListEqual(paths, ["depth_one/mock1.txt"])
+        # A nested path with the same name is not matched at any depth.
+        paths = hs3.listdir(
+            bucket_s3_path,
+            "regular_mock3.txt",
+            only_files,
+            use_relative_paths,
+            aws_profile=moto_s3fs,
+            maxdepth=3,
+        )
+        self.assertListEqual(paths, [])
+
+    def test_listdir_cache1(self) -> None:
+        """
+        Verify that cached listings are reused until a write through `hs3`.
+        """
+        bucket_s3_path, moto_s3fs = self.prepare_test_data()
+        depth_one_s3_path = f"{bucket_s3_path}/depth_one"
+        pattern = "*.txt"
+        only_files = True
+        use_relative_paths = True
+        cache_ttl_in_secs = 3600
+        paths = hs3.listdir(
+            depth_one_s3_path,
+            pattern,
+            only_files,
+            use_relative_paths,
+            aws_profile=moto_s3fs,
+            cache_ttl_in_secs=cache_ttl_in_secs,
+        )
+        expected_paths = ["mock/regular_mock3.txt", "mock1.txt"]
+        self.assertListEqual(sorted(paths), expected_paths)
+        # A write bypassing `hs3` is not visible through the cache.
+        with moto_s3fs.open(f"{depth_one_s3_path}/mock4.txt", "wb") as s3_file:
+            s3_file.write(b"line_mock4")
+        paths = hs3.listdir(
+            depth_one_s3_path,
+            pattern,
+            only_files,
+            use_relative_paths,
+            aws_profile=moto_s3fs,
+            cache_ttl_in_secs=cache_ttl_in_secs,
+        )
+        expected_paths = ["mock/regular_mock3.txt", "mock1.txt"]
+        self.assertListEqual(sorted(paths), expected_paths)
+        # A write through `hs3` invalidates the listing.
+        hs3.to_file(
+            "line_mock5",
+            f"{depth_one_s3_path}/mock/mock5.txt",
+            aws_profile=moto_s3fs,
+        )
+        paths = hs3.listdir(
+            depth_one_s3_path,
+            pattern,
+            only_files,
+            use_relative_paths,
+            aws_profile=moto_s3fs,
+            cache_ttl_in_secs=cache_ttl_in_secs,
+        )
+        expected_paths = [
+            "mock/mock5.txt",
+            "mock/regular_mock3.txt",
+            "mock1.txt",
+            "mock4.txt",
+        ]
+        self.assertListEqual(sorted(paths), expected_paths)
+
+
+# #############################################################################
+# TestInvalidateListingCache1
+# #############################################################################
+
+
+class TestInvalidateListingCache1(hunitest.TestCase):
+
+    def test1(self) -> None:
+        """
+        Verify that only the listings that can include a path are removed.
+        """
+        s3fs_ = s3fs.core.S3FileSystem(anon=True)
+        listings = {
+            ("bucket/data", "*", None): (0.0, {}),
+            ("bucket/data/asset=A", "*", None): (0.0, {}),
+            ("bucket/data/asset=B", "*", None): (0.0, {}),
+            ("bucket/data2", "*", None): (0.0, {}),
+        }
+        hs3._LISTING_CACHE[s3fs_] = listings
+        # Run.
+        hs3.invalidate_listing_cache("s3://bucket/data/asset=A/data.parquet")
+        # Check.
+        actual = sorted(key[0] for key in listings)
+        expected = ["bucket/data/asset=B", "bucket/data2"]
+        self.assertListEqual(actual, expected)
+        # Writing a dir invalidates the listings of its subdirs.
+        hs3.invalidate_listing_cache("s3://bucket/data/")
+        actual = sorted(key[0] for key in listings)
+        self.assertListEqual(actual, ["bucket/data2"])
+        hs3.invalidate_listing_cache()
+        self.assertNotIn(s3fs_, hs3._LISTING_CACHE)
+
 
 # #############################################################################
 # TestDu1
@@ -340,6 +491,286 @@ class TestDu1(hmoto.S3Mock_TestCase):
         self.assert_equal(size, expected_size)
 
 
+# #############################################################################
+# TestGetS3fsCache1
+# #############################################################################
+
+
+@pytest.mark.requires_ck_infra
+@pytest.mark.requires_aws
+@pytest.mark.skipif(
+    not hserver.is_CK_S3_available(),
+    reason="Run only if CK S3 is available",
+)
+class TestGetS3fsCache1(hmoto.S3Mock_TestCase):
+
+    def test_workload1(self) -> None:
+        """
+        Verify that a multi-threaded workload builds a single filesystem.
+        """
+        hs3.clear_s3fs_cache()
+        bucket_s3_path = f"s3://{self.bucket_name}"
+
+        def _workload(idx: int) -> str:
+            file_name = f"{bucket_s3_path}/dir/mock{idx}.txt"
+            hs3.to_file(
+                f"line_mock{idx}", file_name, aws_profile=self.mock_aws_profile
+            )
+            hs3.dassert_path_exists(file_name, self.mock_aws_profile)
+            txt = hs3.from_file(file_name, aws_profile=self.mock_aws_profile)
+            return txt
+
+        with umock.patch.object(
+            hs3, "_build_s3fs", wraps=hs3._build_s3fs
+        ) as build_mock:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+                txts = list(executor.map(_workload, range(32)))
+            s3fs_ = hs3.get_s3fs(self.mock_aws_profile)
+            paths = s3fs_.ls(f"{bucket_s3_path}/dir")
+        # Check.
+        self.assertEqual(build_mock.call_count, 1)
+        self.assertEqual(txts[3].strip(), "line_mock3")
+        self.assertEqual(len(paths), 32)
+
+
+# #############################################################################
+# TestGetS3fsCache2
+# #############################################################################
+
+
+class TestGetS3fsCache2(hunitest.TestCase):
+    """
+    Test the refresh logic of the cache without accessing S3.
+    """
+
+    # This will be run before and after each test.
+    @pytest.fixture(autouse=True)
+    def setup_teardown_test(self) -> Generator:
+        # Run before each test.
+        self.set_up_test()
+        yield
+        # Run after each test.
+        self.tear_down_test()
+
+    def set_up_test(self) -> None:
+        self.setUp()
+        self._env_patch = umock.patch.dict(
+            os.environ,
+            {
+                "MOCK_AWS_ACCESS_KEY_ID": "mock_key_id",
+                "MOCK_AWS_SECRET_ACCESS_KEY": "mock_secret_access_key",
+                "MOCK_AWS_SESSION_TOKEN": "mock_session_token",
+                "MOCK_AWS_DEFAULT_REGION": "us-east-1",
+            },
+        )
+        self._env_patch.start()
+        hs3.get_aws_credentials.cache_clear()
+        hs3.clear_s3fs_cache()
+
+    def tear_down_test(self) -> None:
+        self._env_patch.stop()
+        hs3.get_aws_credentials.cache_clear()
+        hs3.clear_s3fs_cache()
+
+    def test_reuse1(self) -> None:
+        """
+        Verify that the filesystem is built once.
+        """
+        s3fs1 = hs3.get_s3fs("__mock__")
+        s3fs2 = hs3.get_s3fs("__mock__")
+        self.assertIs(s3fs1, s3fs2)
+        # A filesystem is returned as it is.
+        self.assertIs(hs3.get_s3fs(s3fs1), s3fs1)
+
+    def test_expiry1(self) -> None:
+        """
+        Verify that temporary credentials are re-read after the TTL.
+        """
+        s3fs1 = hs3.get_s3fs("__mock__")
+        os.environ["MOCK_AWS_SESSION_TOKEN"] = "mock_session_token2"
+        # Before the TTL the cached filesystem is used.
+        self.assertIs(hs3.get_s3fs("__mock__"), s3fs1)
+        # After the TTL the new token is used.
+        now = time.time() + hs3._S3FS_CREDENTIALS_TTL_IN_SECS + 1
+        with umock.patch.object(hs3.time, "time", return_value=now):
+            s3fs2 = hs3.get_s3fs("__mock__")
+        self.assertIsNot(s3fs2, s3fs1)
+        self.assertEqual(s3fs2.token, "mock_session_token2")
+
+    def test_fork1(self) -> None:
+        """
+        Verify that the cache is reset in a child process.
+        """
+        _ = hs3.get_s3fs("__mock__")
+        self.assertEqual(len(hs3._S3FS_CACHE), 1)
+        # Simulate a child process.
+        with umock.patch.object(hs3, "_S3FS_CACHE_PID", -1):
+            with umock.patch.object(
+                hs3, "_build_s3fs", wraps=hs3._build_s3fs
+            ) as build_mock:
+                _ = hs3.get_s3fs("__mock__")
+        self.assertEqual(build_mock.call_count, 1)
+
+    def test_clear1(self) -> None:
+        """
+        Verify that clearing the cache keeps the lock shared by the threads.
+        """
+        _ = hs3.get_s3fs("__mock__")
+        lock = hs3._S3FS_CACHE_LOCK
+        hs3.clear_s3fs_cache()
+        self.assertEqual(len(hs3._S3FS_CACHE), 0)
+        self.assertIs(hs3._S3FS_CACHE_LOCK, lock)
+
+
+# #############################################################################
+# TestParallelGzipWriter1
+# #############################################################################
+
+
+class TestParallelGzipWriter1(hunitest.TestCase):
+
+    def test1(self) -> None:
+        """
+        Check that data compressed in many chunks expands to the original data.
+        """
+        data = b"".join(f"line {i}\n".encode() for i in range(10000))
+        buffer = io.BytesIO()
+        writer = hs3._ParallelGzipWriter(
+            buffer, chunk_size_in_bytes=1000, num_threads=4
+        )
+        # Write in pieces not aligned with the chunks.
+        for i in range(0, len(data), 777):
+            writer.write(data[i : i + 777])
+        writer.close()
+        # Check.
+        compressed = buffer.getvalue()
+        self.assertEqual(gzip.decompress(compressed), data)
+        # There is one gzip member per chunk.
+        num_members = compressed.count(b"\x1f\x8b\x08")
+        self.assertGreaterEqual(num_members, len(data) // 1000)
+
+    def test2(self) -> None:
+        """
+        Check that the output of a tar stream can be expanded with `tar`.
+        """
+        scratch_dir = self.get_scratch_space()
+        src_dir = os.path.join(scratch_dir, "experiment.RH1E")
+        for i in range(5):
+            hio.to_file(os.path.join(src_dir, f"result_{i}.txt"), f"result {i}")
+        tgz_file = os.path.join(scratch_dir, "experiment.tgz")
+        with open(tgz_file, "wb") as f:
+            with hs3._ParallelGzipWriter(
+                f, chunk_size_in_bytes=1024, num_threads=2
+            ) as writer:
+                with tarfile.open(fileobj=writer, mode="w|") as tar:
+                    tar.add(src_dir, arcname="experiment.RH1E")
+        dst_dir = os.path.join(scratch_dir, "dst")
+        hio.create_dir(dst_dir, incremental=False)
+        # Run.
+        actual = hs3.expand_archived_data(tgz_file, dst_dir)
+        # Check.
+        expected = os.path.join(dst_dir, "experiment.RH1E")
+        self.assert_equal(os.path.normpath(actual), expected)
+        txt = hio.from_file(os.path.join(actual, "result_3.txt"))
+        self.assert_equal(txt, "result 3")
+
+    def test3(self) -> None:
+        """
+        Check that the threads are stopped when the writing fails.
+        """
+        buffer = io.BytesIO()
+        with self.assertRaises(RuntimeError):
+            with hs3._ParallelGzipWriter(
+                buffer, chunk_size_in_bytes=10, num_threads=2
+            ) as writer:
+                writer.write(b"x" * 100)
+                raise RuntimeError("tar failed")
+        self.assertIsNone(writer._executor)
+
+
+# #############################################################################
+# TestArchiveDataOnS3
+# #############################################################################
+
+
+@pytest.mark.requires_ck_infra
+@pytest.mark.requires_aws
+@pytest.mark.skipif(
+    not hserver.is_CK_S3_available(),
+    reason="Run only if CK S3 is available",
+)
+class TestArchiveDataOnS3(hmoto.S3Mock_TestCase):
+
+    def test1(self) -> None:
+        """
+        Archive a dir on S3, retrieve it and expand it locally.
+        """
+        src_dir = self._create_src_dir()
+        s3_path = f"s3://{self.bucket_name}/archives"
+        # Run.
+        s3_file_path = hs3.archive_data_on_s3(
+            src_dir,
+            s3_path,
+            self.mock_aws_profile,
+            part_size_in_bytes=hs3._MIN_PART_SIZE_IN_BYTES,
+        )
+        dst_dir = os.path.join(self.get_scratch_space(), "dst")
+        tgz_file = hs3.retrieve_archived_data_from_s3(
+            s3_file_path,
+            dst_dir,
+            aws_profile=self.mock_aws_profile,
+            part_size_in_bytes=1024**2,
+        )
+        actual = hs3.expand_archived_data(tgz_file, dst_dir)
+        # Check.
+        self._check_expanded_dir(actual, dst_dir)
+
+    def test2(self) -> None:
+        """
+        Archive a dir on S3 and expand it while downloading.
+        """
+        src_dir = self._create_src_dir()
+        s3_path = f"s3://{self.bucket_name}/archives"
+        s3_file_path = hs3.archive_data_on_s3(
+            src_dir, s3_path, self.mock_aws_profile
+        )
+        dst_dir = os.path.join(self.get_scratch_space(), "dst")
+        # Run.
+        actual = hs3.expand_archived_data(
+            s3_file_path,
+            dst_dir,
+            aws_profile=self.mock_aws_profile,
+            part_size_in_bytes=1024**2,
+        )
+        # Check.
+        self._check_expanded_dir(actual, dst_dir)
+        # Expanding again is a no-op.
+        actual = hs3.expand_archived_data(
+            s3_file_path, dst_dir, aws_profile=self.mock_aws_profile
+        )
+        self._check_expanded_dir(actual, dst_dir)
+
+    def _create_src_dir(self) -> str:
+        """
+        Create a dir with many small files and a large one.
+        """
+        src_dir = os.path.join(self.get_scratch_space(), "experiment.RH1E")
+        for i in range(20):
+            hio.to_file(os.path.join(src_dir, "logs", f"log_{i}.txt"), f"log {i}")
+        # A file larger than a part to test the multipart upload.
+        with open(os.path.join(src_dir, "data.bin"), "wb") as f:
+            f.write(os.urandom(6 * 1024**2))
+        return src_dir
+
+    def _check_expanded_dir(self, actual: str, dst_dir: str) -> None:
+        expected = os.path.join(dst_dir, "experiment.RH1E")
+        self.assert_equal(os.path.normpath(actual), expected)
+        txt = hio.from_file(os.path.join(actual, "logs", "log_7.txt"))
+        self.assert_equal(txt, "log 7")
+        size = os.path.getsize(os.path.join(actual, "data.bin"))
+        self.assertEqual(size, 6 * 1024**2)
+
+
 # #############################################################################
 # TestGenerateAwsFiles
 # #############################################################################
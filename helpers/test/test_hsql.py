@@ -1,6 +1,26 @@
+import asyncio
+import collections
+import datetime
+import logging
+import struct
+import threading
+import time
+from typing import Any, Generator, List
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import psycopg2.pool as pspool
+import pytest
+
+import helpers.hasyncio as hasynci
 import helpers.hsql as hsql
+import helpers.hsql_implementation as hsqlimpl
+import helpers.hsql_test as hsqltest
 import helpers.hunit_test as hunitest
 
+_LOG = logging.getLogger(__name__)
+
 
 class TestCreateInOperator(hunitest.TestCase):
     def test_create_in_operator1(self) -> None:
@@ -22,3 +42,761 @@ class TestCreateInOperator(hunitest.TestCase):
         actual = hsql.create_in_operator(values, column)
         expected = "exchange_id IN ('ftx')"
         self.assertEqual(actual, expected)
+
+
+# #############################################################################
+
+
+# #############################################################################
+# TestHsqlDbHelper
+# #############################################################################
+
+
+class TestHsqlDbHelper(hsqltest.TestImOmsDbHelper):
+    """
+    Run the tests against a test DB started in a container.
+    """
+
+    @classmethod
+    def get_id(cls) -> int:
+        return hash(cls.__name__) % 10000
+
+    @classmethod
+    def get_connection_info(cls) -> hsql.DbConnectionInfo:
+        connection_info = hsql.get_connection_info_from_env_file(
+            cls._get_db_env_path()
+        )
+        return connection_info
+
+    @classmethod
+    def _get_compose_file(cls) -> str:
+        return f"tmp.hsql.docker-compose.{cls.get_id()}.yml"
+
+    @classmethod
+    def _get_service_name(cls) -> str:
+        return f"hsql_postgres{cls.get_id()}"
+
+    @classmethod
+    def _get_db_env_path(cls) -> str:
+        return f"tmp.hsql.db_config.{cls.get_id()}.env"
+
+    @classmethod
+    def _get_postgres_db(cls) -> str:
+        return "hsql_postgres_db_local"
+
+
+# #############################################################################
+# TestConnectionPool
+# #############################################################################
+
+
+class TestConnectionPool(TestHsqlDbHelper):
+    def get_pool(self, **kwargs: Any) -> hsql.ConnectionPool:
+        self.connections: List[hsql.DbConnection] = []
+        connection_info = self.get_connection_info()
+
+        def _connect() -> hsql.DbConnection:
+            connection = psycopg2.connect(**connection_info._asdict())
+            connection.autocommit = True
+            self.connections.append(connection)
+            return connection
+
+        pool = hsql.ConnectionPool(_connect, **kwargs)
+        return pool
+
+    def test_reuse1(self) -> None:
+        """
+        Check that a returned connection is reused.
+        """
+        with self.get_pool(min_size=1, max_size=2) as pool:
+            self.assertEqual(pool.num_connections, 1)
+            with pool.connection() as connection1:
+                pass
+            with pool.connection() as connection2:
+                pass
+            self.assertIs(connection1, connection2)
+            self.assertEqual(len(self.connections), 1)
+        # Closing the pool closes the connections.
+        self.assertTrue(connection1.closed)
+
+    def test_max_size1(self) -> None:
+        """
+        Check that a checkout waits for a connection to be returned.
+        """
+        pool = self.get_pool(min_size=0, max_size=1)
+        connection = pool.get_connection()
+        # No connection is available.
+        with self.assertRaises(pspool.PoolError):
+            pool.get_connection(timeout_in_secs=0.01)
+        # A connection is returned by another thread.
+        thread = threading.Timer(0.05, pool.put_connection, [connection])
+        thread.start()
+        self.assertIs(pool.get_connection(timeout_in_secs=5), connection)
+        thread.join()
+        self.assertEqual(pool.num_connections, 1)
+        pool.close()
+
+    def test_health_check1(self) -> None:
+        """
+        Check that a connection dropped by the server is replaced on
+        checkout.
+        """
+        pool = self.get_pool(min_size=1, max_size=1)
+        backend_pid = self.connections[0].info.backend_pid
+        hsql.execute_query(
+            self.connection, f"SELECT pg_terminate_backend({backend_pid})"
+        )
+        with pool.connection() as connection:
+            self.assertIs(connection, self.connections[1])
+        self.assertTrue(self.connections[0].closed)
+        self.assertEqual(pool.num_connections, 1)
+        pool.close()
+
+    def test_idle_timeout1(self) -> None:
+        """
+        Check that connections idle for too long are closed down to
+        `min_size`.
+        """
+        pool = self.get_pool(min_size=1, max_size=3, idle_timeout_in_secs=0.05)
+        connections = [pool.get_connection() for _ in range(3)]
+        for connection in connections:
+            pool.put_connection(connection)
+        self.assertEqual(pool.num_connections, 3)
+        time.sleep(0.1)
+        # Run.
+        with pool.connection():
+            pass
+        # Check.
+        self.assertEqual(pool.num_connections, 1)
+        self.assertEqual([c.closed for c in connections], [1, 1, 0])
+        pool.close()
+
+    def test_threads1(self) -> None:
+        """
+        Check that concurrent checkouts never exceed `max_size`.
+        """
+        pool = self.get_pool(min_size=0, max_size=3)
+        num_checked_out = [0]
+        max_checked_out = [0]
+        lock = threading.Lock()
+
+        def _worker() -> None:
+            for _ in range(50):
+                with pool.connection():
+                    with lock:
+                        num_checked_out[0] += 1
+                        max_checked_out[0] = max(
+                            max_checked_out[0], num_checked_out[0]
+                        )
+                    time.sleep(0.0001)
+                    with lock:
+                        num_checked_out[0] -= 1
+
+        threads = [threading.Thread(target=_worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(max_checked_out[0], 3)
+        self.assertLessEqual(len(self.connections), 3)
+        pool.close()
+
+    def test_reset1(self) -> None:
+        """
+        Check that the session state of a returned connection is reset.
+        """
+        query = "SHOW application_name"
+        pool = self.get_pool(min_size=1, max_size=1)
+        with pool.connection() as connection:
+            expected = hsql.execute_query(connection, query)
+            hsql.execute_query(connection, "SET application_name = 'test'")
+            connection.autocommit = False
+            connection.readonly = True
+            with connection.cursor() as cursor:
+                # Leave a transaction open.
+                cursor.execute("SELECT 1")
+        # Run.
+        with pool.connection() as connection:
+            # Check.
+            self.assertIs(connection, self.connections[0])
+            self.assertTrue(connection.autocommit)
+            self.assertIsNone(connection.readonly)
+            actual = hsql.execute_query(connection, query)
+            self.assertEqual(actual, expected)
+        pool.close()
+
+    def test_get_connection1(self) -> None:
+        """
+        Check that closing a connection from the shared pool returns it to
+        the pool.
+        """
+        connection_info = self.get_connection_info()
+        connection1 = hsql.get_connection(*connection_info, use_pool=True)
+        connection1.close()
+        connection2 = hsql.get_connection(*connection_info, use_pool=True)
+        self.assertIs(connection2, connection1)
+        self.assertFalse(connection2.closed)
+        connection2.close()
+        hsql.close_connection_pools()
+        self.assertTrue(connection1.closed)
+
+
+# #############################################################################
+
+
+class Test_encode_binary_copy_rows(hunitest.TestCase):
+    def test1(self) -> None:
+        """
+        Check the encoding of rows with fixed-size values and no nulls.
+        """
+        df = pd.DataFrame(
+            {
+                "id": [1, 2],
+                "price": [0.5, 1.5],
+                "timestamp": pd.to_datetime(
+                    ["2000-01-01 00:00:01", "1999-12-31 00:00:00"]
+                ).tz_localize("UTC"),
+            }
+        )
+        # Run.
+        pg_types = ["int4", "float8", "timestamptz"]
+        actual = hsqlimpl._encode_binary_copy_rows(df, pg_types)
+        # Check.
+        expected = struct.pack(
+            ">hiiidiq", 3, 4, 1, 8, 0.5, 8, 1_000_000
+        ) + struct.pack(">hiiidiq", 3, 4, 2, 8, 1.5, 8, -86_400_000_000)
+        self.assertEqual(actual, expected)
+
+    def test2(self) -> None:
+        """
+        Check the encoding of rows with nulls and text.
+        """
+        df = pd.DataFrame(
+            {
+                "id": [1, None],
+                "name": ["é", None],
+                "is_buy": [None, True],
+            }
+        )
+        # Run.
+        actual = hsqlimpl._encode_binary_copy_rows(df, ["int8", "text", "bool"])
+        # Check.
+        expected = (
+            struct.pack(">hiqi", 3, 8, 1, 2)
+            + "é".encode()
+            + struct.pack(">i", -1)
+            + struct.pack(">hiii", 3, -1, -1, 1)
+            + b"\x01"
+        )
+        self.assertEqual(actual, expected)
+
+    def test3(self) -> None:
+        """
+        Check that an unsupported type is reported.
+        """
+        df = pd.DataFrame({"price": [1.5]})
+        with self.assertRaises(ValueError):
+            hsqlimpl._encode_binary_copy_rows(df, ["numeric"])
+
+    def test4(self) -> None:
+        """
+        Check that values that would be truncated in int columns are
+        reported.
+        """
+        df = pd.DataFrame({"volume": [1.0, np.nan, 2.0]})
+        actual = hsqlimpl._encode_binary_copy_rows(df, ["int4"])
+        self.assertEqual(len(actual), 3 * (2 + 4) + 2 * 4)
+        #
+        df = pd.DataFrame({"volume": [1.0, 2.5]})
+        with self.assertRaises(ValueError):
+            hsqlimpl._encode_binary_copy_rows(df, ["int4"])
+        df = pd.DataFrame({"volume": [2**40]})
+        with self.assertRaises(ValueError):
+            hsqlimpl._encode_binary_copy_rows(df, ["int4"])
+
+
+class Test_copy_rows_with_binary_copy(TestHsqlDbHelper):
+    table_name = "tmp_binary_copy"
+
+    # This will be run before and after each test.
+    @pytest.fixture(autouse=True)
+    def setup_teardown_test(self) -> Generator:
+        # Run before each test.
+        self.set_up_test()
+        yield
+        # Run after each test.
+        self.tear_down_test()
+
+    def set_up_test(self) -> None:
+        hsql.remove_table(self.connection, self.table_name)
+        hsql.execute_query(
+            self.connection,
+            f"CREATE TABLE {self.table_name} (id int8 PRIMARY KEY, "
+            "timestamp timestamptz, asset text, price float8, volume int4)",
+        )
+
+    def tear_down_test(self) -> None:
+        hsql.remove_table(self.connection, self.table_name)
+
+    def get_rows(self) -> List[tuple]:
+        query = (
+            f"SELECT id, timestamp, asset, price, volume FROM {self.table_name}"
+            " ORDER BY id"
+        )
+        rows = hsql.execute_query(self.connection, query)
+        return rows
+
+    def test1(self) -> None:
+        """
+        Check that the copied rows are read back with the same values.
+        """
+        df = pd.DataFrame(
+            {
+                "id": [1, 2, 3],
+                "timestamp": pd.to_datetime(
+                    ["2022-01-01 00:00:01", None, "1999-12-31 00:00:00"],
+                    utc=True,
+                ),
+                "asset": ["BTC", None, "é"],
+                "price": [0.5, np.nan, 1.5],
+                "volume": [1.0, 2.0, np.nan],
+            }
+        )
+        # Run with chunks smaller than the df.
+        hsql.copy_rows_with_binary_copy(
+            self.connection, df, self.table_name, chunk_size_in_rows=2
+        )
+        # Check.
+        utc = datetime.timezone.utc
+        timestamp1 = datetime.datetime(2022, 1, 1, 0, 0, 1, tzinfo=utc)
+        timestamp3 = datetime.datetime(1999, 12, 31, tzinfo=utc)
+        expected = [
+            (1, timestamp1, "BTC", 0.5, 1),
+            (2, None, None, None, 2),
+            (3, timestamp3, "é", 1.5, None),
+        ]
+        self.assertEqual(self.get_rows(), expected)
+
+    def test2(self) -> None:
+        """
+        Check that rows are upserted through the staging table.
+        """
+        df = pd.DataFrame(
+            {"id": [1, 2], "asset": ["BTC", "ETH"], "volume": [1, 2]}
+        )
+        hsql.copy_rows_with_binary_copy(self.connection, df, self.table_name)
+        # Run.
+        df = pd.DataFrame(
+            {"id": [2, 3], "asset": ["ETH2", "SOL"], "volume": [20, 30]}
+        )
+        hsql.copy_rows_with_binary_copy(
+            self.connection, df, self.table_name, unique_columns=["id"]
+        )
+        df = pd.DataFrame({"id": [1], "asset": ["BTC2"], "volume": [10]})
+        hsql.copy_rows_with_binary_copy(
+            self.connection,
+            df,
+            self.table_name,
+            unique_columns=["id"],
+            update_on_conflict=False,
+        )
+        # Check.
+        expected = [
+            (1, None, "BTC", None, 1),
+            (2, None, "ETH2", None, 20),
+            (3, None, "SOL", None, 30),
+        ]
+        self.assertEqual(self.get_rows(), expected)
+
+    def test3(self) -> None:
+        """
+        Check that a failed upsert leaves the table unchanged.
+        """
+        df = pd.DataFrame({"id": [1, 2], "volume": [1.0, 2.5]})
+        with self.assertRaises(ValueError):
+            hsql.copy_rows_with_binary_copy(
+                self.connection, df, self.table_name, unique_columns=["id"]
+            )
+        # Check.
+        self.assertEqual(self.get_rows(), [])
+        # The staging table was dropped.
+        df = pd.DataFrame({"id": [1], "volume": [1]})
+        hsql.copy_rows_with_binary_copy(
+            self.connection, df, self.table_name, unique_columns=["id"]
+        )
+        self.assertEqual(self.get_rows(), [(1, None, None, None, 1)])
+
+
+# #############################################################################
+
+
+# Stand-in for the columns of `cursor.description`.
+_Column = collections.namedtuple("_Column", ["name", "type_code"])
+
+
+class Test_rows_to_df(hunitest.TestCase):
+    def test1(self) -> None:
+        """
+        Check that the dtypes depend only on the column types.
+        """
+        description = [
+            _Column("id", 20),
+            _Column("timestamp", 1184),
+            _Column("price", 701),
+            _Column("is_buy", 16),
+            _Column("name", 25),
+        ]
+        utc = datetime.timezone.utc
+        timestamp = datetime.datetime(2022, 1, 1, tzinfo=utc)
+        chunk1 = [(1, timestamp, 1.5, True, "a")]
+        chunk2 = [(None, None, None, None, None)]
+        # Run.
+        dtypes = [
+            hsqlimpl._rows_to_df(rows, description).dtypes.to_dict()
+            for rows in (chunk1, chunk2, [])
+        ]
+        # Check.
+        expected = {
+            "id": pd.Int64Dtype(),
+            "timestamp": pd.DatetimeTZDtype(tz="UTC"),
+            "price": np.dtype("float64"),
+            "is_buy": pd.BooleanDtype(),
+            "name": np.dtype("O"),
+        }
+        self.assertEqual(dtypes, [expected] * 3)
+
+
+class Test_execute_query_to_df_chunks(TestHsqlDbHelper):
+    table_name = "tmp_export"
+
+    # This will be run before and after each test.
+    @pytest.fixture(autouse=True)
+    def setup_teardown_test(self) -> Generator:
+        # Run before each test.
+        self.set_up_test()
+        yield
+        # Run after each test.
+        self.tear_down_test()
+
+    def set_up_test(self) -> None:
+        hsql.remove_table(self.connection, self.table_name)
+        hsql.execute_query(
+            self.connection,
+            f"CREATE TABLE {self.table_name} (id int8 PRIMARY KEY, "
+            f"asset text, price float8); INSERT INTO {self.table_name} VALUES"
+            " (1, 'BTC', 1.5), (2, 'ETH', NULL), (3, 'BTC2', 2.5),"
+            " (4, 'BTC', 3.5), (5, 'SOL', 4.5)",
+        )
+
+    def tear_down_test(self) -> None:
+        hsql.remove_table(self.connection, self.table_name)
+
+    def test1(self) -> None:
+        """
+        Check that the chunks make up the result of the query.
+        """
+        query = f"SELECT * FROM {self.table_name} ORDER BY id"
+        # Run.
+        dfs = list(
+            hsql.execute_query_to_df_chunks(
+                self.connection, query, chunk_size_in_rows=2
+            )
+        )
+        # Check.
+        self.assertEqual([len(df) for df in dfs], [2, 2, 1])
+        df = pd.concat(dfs, ignore_index=True)
+        self.assertEqual(df["id"].tolist(), [1, 2, 3, 4, 5])
+        self.assertEqual(df["price"].isna().sum(), 1)
+        self.assertTrue(self.connection.autocommit)
+
+    def test2(self) -> None:
+        """
+        Check that the pages are ordered by key and that `%` is interpreted in
+        the same way on all the pages.
+        """
+        query = (
+            f"SELECT *, 'a%%' AS tag FROM {self.table_name}"
+            " WHERE asset LIKE 'BTC%%'"
+        )
+        # Run.
+        dfs = list(
+            hsql.execute_query_to_df_with_keyset_pagination(
+                self.connection, query, ["asset", "id"], page_size_in_rows=1
+            )
+        )
+        # Check.
+        actual = [df[["asset", "id", "tag"]].values.tolist() for df in dfs]
+        expected = [
+            [["BTC", 1, "a%"]],
+            [["BTC", 4, "a%"]],
+            [["BTC2", 3, "a%"]],
+        ]
+        self.assertEqual(actual, expected)
+
+
+# #############################################################################
+
+
+class Test_df_to_insert_values(hunitest.TestCase):
+    def test1(self) -> None:
+        """
+        Check that values are converted to Python objects and missing values
+        to `None`.
+        """
+        df = pd.DataFrame(
+            {
+                "timestamp": pd.to_datetime(["2022-01-01", None], utc=True),
+                "asset": ["BTC", None],
+                "price": [1.5, np.nan],
+                "volume": [1, 2],
+                "is_buy": [True, False],
+            }
+        )
+        # Run.
+        actual = hsqlimpl._df_to_insert_values(df)
+        # Check.
+        timestamp = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc)
+        expected = [
+            (timestamp, "BTC", 1.5, 1, True),
+            (None, None, None, 2, False),
+        ]
+        self.assertEqual(actual, expected)
+        self.assertEqual(
+            [type(value) for value in actual[0]],
+            [datetime.datetime, str, float, int, bool],
+        )
+
+
+class Test_get_insert_page_size(hunitest.TestCase):
+    def test1(self) -> None:
+        """
+        Check that small inserts use a single statement.
+        """
+        self.assertEqual(hsqlimpl._get_insert_page_size(10, 7), 10)
+
+    def test2(self) -> None:
+        """
+        Check that large inserts are split in pages of the same size.
+        """
+        actual = hsqlimpl._get_insert_page_size(100_000, 10)
+        self.assertEqual(actual, 5_000)
+        actual = hsqlimpl._get_insert_page_size(10_001, 10)
+        self.assertEqual(actual, 3_334)
+
+
+class Test_dassert_table_exists(TestHsqlDbHelper):
+    def test1(self) -> None:
+        """
+        Check that the table names are cached and refreshed when a table is
+        missing or the cache is invalidated.
+        """
+        connection = self.connection
+        for table_name in ["tmp_table1", "tmp_table2"]:
+            hsql.remove_table(connection, table_name)
+        hsql.invalidate_table_metadata_cache(connection)
+        hsql.execute_query(connection, "CREATE TABLE tmp_table1 (v int)")
+        hsqlimpl._dassert_table_exists(connection, "tmp_table1")
+        # A table dropped without `hsql` is still in the cached names.
+        hsql.execute_query(connection, "DROP TABLE tmp_table1")
+        hsqlimpl._dassert_table_exists(connection, "tmp_table1")
+        # A new table is found by querying again, which refreshes all the
+        # names.
+        hsql.execute_query(connection, "CREATE TABLE tmp_table2 (v int)")
+        hsqlimpl._dassert_table_exists(connection, "tmp_table2")
+        with self.assertRaises(AssertionError):
+            hsqlimpl._dassert_table_exists(connection, "tmp_table1")
+        # Invalidate.
+        hsql.execute_query(connection, "DROP TABLE tmp_table2")
+        hsqlimpl._dassert_table_exists(connection, "tmp_table2")
+        hsql.invalidate_table_metadata_cache(connection)
+        with self.assertRaises(AssertionError):
+            hsqlimpl._dassert_table_exists(connection, "tmp_table2")
+
+
+# #############################################################################
+
+
+class Test_wait_for_change_in_number_of_rows(TestHsqlDbHelper):
+    def helper(
+        self, connection: hsql.DbConnection, sleep_in_secs: float
+    ) -> None:
+        """
+        Insert a row from another connection and wait for it.
+        """
+        writer_connection = hsql.get_connection(*self.get_connection_info())
+        poll_kwargs = hasynci.get_poll_kwargs(
+            time.time, sleep_in_secs=sleep_in_secs, timeout_in_secs=10.0
+        )
+
+        def _insert_row() -> None:
+            time.sleep(0.2)
+            hsql.execute_query(
+                writer_connection, "INSERT INTO tmp_wait_table (v) VALUES (1)"
+            )
+
+        thread = threading.Thread(target=_insert_row)
+        thread.start()
+        try:
+            coroutine = hsql.wait_for_change_in_number_of_rows(
+                time.time, connection, "tmp_wait_table", poll_kwargs
+            )
+            # Run.
+            actual = asyncio.run(coroutine)
+        finally:
+            thread.join()
+            writer_connection.close()
+        # Check.
+        self.assertEqual(actual, 1)
+
+    def set_up_table(self, has_trigger: bool) -> None:
+        hsql.remove_table(self.connection, "tmp_wait_table")
+        hsql.execute_query(
+            self.connection, "CREATE TABLE tmp_wait_table (v int)"
+        )
+        hsql.invalidate_table_metadata_cache(self.connection)
+        if has_trigger:
+            hsql.create_notification_trigger(self.connection, "tmp_wait_table")
+
+    def test1(self) -> None:
+        """
+        Check that a table without the trigger is polled.
+        """
+        self.set_up_table(has_trigger=False)
+        self.helper(self.connection, sleep_in_secs=0.05)
+        hsql.remove_table(self.connection, "tmp_wait_table")
+
+    def test2(self) -> None:
+        """
+        Check that a connection outside the autocommit mode polls, since it
+        receives the notifications only after a transaction.
+        """
+        self.set_up_table(has_trigger=True)
+        connection = hsql.get_connection(
+            *self.get_connection_info(), autocommit=False
+        )
+        try:
+            self.helper(connection, sleep_in_secs=0.05)
+        finally:
+            connection.close()
+        hsql.remove_table(self.connection, "tmp_wait_table")
+
+    def test3(self) -> None:
+        """
+        Check that a table with the trigger is waited for through the
+        notifications, with a polling period longer than the timeout.
+        """
+        self.set_up_table(has_trigger=True)
+        self.helper(self.connection, sleep_in_secs=100.0)
+        hsql.remove_table(self.connection, "tmp_wait_table")
+
+    def test4(self) -> None:
+        """
+        Check that the channel name doesn't depend on the case of the table
+        name.
+        """
+        actual = hsql.get_notification_channel("Tmp_Wait_Table")
+        self.assertEqual(actual, "tmp_wait_table_changes")
+
+    def test5(self) -> None:
+        """
+        Check the trigger of a table qualified by the schema.
+        """
+        self.set_up_table(has_trigger=False)
+        table_name = "public.tmp_wait_table"
+        hsql.create_notification_trigger(self.connection, table_name)
+        self.assertTrue(
+            hsql.has_notification_trigger(self.connection, table_name)
+        )
+        hsql.remove_notification_trigger(self.connection, table_name)
+        self.assertFalse(
+            hsql.has_notification_trigger(self.connection, table_name)
+        )
+        hsql.remove_table(self.connection, "tmp_wait_table")
+
+
+# #############################################################################
+
+
+class Test_create_index_if_not_exists(TestHsqlDbHelper):
+    def set_up_table(self) -> None:
+        """
+        Create a table with an index on `a, b, id`.
+        """
+        hsql.remove_table(self.connection, "tmp_index_table")
+        hsql.execute_query(
+            self.connection,
+            "CREATE TABLE tmp_index_table (id int, a int, b int);"
+            " CREATE INDEX tmp_index_table_a_b_id_idx"
+            " ON tmp_index_table (a, b, id)",
+        )
+        hsql.invalidate_table_metadata_cache(self.connection)
+
+    def get_index_column_names(self) -> List[List[str]]:
+        actual = hsql.get_index_column_names(self.connection, "tmp_index_table")
+        actual = sorted(actual)
+        hsql.remove_table(self.connection, "tmp_index_table")
+        return actual
+
+    def test1(self) -> None:
+        """
+        Check that no index is created when an index starts with the columns.
+        """
+        self.set_up_table()
+        actual = hsql.create_index_if_not_exists(
+            self.connection, "tmp_index_table", ["a", "b"]
+        )
+        self.assertIsNone(actual)
+        self.assertEqual(self.get_index_column_names(), [["a", "b", "id"]])
+
+    def test2(self) -> None:
+        """
+        Check that an index is created when no index starts with the columns.
+        """
+        self.set_up_table()
+        actual = hsql.create_index_if_not_exists(
+            self.connection, "tmp_index_table", ["b", "a"]
+        )
+        self.assertEqual(actual, "tmp_index_table_b_a_idx")
+        self.assertEqual(
+            self.get_index_column_names(), [["a", "b", "id"], ["b", "a"]]
+        )
+
+
+class Test_remove_duplicates(TestHsqlDbHelper):
+    def test1(self) -> None:
+        """
+        Check that the result is the same as with the self-join query.
+        """
+        connection = self.connection
+        rows = (
+            "(1, 'a', 1), (2, 'b', 1), (3, 'a', 1), (4, NULL, 2), (5, NULL, 2),"
+            " (6, 'a', 2), (7, 'a', 1), (8, 'b', 1), (9, 'c', 3)"
+        )
+        ids = []
+        for table_name in ["tmp_dedup_old", "tmp_dedup_new"]:
+            hsql.remove_table(connection, table_name)
+            hsql.execute_query(
+                connection,
+                f"CREATE TABLE {table_name} (id int, asset text, v int);"
+                f" INSERT INTO {table_name} VALUES {rows}",
+            )
+        query = hsql.get_remove_duplicates_query(
+            "tmp_dedup_old", "id", ["asset", "v"]
+        )
+        hsql.execute_query(connection, query)
+        # Use batches smaller than the number of duplicates.
+        num_removed_rows = hsql.remove_duplicates(
+            connection,
+            "tmp_dedup_new",
+            "id",
+            ["asset", "v"],
+            batch_size_in_rows=2,
+        )
+        for table_name in ["tmp_dedup_old", "tmp_dedup_new"]:
+            query = f"SELECT id FROM {table_name} ORDER BY id"
+            ids.append([id_ for (id_,) in hsql.execute_query(connection, query)])
+            hsql.remove_table(connection, table_name)
+        # Check.
+        self.assertEqual(num_removed_rows, 3)
+        self.assertEqual(ids[1], [4, 5, 6, 7, 8, 9])
+        self.assertEqual(ids[1], ids[0])